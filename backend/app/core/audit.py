@@ -0,0 +1,450 @@
+"""
+ClosedPaw - Audit Log Storage
+Tamper-evident, id-indexed audit log with bounded memory and spill to disk
+"""
+
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_AUDIT_DIR = Path.home() / ".local" / "share" / "closedpaw" / "audit"
+
+GENESIS_HASH = "0" * 64
+
+
+def entry_hash(entry: Dict) -> str:
+    """Chain hash of an entry: SHA-256 over its canonical JSON, minus ``hash``"""
+    body = {k: v for k, v in entry.items() if k != "hash"}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def merkle_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    """All levels of a Merkle tree, leaves first; an odd last node is promoted"""
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def merkle_proof(levels: List[List[bytes]], index: int) -> List[Tuple[bytes, bool]]:
+    """Sibling hashes from leaf ``index`` to the root; flag is True for a left sibling"""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append((level[sibling], sibling < index))
+        index //= 2
+    return proof
+
+
+def merkle_root_from_proof(leaf: bytes, proof: List[Tuple[bytes, bool]]) -> bytes:
+    node = leaf
+    for sibling, is_left in proof:
+        node = _node(sibling, node) if is_left else _node(node, sibling)
+    return node
+
+
+@dataclass
+class AuditCheckpoint:
+    """Merkle root over one block of entries, chained to the previous checkpoint"""
+    block: int
+    first_seq: int
+    root: str
+    prev_hash: str
+    hash: str = ""
+
+    def compute_hash(self) -> str:
+        return hashlib.sha256(
+            f"{self.block}:{self.first_seq}:{self.root}:{self.prev_hash}".encode()
+        ).hexdigest()
+
+
+@dataclass
+class ChainVerification:
+    """Result of verifying the audit chain"""
+    valid: bool
+    entries_checked: int
+    checkpoints_checked: int = 0
+    first_invalid_seq: Optional[int] = None
+    reason: Optional[str] = None
+
+
+class AuditLogStore:
+    """
+    Append-only, hash-chained audit log with O(1) lookup by id
+
+    Each entry gets a sequence number, the previous entry's hash and its
+    own hash. Every ``checkpoint_interval`` entries the block's hashes
+    are sealed into a Merkle root, and checkpoints are chained to each
+    other. A single entry verifies against its checkpoint with a
+    log2(``checkpoint_interval``) proof; ``verify_all`` re-walks the
+    whole chain in one streaming pass.
+
+    The newest ``max_entries`` entries are kept in memory. When
+    ``spill_path`` is configured every entry is also appended to it (JSON
+    lines) as it is chained, so a crash loses nothing, and older entries
+    are read back by file offset; without a spill file they are dropped
+    and counted in ``dropped``. Leaf hashes (32 bytes per entry) and
+    checkpoints are always kept, and checkpoints are also appended to
+    ``<spill_path>.checkpoints``.
+
+    Spilled records that cannot be read back after a restart keep their
+    sequence number: they are listed in ``gaps`` and get an all-zero
+    leaf, so the chain visibly breaks at that point instead of every
+    later entry shifting onto the wrong leaf. Entries sealed in the same
+    block as a gap can no longer be proven against their checkpoint.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        spill_path: Optional[str] = None,
+        checkpoint_interval: int = 256
+    ):
+        self.max_entries = max_entries
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.checkpoint_interval = checkpoint_interval
+        self.dropped = 0
+        self.gaps: List[int] = []
+        self.checkpoints: List[AuditCheckpoint] = []
+        self._recent: "OrderedDict[str, Dict]" = OrderedDict()
+        # id -> (offset, length) of every entry in the spill file
+        self._spilled: Dict[str, Tuple[int, int]] = {}
+        self._spill_end = 0
+        # Digest of entry ``seq`` lives at [32 * seq, 32 * seq + 32)
+        self._leaves = bytearray()
+        self._head = GENESIS_HASH
+        self._trees: "OrderedDict[int, List[List[bytes]]]" = OrderedDict()
+        self._spill_file = None
+        self._lock = threading.Lock()
+
+        if self.spill_path:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            self._load_spill()
+
+    @property
+    def _checkpoint_path(self) -> Path:
+        return self.spill_path.with_name(self.spill_path.name + ".checkpoints")
+
+    def _load_spill(self):
+        """Rebuild the id index and chain state from an earlier run"""
+        if self._checkpoint_path.exists():
+            with open(self._checkpoint_path) as f:
+                self.checkpoints = [AuditCheckpoint(**json.loads(line)) for line in f if line.strip()]
+        if not self.spill_path.exists():
+            return
+        offset = 0
+        line = b"\n"
+        with open(self.spill_path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    seq, digest = entry["seq"], bytes.fromhex(entry["hash"])
+                    if len(digest) != 32 or seq < self.next_seq:
+                        raise ValueError(f"bad hash or sequence {seq}")
+                except (ValueError, KeyError, TypeError) as e:
+                    logger.error(
+                        f"Unreadable audit record at offset {offset} ({e}); "
+                        f"recording seq {self.next_seq} as a gap"
+                    )
+                    self._record_gap()
+                else:
+                    while self.next_seq < seq:
+                        logger.error(f"Audit record seq {self.next_seq} missing from spill file")
+                        self._record_gap()
+                    self._spilled[entry["id"]] = (offset, len(line))
+                    self._leaves += digest
+                    self._head = entry["hash"]
+                offset += len(line)
+        if not line.endswith(b"\n"):
+            # Torn final write: terminate it so new records start on their own line
+            with open(self.spill_path, "ab") as f:
+                f.write(b"\n")
+            offset += 1
+        self._spill_end = offset
+
+        sealed = self.next_seq // self.checkpoint_interval
+        if len(self.checkpoints) > sealed:
+            # Entries that were only in memory when the process died are gone
+            logger.warning(f"Discarding {len(self.checkpoints) - sealed} audit checkpoints without entries")
+            self.checkpoints = self.checkpoints[:sealed]
+            with open(self._checkpoint_path, "w") as f:
+                f.writelines(json.dumps(asdict(c)) + "\n" for c in self.checkpoints)
+
+    def _record_gap(self):
+        self.gaps.append(self.next_seq)
+        self._leaves += bytes(32)
+        self._head = bytes(32).hex()
+
+    @property
+    def next_seq(self) -> int:
+        return len(self._leaves) // 32
+
+    def append(self, entry: Dict) -> str:
+        """
+        Add an entry to the chain
+
+        Args:
+            entry: Audit data; an ``id`` is assigned if missing
+
+        Returns:
+            Entry id
+        """
+        entry = dict(entry)
+        log_id = entry.setdefault("id", str(uuid.uuid4()))
+        with self._lock:
+            entry["seq"] = self.next_seq
+            entry["prev_hash"] = self._head
+            entry["hash"] = self._head = entry_hash(entry)
+            self._leaves += bytes.fromhex(entry["hash"])
+            if self.next_seq % self.checkpoint_interval == 0:
+                self._seal_block(self.next_seq // self.checkpoint_interval - 1)
+
+            self._recent[log_id] = entry
+            self._spill(log_id, entry)
+            if len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+                if self.spill_path is None:
+                    self.dropped += 1
+        return log_id
+
+    def _seal_block(self, block: int):
+        checkpoint = AuditCheckpoint(
+            block=block,
+            first_seq=block * self.checkpoint_interval,
+            root=self._block_tree(block)[-1][0].hex(),
+            prev_hash=self.checkpoints[-1].hash if self.checkpoints else GENESIS_HASH
+        )
+        checkpoint.hash = checkpoint.compute_hash()
+        self.checkpoints.append(checkpoint)
+        if self.spill_path:
+            with open(self._checkpoint_path, "a") as f:
+                f.write(json.dumps(asdict(checkpoint)) + "\n")
+        logger.info(f"AUDIT CHECKPOINT: block {block} | root {checkpoint.root} | {checkpoint.hash}")
+
+    def _leaf(self, seq: int) -> bytes:
+        return bytes(self._leaves[32 * seq:32 * seq + 32])
+
+    def _block_tree(self, block: int) -> List[List[bytes]]:
+        """Merkle levels of a block, rebuilt from leaf hashes on a cache miss"""
+        tree = self._trees.get(block)
+        if tree is None:
+            first = block * self.checkpoint_interval
+            tree = merkle_levels([self._leaf(seq) for seq in range(first, first + self.checkpoint_interval)])
+            self._trees[block] = tree
+            if len(self._trees) > 16:
+                self._trees.popitem(last=False)
+        return tree
+
+    def _spill(self, log_id: str, entry: Dict):
+        if self.spill_path is None:
+            return
+        if self._spill_file is None:
+            self._spill_file = open(self.spill_path, "ab")
+        line = (json.dumps(entry, default=str) + "\n").encode()
+        self._spill_file.write(line)
+        self._spill_file.flush()
+        self._spilled[log_id] = (self._spill_end, len(line))
+        self._spill_end += len(line)
+
+    def close(self):
+        """Close the spill file"""
+        with self._lock:
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+    def get(self, log_id: str) -> Optional[Dict]:
+        """Look up an entry by id, in memory or on disk"""
+        entry = self._recent.get(log_id)
+        if entry is not None:
+            return entry
+        location = self._spilled.get(log_id)
+        if location is None:
+            return None
+        offset, length = location
+        with open(self.spill_path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.read(length))
+
+    def __contains__(self, log_id: str) -> bool:
+        return log_id in self._recent or log_id in self._spilled
+
+    def __len__(self) -> int:
+        return len(self._spilled) if self.spill_path else len(self._recent)
+
+    def __iter__(self) -> Iterator[Dict]:
+        """All retained entries, oldest first, as of the call"""
+        with self._lock:
+            spill_end, recent = self._snapshot()
+        return self._iter_entries(spill_end, recent)
+
+    def _snapshot(self) -> Tuple[int, List[Dict]]:
+        """
+        Where the on-disk part of the log ends and a copy of the in-memory
+        part; call with ``_lock`` held
+        """
+        recent = list(self._recent.values())
+        spill_end = self._spill_end
+        if recent and self.spill_path:
+            # Entries still in memory are read from there
+            spill_end = self._spilled[next(iter(self._recent))][0]
+        return spill_end, recent
+
+    def _iter_entries(self, spill_end: int, recent: List[Dict]) -> Iterator[Dict]:
+        if spill_end:
+            with open(self.spill_path, "rb") as f:
+                while f.tell() < spill_end:
+                    line = f.readline()
+                    if not line:
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Recorded in ``gaps``; verification reports the hole
+                        continue
+                    yield entry
+        yield from recent
+
+    def recent(self, limit: int = 100) -> List[Dict]:
+        """Newest entries first"""
+        entries = []
+        for entry in reversed(self._recent.values()):
+            if len(entries) >= limit:
+                break
+            entries.append(entry)
+        return entries
+
+    # ============================================
+    # Verification
+    # ============================================
+
+    def verify_entry(self, log_id: str) -> bool:
+        """
+        Check one entry against the chain
+
+        The entry's recomputed hash must link to its predecessor and, once
+        its block is sealed, reproduce the checkpoint root through a Merkle
+        proof. Entries in the open block are checked against their leaf.
+        """
+        entry = self.get(log_id)
+        if entry is None:
+            return False
+        try:
+            seq = entry["seq"]
+            digest = entry_hash(entry)
+        except KeyError:
+            return False
+
+        if digest != entry.get("hash") or seq >= self.next_seq:
+            return False
+        expected_prev = self._leaf(seq - 1).hex() if seq > 0 else GENESIS_HASH
+        if entry.get("prev_hash") != expected_prev:
+            return False
+
+        block, index = divmod(seq, self.checkpoint_interval)
+        if block >= len(self.checkpoints):
+            return self._leaf(seq) == bytes.fromhex(digest)
+
+        checkpoint = self.checkpoints[block]
+        if checkpoint.hash != checkpoint.compute_hash():
+            return False
+        if block > 0 and checkpoint.prev_hash != self.checkpoints[block - 1].hash:
+            return False
+        proof = merkle_proof(self._block_tree(block), index)
+        return merkle_root_from_proof(bytes.fromhex(digest), proof).hex() == checkpoint.root
+
+    def verify_all(self) -> ChainVerification:
+        """
+        Re-walk every retained entry and checkpoint in one streaming pass
+
+        The log is verified as of the call; entries appended meanwhile are
+        left for the next pass.
+        """
+        with self._lock:
+            spill_end, recent = self._snapshot()
+            head = self._head
+            checkpoints = list(self.checkpoints)
+        checked = 0
+        checkpoints_checked = 0
+        prev_hash = None
+        expected_seq = None
+        block_leaves: List[bytes] = []
+
+        def fail(seq, reason):
+            return ChainVerification(False, checked, checkpoints_checked, seq, reason)
+
+        for entry in self._iter_entries(spill_end, recent):
+            seq = entry.get("seq")
+            digest = entry_hash(entry)
+            if digest != entry.get("hash"):
+                return fail(seq, "entry hash mismatch")
+            if expected_seq is not None and seq != expected_seq:
+                return fail(expected_seq, "sequence gap")
+            if prev_hash is None:
+                # First retained entry links to the in-memory leaf before it
+                expected_prev = self._leaf(seq - 1).hex() if seq else GENESIS_HASH
+            else:
+                expected_prev = prev_hash
+            if entry.get("prev_hash") != expected_prev:
+                return fail(seq, "broken chain link")
+
+            # Blocks whose start was dropped cannot be re-rooted
+            if seq % self.checkpoint_interval == 0:
+                block_leaves = []
+            if prev_hash is not None or seq % self.checkpoint_interval == 0:
+                block_leaves.append(bytes.fromhex(digest))
+            if len(block_leaves) == self.checkpoint_interval:
+                block = seq // self.checkpoint_interval
+                if block >= len(checkpoints):
+                    return fail(seq, "missing checkpoint")
+                if merkle_levels(block_leaves)[-1][0].hex() != checkpoints[block].root:
+                    return fail(seq, "checkpoint root mismatch")
+                block_leaves = []
+                checkpoints_checked += 1
+
+            prev_hash = digest
+            expected_seq = seq + 1
+            checked += 1
+
+        if prev_hash is not None and prev_hash != head:
+            return fail(expected_seq, "chain head mismatch")
+
+        for i, checkpoint in enumerate(checkpoints):
+            expected_prev = checkpoints[i - 1].hash if i else GENESIS_HASH
+            if checkpoint.prev_hash != expected_prev or checkpoint.hash != checkpoint.compute_hash():
+                return fail(checkpoint.first_seq, "checkpoint chain broken")
+
+        return ChainVerification(True, checked, checkpoints_checked)
+
+
+def default_spill_path(name: str) -> Optional[str]:
+    """
+    Spill file under CLOSEDPAW_AUDIT_DIR, by default the app data
+    directory; None (spilling disabled) if the variable is set to
+    "none" or to an empty value
+    """
+    directory = os.getenv("CLOSEDPAW_AUDIT_DIR")
+    if directory is None:
+        directory = str(DEFAULT_AUDIT_DIR)
+    if not directory or directory.lower() == "none":
+        return None
+    return os.path.join(directory, name)
@@ -11,6 +11,8 @@ from enum import Enum
 from dataclasses import dataclass, field
 from datetime import datetime
 
+from .security import RateLimiter
+
 logger = logging.getLogger(__name__)
 
 
@@ -83,6 +85,8 @@ class BaseChannel(ABC):
         self.users: Dict[str, ChannelUser] = {}
         self._message_handler: Optional[Callable] = None
         self._running = False
+        self._user_limiter = RateLimiter(max_requests=config.rate_limit_per_user, window_seconds=60)
+        self._global_limiter = RateLimiter(max_requests=config.rate_limit_global, window_seconds=60)
     
     @abstractmethod
     async def start(self):
@@ -108,8 +112,19 @@ class BaseChannel(ABC):
         """Set callback for incoming messages"""
         self._message_handler = handler
     
+    def check_rate_limit(self, user_id: str) -> bool:
+        """Check per-user and global message rate limits for this channel"""
+        user_key = RateLimiter.key(self.config.name, user_id)
+        if not self._user_limiter.check_limit(user_key):
+            return False
+        return self._global_limiter.check_limit(self.config.name)
+    
     async def _handle_message(self, message: ChannelMessage):
         """Process incoming message"""
+        if not self.check_rate_limit(message.user_id):
+            logger.warning(f"Rate limit exceeded on {self.config.name} for user {message.user_id}")
+            return
+        
         if self._message_handler:
             await self._message_handler(message)
     
@@ -0,0 +1,143 @@
+"""
+ClosedPaw - Circuit Breaker
+Per-provider closed/open/half-open breaker for fast failover
+"""
+
+import time
+import logging
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState(str, Enum):
+    """Breaker state"""
+    CLOSED = "closed"        # Calls flow normally
+    OPEN = "open"            # Calls are rejected without being attempted
+    HALF_OPEN = "half_open"  # A few trial calls decide whether to close
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the breaker is open"""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Error-rate and latency breaker over a sliding window of recent calls
+
+    A call counts as failed when it raises or takes longer than
+    ``slow_call_ms``. Once the window holds at least ``min_calls``
+    outcomes and the failed fraction reaches ``failure_threshold``, the
+    breaker opens and rejects calls for ``open_seconds``. It then lets
+    ``half_open_calls`` trial calls through: all succeeding closes it
+    with a fresh window, any failing opens it again.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        window: int = 20,
+        min_calls: int = 5,
+        slow_call_ms: Optional[float] = None,
+        open_seconds: float = 30.0,
+        half_open_calls: int = 1,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.slow_call_ms = slow_call_ms
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self._clock = clock
+        self._outcomes: Deque[bool] = deque(maxlen=window)  # True = failed
+        self._failures = 0
+        self._state = CircuitState.CLOSED
+        self._opened_at = 0.0
+        self._trials_started = 0
+        self._trials_passed = 0
+
+    @property
+    def state(self) -> CircuitState:
+        if self._state == CircuitState.OPEN and self._clock() - self._opened_at >= self.open_seconds:
+            self._state = CircuitState.HALF_OPEN
+            self._trials_started = self._trials_passed = 0
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Whether a call may be attempted now; in half-open state this
+        reserves one of the trial slots
+        """
+        state = self.state
+        if state == CircuitState.CLOSED:
+            return True
+        if state == CircuitState.HALF_OPEN and self._trials_started < self.half_open_calls:
+            self._trials_started += 1
+            return True
+        return False
+
+    def retry_after(self) -> float:
+        """Seconds until an open breaker admits trial calls"""
+        if self.state != CircuitState.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.open_seconds - self._clock())
+
+    def record_success(self, latency_ms: Optional[float] = None):
+        if self.slow_call_ms is not None and latency_ms is not None and latency_ms > self.slow_call_ms:
+            self.record_failure()
+            return
+        if self._state == CircuitState.HALF_OPEN:
+            self._trials_passed += 1
+            if self._trials_passed >= self.half_open_calls:
+                self._close()
+            return
+        self._add(False)
+
+    def record_failure(self):
+        if self._state == CircuitState.HALF_OPEN:
+            self._open()
+            return
+        self._add(True)
+        if (
+            self._state == CircuitState.CLOSED
+            and len(self._outcomes) >= self.min_calls
+            and self._failures / len(self._outcomes) >= self.failure_threshold
+        ):
+            self._open()
+
+    def release(self):
+        """Return the trial slot of a call abandoned without an outcome"""
+        if self._state == CircuitState.HALF_OPEN and self._trials_started > self._trials_passed:
+            self._trials_started -= 1
+
+    def reset(self):
+        self._close()
+
+    def snapshot(self) -> Dict[str, Any]:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state.value,
+            "calls": calls,
+            "failure_rate": round(self._failures / calls, 3) if calls else 0.0,
+            "retry_after": round(self.retry_after(), 3),
+        }
+
+    def _add(self, failed: bool):
+        if len(self._outcomes) == self._outcomes.maxlen:
+            self._failures -= self._outcomes[0]
+        self._outcomes.append(failed)
+        self._failures += failed
+
+    def _open(self):
+        if self._state != CircuitState.OPEN:
+            logger.warning(f"Circuit opened ({self._failures}/{len(self._outcomes)} failed calls)")
+        self._state = CircuitState.OPEN
+        self._opened_at = self._clock()
+
+    def _close(self):
+        self._state = CircuitState.CLOSED
+        self._outcomes.clear()
+        self._failures = 0
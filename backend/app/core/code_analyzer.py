@@ -0,0 +1,255 @@
+"""
+ClosedPaw - Code Safety Analyzer
+Single-pass AST analysis of code submitted for sandboxed execution
+"""
+
+import re
+import ast
+import bisect
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CodeVerdict:
+    """Outcome of analyzing a piece of code"""
+    safe: bool
+    findings: List[str] = field(default_factory=list)
+    language: str = "python"
+
+
+def _walk_lines(tree: ast.AST, lines: List[int]) -> Iterator[ast.AST]:
+    """
+    Like ``ast.walk``, but skips subtrees whose line span contains none of
+    the sorted line numbers in ``lines``
+    """
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        start = getattr(node, "lineno", None)
+        if getattr(node, "decorator_list", None):
+            # A def/class starts at its "def"/"class" line, after its decorators
+            start = min(start, *(d.lineno for d in node.decorator_list))
+        if start is not None:
+            i = bisect.bisect_left(lines, start)
+            if i == len(lines) or lines[i] > (node.end_lineno or start):
+                continue
+        yield node
+        stack.extend(ast.iter_child_nodes(node))
+
+
+def _scan(tree: ast.AST, lines: List[int], analyzer: "CodeAnalyzer") -> List[str]:
+    """Collect dangerous imports, calls, references and attribute chains in one walk"""
+    findings: List[Tuple[int, str]] = []
+    # Inner links of an already reported attribute chain, and functions
+    # already reported as calls
+    reported = set()
+
+    def flag(node: ast.AST, message: str):
+        findings.append((node.lineno, message))
+
+    for node in _walk_lines(tree, lines):
+        if id(node) in reported:
+            continue
+        if isinstance(node, ast.Attribute):
+            if node.attr in analyzer.DANGEROUS_ATTRIBUTES:
+                flag(node, f"access to {node.attr}")
+            elif node.attr in analyzer.DANGEROUS_CALLS:
+                flag(node, f"reference to .{node.attr}")
+            name = _dotted_name(node)
+            if name and (
+                name.split(".", 1)[0] in analyzer.DANGEROUS_MODULES
+                or name in analyzer.DANGEROUS_REFERENCES
+            ):
+                flag(node, f"use of {name}")
+                inner = node.value
+                while isinstance(inner, ast.Attribute):
+                    reported.add(id(inner))
+                    inner = inner.value
+        elif isinstance(node, ast.Name):
+            if node.id in analyzer.DANGEROUS_ATTRIBUTES:
+                flag(node, f"access to {node.id}")
+            elif node.id in analyzer.DANGEROUS_CALLS:
+                # Aliasing (f = eval) is as dangerous as calling
+                flag(node, f"reference to {node.id}")
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            # Code smuggled in a string for a later eval/exec
+            for word in sorted(set(analyzer._string_triggers.findall(node.value))):
+                flag(node, f"{word} in string literal")
+        elif isinstance(node, ast.Call):
+            name = _dotted_name(node.func)
+            if name in analyzer.DANGEROUS_CALLS:
+                flag(node, f"call to {name}()")
+                reported.add(id(node.func))
+            target = _open_target(node)
+            if target is not None and target.startswith(analyzer.FORBIDDEN_OPEN_PREFIXES):
+                flag(node, f"open({target!r})")
+        elif isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".", 1)[0] in analyzer.DANGEROUS_MODULES:
+                    flag(node, f"import {alias.name}")
+        elif isinstance(node, ast.ImportFrom):
+            module = node.module or ""
+            if module.split(".", 1)[0] in analyzer.DANGEROUS_MODULES:
+                names = ", ".join(alias.name for alias in node.names)
+                flag(node, f"from {module} import {names}")
+
+    return [f"line {line}: {message}" for line, message in sorted(findings)]
+
+
+def _is_bare_expression(tree: ast.Module) -> bool:
+    """
+    True for input such as ``rm -rf /tmp`` that only parses as Python by
+    accident: nothing but operators applied to names
+    """
+    return bool(tree.body) and all(
+        isinstance(stmt, ast.Expr) and isinstance(stmt.value, (ast.BinOp, ast.UnaryOp, ast.Compare, ast.Name))
+        for stmt in tree.body
+    )
+
+
+def _line_numbers(code: str, offsets: List[int]) -> List[int]:
+    """Sorted 1-based line numbers of ascending character offsets"""
+    lines = []
+    line, pos = 1, 0
+    for offset in offsets:
+        line += code.count("\n", pos, offset)
+        pos = offset
+        if not lines or lines[-1] != line:
+            lines.append(line)
+    return lines
+
+
+def _open_target(node: ast.Call) -> Optional[str]:
+    """Literal path given to ``open(...)`` or ``<anything>.open(...)``"""
+    func = node.func
+    if not (
+        (isinstance(func, ast.Name) and func.id == "open")
+        or (isinstance(func, ast.Attribute) and func.attr == "open")
+    ):
+        return None
+    target = node.args[0] if node.args else next(
+        (kw.value for kw in node.keywords if kw.arg == "file"), None
+    )
+    if isinstance(target, ast.Constant) and isinstance(target.value, str):
+        return target.value
+    return None
+
+
+def _dotted_name(node: ast.AST) -> Optional[str]:
+    """``a.b.c`` for a chain of attributes on a name, else None"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return ".".join(reversed(parts))
+
+
+class CodeAnalyzer:
+    """
+    Python code safety analyzer
+
+    Code is parsed once with ``ast`` and walked once, collecting imports
+    of dangerous modules (including ``from x import y``), any reference
+    to dynamic-execution builtins (calls and aliases such as
+    ``f = eval``), attribute chains rooted at dangerous modules or
+    ``sys.modules``, dunder escapes, ``open``/``x.open`` on system paths
+    and string literals naming ``__import__``, ``eval`` or ``exec``.
+    Other identifiers and string contents never match by accident, so
+    text such as ``format `` is not flagged.
+
+    Input that does not parse as Python, or only parses as a bare
+    operator expression (shell commands often do), is checked against
+    the regex patterns instead.
+
+    A regex prefilter skips parsing entirely when none of the flagged
+    identifiers or fallback patterns occur in the text, and the walk
+    only descends into nodes spanning a line with a flagged identifier.
+    Verdicts are cached by SHA-256 of the code.
+    """
+
+    DANGEROUS_MODULES = frozenset({
+        "os", "subprocess", "socket", "shutil", "ctypes", "pty",
+        "multiprocessing", "importlib", "builtins", "io", "posix", "nt",
+    })
+    DANGEROUS_CALLS = frozenset({
+        "exec", "eval", "compile", "__import__", "globals", "breakpoint",
+    })
+    DANGEROUS_ATTRIBUTES = frozenset({
+        "__builtins__", "__globals__", "__subclasses__", "__code__",
+        "__mro__", "__bases__", "__loader__",
+    })
+    # Dotted names that reach dangerous modules indirectly
+    DANGEROUS_REFERENCES = frozenset({"sys.modules"})
+    # Flagged inside string literals, which may be eval'd later
+    STRING_TRIGGERS = ("__import__", "eval", "exec")
+    FORBIDDEN_OPEN_PREFIXES = ("/etc", "/proc", "/sys", "/root", "/dev")
+
+    def __init__(self, fallback_patterns: Sequence[str], cache_size: int = 1024):
+        # Matched case-sensitively against lowercased text, which is far
+        # cheaper than re.IGNORECASE; patterns must be lowercase
+        self._fallback = [re.compile(p) for p in fallback_patterns]
+        # Every finding needs one of these identifiers or a fallback match
+        words = (
+            self.DANGEROUS_MODULES | self.DANGEROUS_CALLS | self.DANGEROUS_ATTRIBUTES | {"open"}
+            | {part for name in self.DANGEROUS_REFERENCES for part in name.split(".")}
+        )
+        self._string_triggers = re.compile(r"\b(" + "|".join(map(re.escape, self.STRING_TRIGGERS)) + r")\b")
+        self._triggers = re.compile(r"\b(?:" + "|".join(map(re.escape, sorted(words))) + r")\b")
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, CodeVerdict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def analyze(self, code: str) -> CodeVerdict:
+        """
+        Analyze code for unsafe constructs
+
+        Args:
+            code: Source to be executed in the sandbox
+
+        Returns:
+            CodeVerdict listing every finding
+        """
+        digest = hashlib.sha256(code.encode("utf-8", "surrogatepass")).digest()
+        with self._lock:
+            cached = self._cache.get(digest)
+            if cached is not None:
+                self._cache.move_to_end(digest)
+                return cached
+
+        verdict = self._analyze(code)
+        with self._lock:
+            self._cache[digest] = verdict
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return verdict
+
+    def _analyze(self, code: str) -> CodeVerdict:
+        lowered = code.lower()
+        triggers = [m.start() for m in self._triggers.finditer(code)]
+        if not triggers and not any(p.search(lowered) for p in self._fallback):
+            return CodeVerdict(safe=True)
+        try:
+            tree = ast.parse(code)
+        except (SyntaxError, ValueError, RecursionError):
+            return self._analyze_text(lowered)
+        if _is_bare_expression(tree):
+            return self._analyze_text(lowered)
+
+        # Every Python finding contains a trigger word, so only the lines
+        # holding one need to be walked
+        findings = _scan(tree, _line_numbers(code, triggers), self)
+        return CodeVerdict(safe=not findings, findings=findings)
+
+    def _analyze_text(self, lowered: str) -> CodeVerdict:
+        findings = [f"pattern {p.pattern}" for p in self._fallback if p.search(lowered)]
+        return CodeVerdict(safe=not findings, findings=findings, language="text")
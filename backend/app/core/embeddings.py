@@ -0,0 +1,113 @@
+"""
+ClosedPaw - Embeddings
+Micro-batching of embedding requests and compact float32 results
+"""
+
+import asyncio
+import logging
+from array import array
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Set, Union
+
+try:
+    import numpy as np
+except ImportError:  # optional: results fall back to array("f") rows
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# numpy.ndarray of shape (len(texts), dim), or one array("f") per text
+Embeddings = Union["np.ndarray", List[array]]
+
+
+def as_float32(rows: Sequence[Sequence[float]]) -> Embeddings:
+    """
+    Pack embedding vectors as float32
+
+    Returns:
+        A (rows, dim) NumPy array if NumPy is installed, otherwise a list
+        of ``array("f")``; both support ``len``, indexing and iteration
+        by row
+    """
+    if np is not None:
+        return np.asarray(rows, dtype=np.float32)
+    return [array("f", row) for row in rows]
+
+
+class _Batch:
+    def __init__(self):
+        self.texts: List[str] = []
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbeddingBatcher:
+    """
+    Merges concurrent embedding calls into one upstream request
+
+    Texts submitted for the same model within ``window`` seconds of the
+    first are sent together, and each caller gets back its own rows. A
+    batch is sent early once it holds ``max_batch`` texts; a single call
+    larger than that is sent on its own.
+    """
+
+    def __init__(
+        self,
+        embed: Callable[[List[str], Optional[str]], Awaitable[List[Sequence[float]]]],
+        window: float = 0.005,
+        max_batch: int = 64
+    ):
+        self._embed = embed
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: Dict[Optional[str], _Batch] = {}
+        self._sending: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(self, texts: List[str], model: Optional[str] = None) -> List[Sequence[float]]:
+        """Embed ``texts``, sharing the upstream request with concurrent callers"""
+        self.requests += 1
+        batch = self._pending.get(model)
+        if batch is not None and len(batch.texts) + len(texts) > self.max_batch:
+            self._flush(model)
+            batch = None
+        if batch is None:
+            batch = self._pending[model] = _Batch()
+            batch.timer = asyncio.get_running_loop().call_later(self.window, self._flush, model)
+
+        start = len(batch.texts)
+        batch.texts.extend(texts)
+        if len(batch.texts) >= self.max_batch:
+            self._flush(model)
+        rows = await asyncio.shield(batch.result)
+        return rows[start:start + len(texts)]
+
+    def _flush(self, model: Optional[str]):
+        batch = self._pending.pop(model, None)
+        if batch is None:
+            return
+        batch.timer.cancel()
+        self.batches += 1
+        self.texts += len(batch.texts)
+        task = asyncio.ensure_future(self._send(batch, model))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: _Batch, model: Optional[str]):
+        try:
+            rows = await self._embed(batch.texts, model)
+            if len(rows) != len(batch.texts):
+                raise ValueError(f"Expected {len(batch.texts)} embeddings, got {len(rows)}")
+        except Exception as e:
+            batch.result.set_exception(e)
+        else:
+            batch.result.set_result(rows)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch": round(self.texts / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,80 @@
+"""
+ClosedPaw - Request Hedging
+Duplicate slow chat requests to a second provider to cut tail latency
+"""
+
+import logging
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from .retry import RetryBudget
+from .routing import RouteKey
+
+logger = logging.getLogger(__name__)
+
+
+class HedgePolicy:
+    """
+    When to send a hedge, and how many
+
+    A request that has not completed after the ``percentile`` latency
+    of its route (over the last ``window`` successes, at least
+    ``min_delay_ms``) is duplicated to the next candidate; whichever
+    answers first wins and the other is cancelled. Chat responses are
+    not streamed, so completion is the first output that can be
+    observed. Routes with fewer than ``min_samples`` measurements are
+    not hedged.
+
+    Hedges are capped at ``max_rate`` of requests by a RetryBudget that
+    starts empty and is earned only by requests, never by elapsed time,
+    so neither a slow period nor low traffic can push the hedge rate
+    above the cap.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        max_rate: float = 0.05,
+        min_delay_ms: float = 50.0,
+        min_samples: int = 20,
+        window: int = 200,
+        budget: Optional[RetryBudget] = None
+    ):
+        self.percentile = percentile
+        self.min_delay_ms = min_delay_ms
+        self.min_samples = min_samples
+        self.window = window
+        self.budget = budget or RetryBudget(
+            ratio=max_rate, min_per_second=0.0, max_balance=1.0, initial_balance=0.0
+        )
+        self._samples: Dict[RouteKey, Deque[float]] = {}
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.hedge_losses = 0
+        self.over_budget = 0
+
+    def observe(self, route: RouteKey, latency_ms: float):
+        samples = self._samples.get(route)
+        if samples is None:
+            samples = self._samples[route] = deque(maxlen=self.window)
+        samples.append(latency_ms)
+
+    def delay(self, route: RouteKey) -> Optional[float]:
+        """Seconds to wait before hedging ``route``, or None to never hedge"""
+        samples = self._samples.get(route)
+        if samples is None or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        rank = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(ordered[rank], self.min_delay_ms) / 1000
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_rate": round(self.hedged / self.requests, 4) if self.requests else 0.0,
+            "hedge_wins": self.hedge_wins,
+            "hedge_losses": self.hedge_losses,
+            "over_budget": self.over_budget,
+        }
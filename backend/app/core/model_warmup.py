@@ -0,0 +1,152 @@
+"""
+ClosedPaw - Model Warm-up
+Preloads local models at startup and keeps the busiest ones resident
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from .providers import OllamaProvider, ProviderManager, get_provider_manager
+
+logger = logging.getLogger(__name__)
+
+
+class ModelWarmupManager:
+    """
+    Keeps Ollama models loaded ahead of demand
+
+    At startup every Ollama provider loads the models listed in
+    ``settings["preload"]`` and ``settings["pinned"]``, so the first
+    request does not pay the multi-second cold load.
+
+    Afterwards, every ``interval`` seconds the ``settings["max_pinned"]``
+    (default 1) models with the most requests since the last pass, and
+    at least ``hot_min_requests`` of them, are pinned with
+    ``keep_alive=-1``. Models that cool down get the provider's normal
+    keep-alive back, so Ollama unloads them once idle. Configured pins
+    are never released.
+    """
+
+    def __init__(
+        self,
+        manager: Optional[ProviderManager] = None,
+        interval: float = 60.0,
+        hot_min_requests: int = 3
+    ):
+        self.manager = manager or get_provider_manager()
+        self.interval = interval
+        self.hot_min_requests = hot_min_requests
+        self._task: Optional[asyncio.Task] = None
+
+    def _providers(self) -> Dict[str, OllamaProvider]:
+        return {
+            name: provider for name, provider in self.manager.providers.items()
+            if isinstance(provider, OllamaProvider) and self.manager.configs[name].enabled
+        }
+
+    async def preload(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Load configured models on every Ollama provider
+
+        Models are loaded one at a time per provider to avoid competing
+        for memory; providers load in parallel.
+
+        Returns:
+            provider -> model -> load time in ms (None if it failed)
+        """
+        async def preload_provider(provider: OllamaProvider) -> Dict[str, Optional[float]]:
+            settings = provider.config.settings
+            models = list(dict.fromkeys(list(settings.get("pinned", [])) + list(settings.get("preload", []))))
+            loaded: Dict[str, Optional[float]] = {}
+            for model in models:
+                try:
+                    loaded[model] = await provider.load(model)
+                    logger.info(f"Preloaded {model} on {provider.config.name} in {loaded[model]:.0f}ms")
+                except Exception as e:
+                    logger.warning(f"Could not preload {model} on {provider.config.name}: {e}")
+                    loaded[model] = None
+            return loaded
+
+        providers = self._providers()
+        results = await asyncio.gather(*(preload_provider(p) for p in providers.values()))
+        return dict(zip(providers, results))
+
+    async def rebalance(self):
+        """Pin the currently hottest models and release the ones that cooled"""
+        for name, provider in self._providers().items():
+            configured = set(provider.config.settings.get("pinned", []))
+            max_pinned = provider.config.settings.get("max_pinned", 1)
+
+            ranked = sorted(
+                (stats.recent_requests, model) for model, stats in provider.model_stats.items()
+                if stats.recent_requests >= self.hot_min_requests
+            )
+            hot = {model for _, model in ranked[-max_pinned:]} if max_pinned else set()
+            for stats in provider.model_stats.values():
+                stats.recent_requests = 0
+
+            wanted = configured | hot
+            try:
+                for model in wanted - provider.pinned:
+                    provider.pinned.add(model)
+                    await provider.load(model, keep_alive=-1)
+                    logger.info(f"Pinned hot model {model} on {name}")
+                released = provider.pinned - wanted
+                if released:
+                    resident = set(await provider.loaded_models())
+                    for model in released:
+                        provider.pinned.discard(model)
+                        # Only refresh the timer of models that are still loaded
+                        if model in resident:
+                            await provider.load(model, keep_alive=provider.keep_alive)
+                        logger.info(f"Released pin on {model} on {name}")
+            except Exception as e:
+                logger.warning(f"Model rebalance failed on {name}: {e}")
+
+    async def run(self):
+        """Preload, then rebalance periodically until cancelled"""
+        await self.preload()
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.rebalance()
+
+    def start(self):
+        """Start warm-up on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Per-provider model usage, cold starts and pins"""
+        return {
+            name: {
+                "keep_alive": provider.keep_alive,
+                "models": {
+                    model: {
+                        "requests": stats.requests,
+                        "cold_starts": stats.cold_starts,
+                        "preloads": stats.preloads,
+                        "last_load_ms": round(stats.last_load_ms, 1),
+                        "pinned": model in provider.pinned,
+                    }
+                    for model, stats in provider.model_stats.items()
+                },
+            }
+            for name, provider in self._providers().items()
+        }
+
+
+_warmup_manager: Optional[ModelWarmupManager] = None
+
+
+def get_warmup_manager() -> ModelWarmupManager:
+    """Get or create the shared warm-up manager"""
+    global _warmup_manager
+    if _warmup_manager is None:
+        _warmup_manager = ModelWarmupManager()
+    return _warmup_manager
@@ -0,0 +1,134 @@
+"""
+ClosedPaw - Network Policy
+Host allowlist for outbound requests
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Optional, Set
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class NetworkDecision:
+    """Outcome of a network policy check"""
+    allowed: bool
+    reason: str
+    host: Optional[str] = None
+
+
+class NetworkPolicy:
+    """
+    Allow/deny rules matched against the parsed host of a URL
+
+    Rules are hostnames or IP literals matched exactly, or ``*.domain``
+    wildcards that match any subdomain (not the bare domain). Deny rules
+    win over allow rules. Only the parsed hostname is compared, so
+    ``api.openai.com.evil.net`` and ``api.openai.com@evil.net`` do not
+    match ``api.openai.com``.
+
+    A check costs one ``urlsplit`` plus a set lookup per host label, and
+    decisions are memoized per (scheme, host).
+    """
+
+    ALLOWED_SCHEMES = frozenset({"http", "https", "ws", "wss"})
+
+    def __init__(self, allow: Iterable[str] = (), deny: Iterable[str] = (), cache_size: int = 4096):
+        self.cache_size = cache_size
+        self._allow_exact: Set[str] = set()
+        self._allow_suffix: Set[str] = set()
+        self._deny_exact: Set[str] = set()
+        self._deny_suffix: Set[str] = set()
+        self._cache: "OrderedDict[tuple, NetworkDecision]" = OrderedDict()
+        self._lock = threading.Lock()
+        for rule in allow:
+            self.add_rule(rule, allow=True)
+        for rule in deny:
+            self.add_rule(rule, allow=False)
+
+    def add_rule(self, rule: str, allow: bool = True):
+        """Add a host or ``*.domain`` rule; clears memoized decisions"""
+        rule = rule.strip().lower().rstrip(".")
+        with self._lock:
+            if rule.startswith("*."):
+                (self._allow_suffix if allow else self._deny_suffix).add(rule[2:])
+            else:
+                (self._allow_exact if allow else self._deny_exact).add(rule)
+            self._cache.clear()
+
+    def check(self, url: str) -> NetworkDecision:
+        """
+        Decide whether a request to ``url`` may leave the host
+
+        Args:
+            url: Absolute URL
+
+        Returns:
+            NetworkDecision with the parsed host
+        """
+        try:
+            parts = urlsplit(url.strip())
+            host = parts.hostname
+        except ValueError:
+            return NetworkDecision(False, "Malformed URL")
+        if not host:
+            return NetworkDecision(False, "URL has no host")
+
+        key = (parts.scheme.lower(), host.rstrip("."))
+        decision = self._cache.get(key)
+        if decision is None:
+            decision = self._evaluate(*key)
+            with self._lock:
+                self._cache[key] = decision
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return decision
+
+    def is_allowed(self, url: str) -> bool:
+        return self.check(url).allowed
+
+    def _evaluate(self, scheme: str, host: str) -> NetworkDecision:
+        if scheme not in self.ALLOWED_SCHEMES:
+            return NetworkDecision(False, f"Scheme not allowed: {scheme}", host)
+        if self._matches(host, self._deny_exact, self._deny_suffix):
+            return NetworkDecision(False, f"Host denied: {host}", host)
+        if self._matches(host, self._allow_exact, self._allow_suffix):
+            return NetworkDecision(True, "URL allowed", host)
+        return NetworkDecision(False, "External URL not in allowlist", host)
+
+    @staticmethod
+    def _matches(host: str, exact: Set[str], suffixes: Set[str]) -> bool:
+        if host in exact:
+            return True
+        if suffixes:
+            dot = host.find(".")
+            while dot != -1:
+                if host[dot + 1:] in suffixes:
+                    return True
+                dot = host.find(".", dot + 1)
+        return False
+
+
+DEFAULT_ALLOWED_HOSTS = (
+    "api.openai.com",
+    "api.anthropic.com",
+    "generativelanguage.googleapis.com",
+    "api.mistral.ai",
+    "127.0.0.1",
+    "localhost",
+    "ollama",
+)
+
+_policy: Optional[NetworkPolicy] = None
+
+
+def get_network_policy() -> NetworkPolicy:
+    """Get or create the shared network policy"""
+    global _policy
+    if _policy is None:
+        _policy = NetworkPolicy(allow=DEFAULT_ALLOWED_HOSTS)
+    return _policy
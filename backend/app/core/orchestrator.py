@@ -8,12 +8,16 @@ import logging
 import os
 import tempfile
 import uuid
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from typing import Deque, Dict, List, Optional, Any
 from enum import Enum
 import httpx
 from pydantic import BaseModel, Field
 
+from .security import get_defender, RateLimiter, ThreatLevel, ValidationMode
+from .audit import AuditLogStore, ChainVerification, default_spill_path
+
 # Configure logging for security audit
 log_path = os.path.join(tempfile.gettempdir(), 'closedpaw-audit.log')
 logging.basicConfig(
@@ -100,7 +104,9 @@ class CoreOrchestrator:
     
     def __init__(self):
         self.actions: Dict[str, SystemAction] = {}
-        self.audit_logs: List[AuditLogEntry] = []
+        # Recent entries for the API; the full record is the hash chain
+        self.audit_logs: Deque[AuditLogEntry] = deque(maxlen=10_000)
+        self.audit_chain = AuditLogStore(spill_path=default_spill_path("orchestrator_audit.jsonl"))
         self.skills: Dict[str, Any] = {}
         self.llm_gateway = None
         self.hitl_interface = None
@@ -215,6 +221,10 @@ class CoreOrchestrator:
         
         logger.info(f"Action submitted: {action.id} ({action_type.value})")
         
+        # Screen chat input before anything else touches it
+        if action_type == ActionType.CHAT and self._reject_unsafe_input(action):
+            return action
+        
         # Check if HITL approval is required
         if security_level in [SecurityLevel.HIGH, SecurityLevel.CRITICAL]:
             logger.info(f"Action {action.id} requires HITL approval")
@@ -230,6 +240,82 @@ class CoreOrchestrator:
         
         return action
     
+    def _reject_unsafe_input(self, action: SystemAction) -> bool:
+        """
+        Fast-reject screening of chat input on the request path
+        
+        Returns True if the action was rejected. Whenever anything is
+        detected, a full forensic scan is logged in the background.
+        
+        Chat is rate limited per channel and user (``channel``/``user_id``
+        parameters); anonymous requests are left to the channel layer's
+        limits rather than sharing one process-wide bucket.
+        """
+        message = str(action.parameters.get("message", ""))
+        channel = action.parameters.get("channel")
+        user_id = action.parameters.get("user_id")
+        rate_limit_key = RateLimiter.key("chat", channel, user_id) if channel or user_id else None
+        validation = get_defender().validate_input(
+            message, rate_limit_key=rate_limit_key, mode=ValidationMode.FAST_REJECT
+        )
+        
+        if validation.detected_patterns:
+            asyncio.create_task(self._log_forensic_scan(action, message))
+        
+        if validation.rate_limited:
+            action.error = "Rate limit exceeded"
+            outcome = "rate_limited"
+        elif validation.threat_level == ThreatLevel.CRITICAL:
+            action.error = f"Input blocked: {validation.threat_level.value} threat detected"
+            outcome = "blocked"
+        else:
+            return False
+        
+        action.status = ActionStatus.REJECTED
+        action.completed_at = datetime.utcnow()
+        
+        self._log_audit_event(
+            action_id=action.id,
+            action_type=action.action_type,
+            skill_id=action.skill_id,
+            status=ActionStatus.REJECTED,
+            outcome=outcome,
+            details={
+                "threat_level": validation.threat_level.value,
+                "detected_patterns": validation.detected_patterns,
+                "rate_limit_key": rate_limit_key
+            }
+        )
+        
+        logger.warning(f"Action {action.id} rejected: {action.error}")
+        return True
+    
+    async def _log_forensic_scan(self, action: SystemAction, message: str):
+        """Record every match in the audit log, off the event loop"""
+        try:
+            validation = await asyncio.to_thread(
+                get_defender().validate_input,
+                message,
+                rate_limit_key=None,
+                mode=ValidationMode.FORENSIC
+            )
+        except Exception as e:
+            logger.error(f"Forensic scan failed for {action.id}: {e}")
+            return
+        
+        self._log_audit_event(
+            action_id=action.id,
+            action_type=action.action_type,
+            skill_id=action.skill_id,
+            status=action.status,
+            outcome="forensic_scan",
+            details={
+                "threat_level": validation.threat_level.value,
+                "detected_patterns": validation.detected_patterns,
+                "matches": validation.matches
+            }
+        )
+    
     def _determine_security_level(self, action_type: ActionType, parameters: Dict[str, Any]) -> SecurityLevel:
         """Determine security level based on action type and parameters"""
         
@@ -507,6 +593,7 @@ class CoreOrchestrator:
         )
         
         self.audit_logs.append(entry)
+        self.audit_chain.append(entry.model_dump(mode="json"))
         
         # Log to file
         logger.info(f"AUDIT: {action_id} | {action_type.value} | {status.value} | {outcome or 'N/A'}")
@@ -523,6 +610,10 @@ class CoreOrchestrator:
         """Get recent audit logs"""
         return sorted(self.audit_logs, key=lambda x: x.timestamp, reverse=True)[:limit]
     
+    async def verify_audit_chain(self) -> ChainVerification:
+        """Re-verify every audit event against the hash chain and checkpoints"""
+        return await asyncio.to_thread(self.audit_chain.verify_all)
+    
     async def shutdown(self):
         """Shutdown the orchestrator gracefully"""
         logger.info("Shutting down CoreOrchestrator...")
@@ -534,6 +625,7 @@ class CoreOrchestrator:
             logger.info(f"Waiting for {len(pending)} executing actions to complete...")
             await asyncio.sleep(2)
         
+        self.audit_chain.close()
         logger.info("CoreOrchestrator shutdown complete")
 
 
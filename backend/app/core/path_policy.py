@@ -0,0 +1,173 @@
+"""
+ClosedPaw - Path Policy
+Compiled allow/deny prefix rules for file access checks
+"""
+
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+_DRIVE = re.compile(r"^[A-Za-z]:(?:[\\/]|$)")
+
+ALLOW = "allow"
+DENY = "deny"
+
+
+@dataclass(frozen=True)
+class PathDecision:
+    """Outcome of a path policy check"""
+    allowed: bool
+    reason: str
+    normalized: Optional[str] = None
+    rule: Optional[str] = None
+
+
+class _Node:
+    __slots__ = ("children", "action", "rule")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.action: Optional[str] = None
+        self.rule: Optional[str] = None
+
+
+def split_path(path: str) -> Tuple[Optional[List[str]], str]:
+    """
+    Normalize a path and split it into components
+
+    ``~`` is expanded and backslashes are treated as separators. Windows
+    drive paths are case-folded.
+
+    Returns:
+        (components, normalized) where components is None for relative
+        paths
+    """
+    expanded = os.path.expanduser(path)
+    if _DRIVE.match(expanded):
+        normalized = os.path.normpath(expanded.replace("\\", "/")).casefold()
+        return normalized.split("/"), normalized
+    normalized = os.path.normpath(expanded.replace("\\", "/"))
+    if not normalized.startswith("/"):
+        return None, normalized
+    return [c for c in normalized.split("/") if c], normalized
+
+
+class PathPolicy:
+    """
+    Allow/deny rules compiled into a trie of path components
+
+    A check walks the trie along the path's components, so it costs
+    O(depth) regardless of how many rules exist. The deepest matching
+    rule wins, and deny wins over allow on the same prefix. Absolute
+    paths that match no rule are denied. Relative paths are allowed
+    unless they climb out with ``..``; callers that resolve relative
+    paths against a base should check the resolved absolute path.
+
+    Decisions for recently seen normalized paths are kept in an LRU.
+    """
+
+    def __init__(
+        self,
+        deny: Iterable[str] = (),
+        allow: Iterable[str] = (),
+        cache_size: int = 4096
+    ):
+        self.cache_size = cache_size
+        self._root = _Node()
+        self._cache: "OrderedDict[str, PathDecision]" = OrderedDict()
+        self._lock = threading.Lock()
+        for prefix in allow:
+            self.add_rule(prefix, ALLOW)
+        for prefix in deny:
+            self.add_rule(prefix, DENY)
+
+    def add_rule(self, prefix: str, action: str):
+        """Add an allow or deny prefix; clears cached decisions"""
+        components, normalized = split_path(prefix)
+        if components is None:
+            raise ValueError(f"Path rule must be absolute: {prefix}")
+        with self._lock:
+            node = self._root
+            for component in components:
+                node = node.children.setdefault(component, _Node())
+            if node.action != DENY:
+                node.action = action
+                node.rule = prefix
+            self._cache.clear()
+
+    def check(self, path: str) -> PathDecision:
+        """
+        Decide whether a path may be accessed
+
+        Args:
+            path: Absolute, relative or ``~`` path
+
+        Returns:
+            PathDecision with the normalized path when allowed
+        """
+        components, normalized = split_path(path)
+        cached = self._cache.get(normalized)
+        if cached is not None:
+            with self._lock:
+                if normalized in self._cache:
+                    self._cache.move_to_end(normalized)
+            return cached
+
+        decision = self._evaluate(components, normalized)
+        with self._lock:
+            self._cache[normalized] = decision
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return decision
+
+    def is_allowed(self, path: str) -> bool:
+        return self.check(path).allowed
+
+    def _evaluate(self, components: Optional[List[str]], normalized: str) -> PathDecision:
+        if components is None:
+            if normalized == ".." or normalized.startswith("../"):
+                return PathDecision(False, "Path traversal detected")
+            return PathDecision(True, "Access granted", normalized)
+
+        action, rule = None, None
+        node = self._root
+        for component in components:
+            node = node.children.get(component)
+            if node is None:
+                break
+            if node.action is not None:
+                action, rule = node.action, node.rule
+
+        if action == ALLOW:
+            return PathDecision(True, "Access granted", normalized, rule)
+        if action == DENY:
+            return PathDecision(False, f"Access to path forbidden: {normalized}", rule=rule)
+        return PathDecision(False, "Path outside allowed directories")
+
+
+# Default rules shared by SecurityManager and the filesystem skill
+DEFAULT_DENY = (
+    "/etc/passwd", "/etc/shadow", "/etc/sudoers",
+    "/root/.ssh", "/root/.bashrc",
+    "~/.ssh", "~/.gnupg",
+    "C:\\Windows\\System32\\config",
+    "/proc", "/sys",
+)
+DEFAULT_ALLOW = ("/tmp", "/home", "~")  # nosec B108
+
+_policy: Optional[PathPolicy] = None
+
+
+def get_path_policy() -> PathPolicy:
+    """Get or create the shared path policy"""
+    global _policy
+    if _policy is None:
+        _policy = PathPolicy(deny=DEFAULT_DENY, allow=DEFAULT_ALLOW)
+    return _policy
@@ -0,0 +1,202 @@
+"""
+ClosedPaw - Provider Limits
+Per-provider request rate, concurrency cap and bounded wait queue
+"""
+
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderLimitExceeded(Exception):
+    """Raised when a request cannot get a provider slot in time"""
+    pass
+
+
+def parse_retry_after(value: Optional[str], now: Optional[datetime] = None) -> Optional[float]:
+    """
+    Seconds to wait from a Retry-After header (delta-seconds or HTTP date)
+
+    Returns:
+        Non-negative seconds, or None if absent or unparseable
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - (now or datetime.now(timezone.utc))).total_seconds())
+
+
+class ProviderLimiter:
+    """
+    Token bucket plus concurrency semaphore in front of one provider
+
+    A request first waits for one of ``max_concurrency`` slots, then for
+    a token; the bucket holds ``burst`` tokens and refills at
+    ``rate_per_minute``. At most ``max_queue`` requests wait at once and
+    none waits longer than ``max_wait`` seconds; beyond that
+    ProviderLimitExceeded is raised immediately, so a saturated provider
+    sheds load instead of building a backlog.
+
+    ``penalize`` holds all requests until an upstream Retry-After has
+    passed and drains the bucket so traffic resumes gradually.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float = 60,
+        max_concurrency: int = 4,
+        max_queue: int = 32,
+        max_wait: float = 10.0,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.rate_per_minute = rate_per_minute
+        self.refill_rate = rate_per_minute / 60.0
+        self.burst = float(burst if burst is not None else max(1.0, rate_per_minute))
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Serializes token waits so requests are admitted in arrival order
+        self._turn = asyncio.Lock()
+        self._waiting = 0
+        self._in_flight = 0
+        # Metrics
+        self.admitted = 0
+        self.rejected = 0
+        self.throttled = 0
+        self.total_queue_ms = 0.0
+        self.max_queue_ms = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self) -> float:
+        """
+        Wait for a slot and a token
+
+        Returns:
+            Time spent queued, in milliseconds
+        """
+        if not self._semaphore.locked() and not self._turn.locked() and self._take() <= 0:
+            # Free slot and token: admitted without queueing
+            await self._semaphore.acquire()
+            queued_ms = 0.0
+        else:
+            queued_ms = await self._queue()
+        self._in_flight += 1
+        self.admitted += 1
+        self.total_queue_ms += queued_ms
+        self.max_queue_ms = max(self.max_queue_ms, queued_ms)
+        return queued_ms
+
+    def release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[float]:
+        """``async with limiter.slot() as queued_ms`` around one request"""
+        queued_ms = await self.acquire()
+        try:
+            yield queued_ms
+        finally:
+            self.release()
+
+    def penalize(self, retry_after: float):
+        """Hold new requests for ``retry_after`` seconds (upstream throttling)"""
+        now = self._clock()
+        self._refill(now)
+        self._blocked_until = max(self._blocked_until, now + retry_after)
+        # Refilling starts only once the pause is over
+        self._tokens = 0.0
+        self._updated = self._blocked_until
+        self.throttled += 1
+        logger.warning(f"Provider throttled upstream; pausing requests for {retry_after:.1f}s")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "rate_per_minute": self.rate_per_minute,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "throttled": self.throttled,
+            "mean_queue_ms": round(self.total_queue_ms / self.admitted, 2) if self.admitted else 0.0,
+            "max_queue_ms": round(self.max_queue_ms, 2),
+            "blocked_for": round(max(0.0, self._blocked_until - self._clock()), 3),
+        }
+
+    async def _queue(self) -> float:
+        if self._waiting >= self.max_queue:
+            self.rejected += 1
+            raise ProviderLimitExceeded(f"Provider queue full ({self._waiting} waiting)")
+
+        started = self._clock()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._admit(), self.max_wait)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ProviderLimitExceeded(f"No provider slot within {self.max_wait:.1f}s")
+        finally:
+            self._waiting -= 1
+        return (self._clock() - started) * 1000
+
+    async def _admit(self):
+        await self._semaphore.acquire()
+        try:
+            async with self._turn:
+                while True:
+                    delay = self._take()
+                    if delay <= 0:
+                        return
+                    await asyncio.sleep(delay)
+        except BaseException:
+            self._semaphore.release()
+            raise
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.refill_rate)
+            self._updated = now
+
+    def _take(self) -> float:
+        """Consume a token; returns 0, or the seconds to wait before retrying"""
+        now = self._clock()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self.refill_rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            return 0.0
+        return (1.0 - self._tokens) / self.refill_rate
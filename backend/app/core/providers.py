@@ -3,15 +3,27 @@ ClosedPaw - Multi-Provider LLM Gateway
 Supports Ollama, OpenAI, Anthropic, Google, Mistral, and custom endpoints
 """
 
+import os
+import json
+import time
+import asyncio
 import logging
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional, Any
+from typing import AsyncIterator, Dict, List, Optional, Any, Sequence, Set, Tuple, Union
 from enum import Enum
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
 
 import httpx
 
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from .routing import LatencyRouter
+from .hedging import HedgePolicy
+from .single_flight import SingleFlight
+from .embeddings import EmbeddingBatcher, Embeddings, as_float32
+from .provider_limits import ProviderLimiter, parse_retry_after
+from .retry import RetryBudget, RetryPolicy
+
 logger = logging.getLogger(__name__)
 
 
@@ -61,17 +73,170 @@ class ChatResponse:
     tokens_used: Optional[int] = None
     finish_reason: Optional[str] = None
     latency_ms: Optional[int] = None
+    # Time to first token, where the provider reports or streams it
+    ttft_ms: Optional[int] = None
+
+
+class ProviderError(Exception):
+    """Error response or connection failure from a provider"""
+    
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retryable: bool = False,
+        retry_after: Optional[float] = None
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class ProviderUnavailableError(Exception):
+    """No registered, enabled provider could take the request"""
+    pass
+
+
+def _is_provider_fault(error: Exception) -> bool:
+    """
+    Whether a failed call counts against the provider's circuit breaker:
+    transport failures, timeouts, 5xx and 429. Client errors such as a
+    rejected request or a missing API key, and a full local queue, say
+    nothing about the provider's health.
+    """
+    if isinstance(error, ProviderError):
+        if error.status_code is None:
+            return isinstance(error.__cause__, httpx.HTTPError)
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, (asyncio.TimeoutError, httpx.HTTPError))
+
+
+@dataclass
+class FallbackChain:
+    """Ordered (provider, model) candidates for one model class"""
+    entries: List[Tuple[str, Optional[str]]]
+    # Per-attempt bound while another candidate remains, in seconds
+    attempt_timeout: Optional[float] = None
+    # Order candidates by expected latency instead of as listed
+    balanced: bool = False
 
 
 class BaseProvider(ABC):
-    """Abstract base class for LLM providers"""
+    """
+    Abstract base class for LLM providers
+    
+    Completion requests go through ``_request``, which enforces the
+    provider's rate limit (``config.rate_limit`` per minute), concurrency
+    cap and wait queue (``config.settings["limits"]``, see
+    ProviderLimiter) and pauses the provider when upstream answers 429
+    or 503 with Retry-After.
+    
+    Transient failures are retried there too, per ``retry_policy``
+    (``config.settings["retry"]``, deadline defaulting to
+    ``config.timeout``) and within the provider's ``retry_budget``.
+    
+    ``embed`` batches concurrent callers into one upstream request
+    (``config.settings["embed_batch"]``, see EmbeddingBatcher); providers
+    with an embeddings API implement ``_embed_batch``.
+    """
     
     def __init__(self, config: ProviderConfig):
         self.config = config
-        self.client = httpx.AsyncClient(timeout=config.timeout)
+        self.client = httpx.AsyncClient(
+            timeout=config.timeout,
+            limits=httpx.Limits(**config.settings.get("pool", {}))
+        )
+        self.limiter = ProviderLimiter(config.rate_limit, **config.settings.get("limits", {}))
+        self.retry_policy = RetryPolicy(**{"deadline": config.timeout, **config.settings.get("retry", {})})
+        self.retry_budget = RetryBudget()
+        self.embedder = EmbeddingBatcher(self._embed_batch, **config.settings.get("embed_batch", {}))
         self._request_count = 0
         self._last_request_time = datetime.now(timezone.utc)
     
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Send a completion request, retrying transient failures
+        
+        Returns:
+            The final response, which may still be an error status
+            
+        Raises:
+            ProviderError: Connection failure that was not (or no longer) retried
+        """
+        policy = self.retry_policy
+        started = time.monotonic()
+        self.retry_budget.deposit()
+        
+        for attempt in range(policy.max_attempts):
+            response, error, retry_after = None, None, None
+            try:
+                async with self.limiter.slot():
+                    self._request_count += 1
+                    self._last_request_time = datetime.now(timezone.utc)
+                    response = await self.client.request(method, url, **kwargs)
+            except httpx.HTTPError as e:
+                error = e
+                if not policy.is_retryable_exception(e):
+                    break
+            else:
+                retry_after = self._note_throttling(response)
+                if not policy.is_retryable_status(response.status_code):
+                    return response
+            
+            delay = policy.backoff(attempt, retry_after)
+            if attempt + 1 >= policy.max_attempts:
+                break
+            if policy.deadline is not None and time.monotonic() - started + delay > policy.deadline:
+                break
+            if not self.retry_budget.withdraw():
+                logger.warning(f"Retry budget exhausted for provider {self.config.name}")
+                break
+            
+            reason = type(error).__name__ if error else f"HTTP {response.status_code}"
+            logger.info(f"Retrying {self.config.name} in {delay:.2f}s after {reason} (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+        
+        if response is not None:
+            return response
+        # Only the exception type: messages can carry URLs with API keys
+        raise ProviderError(
+            f"{self.config.name} request failed: {type(error).__name__}",
+            retryable=policy.is_retryable_exception(error)
+        ) from error
+    
+    def _note_throttling(self, response: httpx.Response) -> Optional[float]:
+        """Pause the provider for an upstream Retry-After; returns the delay"""
+        if response.status_code not in (429, 503):
+            return None
+        retry_after = parse_retry_after(response.headers.get("retry-after"))
+        if retry_after:
+            self.limiter.penalize(retry_after)
+        return retry_after
+    
+    def _error(self, response: httpx.Response, label: str, *path: str) -> ProviderError:
+        """
+        ProviderError for an error response; ``path`` locates the message
+        in the JSON body, otherwise the status code is reported
+        """
+        message = str(response.status_code)
+        if path:
+            message = "Unknown error"
+            try:
+                value = response.json()
+                for key in path:
+                    value = value.get(key, {}) if isinstance(value, dict) else {}
+                if isinstance(value, str) and value:
+                    message = value
+            except ValueError:
+                pass
+        return ProviderError(
+            f"{label} error: {message}",
+            status_code=response.status_code,
+            retryable=self.retry_policy.is_retryable_status(response.status_code),
+            retry_after=parse_retry_after(response.headers.get("retry-after"))
+        )
+    
     @abstractmethod
     async def chat(
         self, 
@@ -82,6 +247,41 @@ class BaseProvider(ABC):
         """Send chat completion request"""
         pass
     
+    async def stream_chat(
+        self,
+        messages: List[ChatMessage],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Stream the reply; providers without streaming yield it whole"""
+        response = await self.chat(messages, model, **kwargs)
+        yield response.content
+    
+    async def embed(self, texts: List[str], model: Optional[str] = None) -> Embeddings:
+        """
+        Embed texts with the provider's embedding model
+        
+        Args:
+            texts: Texts to embed
+            model: Embedding model (default ``settings["embedding_model"]``)
+            
+        Returns:
+            One float32 vector per text (see as_float32)
+        """
+        if not texts:
+            return as_float32([])
+        return as_float32(await self.embedder.embed(list(texts), model))
+    
+    async def _embed_batch(self, texts: List[str], model: Optional[str]) -> List[List[float]]:
+        """Send one embeddings request; returns one vector per text"""
+        raise ProviderError(f"Provider {self.config.name} does not support embeddings")
+    
+    def _embedding_model(self, model: Optional[str], default: Optional[str] = None) -> str:
+        model = model or self.config.settings.get("embedding_model") or default
+        if not model:
+            raise ProviderError(f"Provider {self.config.name} has no embedding model configured")
+        return model
+    
     @abstractmethod
     async def list_models(self) -> List[str]:
         """List available models"""
@@ -97,12 +297,42 @@ class BaseProvider(ABC):
         await self.client.aclose()
 
 
+@dataclass
+class ModelLoadStats:
+    """Usage and load history of one local model"""
+    requests: int = 0
+    cold_starts: int = 0
+    preloads: int = 0
+    last_load_ms: float = 0.0
+    # Requests since the warm-up manager last looked
+    recent_requests: int = 0
+
+
 class OllamaProvider(BaseProvider):
-    """Ollama local LLM provider"""
+    """
+    Ollama local LLM provider
+    
+    Uses the native ``/api/chat`` endpoint so each model's own chat
+    template is applied. Every request carries ``keep_alive`` (from
+    ``config.settings["keep_alive"]``, default "5m"); pinned models are
+    sent ``keep_alive=-1`` and stay loaded. A response whose
+    ``load_duration`` exceeds ``settings["cold_load_ms"]`` counts as a
+    cold start of that model.
+    """
+    
+    DEFAULT_KEEP_ALIVE = "5m"
+    COLD_LOAD_MS = 500.0
     
     def __init__(self, config: ProviderConfig):
         config.base_url = config.base_url or "http://127.0.0.1:11434"
         super().__init__(config)
+        self.keep_alive = config.settings.get("keep_alive", self.DEFAULT_KEEP_ALIVE)
+        self.cold_load_ms = config.settings.get("cold_load_ms", self.COLD_LOAD_MS)
+        self.pinned: Set[str] = set(config.settings.get("pinned", []))
+        self.model_stats: Dict[str, ModelLoadStats] = {}
+    
+    def keep_alive_for(self, model: str) -> Union[str, int]:
+        return -1 if model in self.pinned else self.keep_alive
     
     async def chat(
         self, 
@@ -113,32 +343,96 @@ class OllamaProvider(BaseProvider):
         model = model or self.config.default_model or "llama3.2:3b"
         start_time = datetime.now(timezone.utc)
         
-        # Convert messages to Ollama format
-        prompt = "\n".join([f"{m.role}: {m.content}" for m in messages])
-        
-        response = await self.client.post(
-            f"{self.config.base_url}/api/generate",
+        response = await self._request(
+            "POST",
+            f"{self.config.base_url}/api/chat",
             json={
                 "model": model,
-                "prompt": prompt,
+                "messages": [m.to_dict() for m in messages],
                 "stream": False,
+                "keep_alive": kwargs.pop("keep_alive", self.keep_alive_for(model)),
                 **kwargs
             }
         )
         
         if response.status_code != 200:
-            raise Exception(f"Ollama error: {response.status_code}")
+            raise self._error(response, "Ollama", "error")
         
         data = response.json()
         latency = (datetime.now(timezone.utc) - start_time).total_seconds() * 1000
+        # Model load plus prompt evaluation precede the first token (ns)
+        ttft_ns = data.get("load_duration", 0) + data.get("prompt_eval_duration", 0)
+        
+        stats = self._stats(model)
+        stats.requests += 1
+        stats.recent_requests += 1
+        self._record_load(model, data.get("load_duration", 0))
         
         return ChatResponse(
-            content=data.get("response", ""),
+            content=data.get("message", {}).get("content", ""),
             model=model,
             provider="ollama",
             tokens_used=data.get("eval_count"),
-            latency_ms=int(latency)
+            finish_reason=data.get("done_reason"),
+            latency_ms=int(latency),
+            ttft_ms=int(ttft_ns / 1e6) if ttft_ns else None
+        )
+    
+    async def load(self, model: str, keep_alive: Optional[Union[str, int]] = None) -> float:
+        """
+        Load a model (or refresh its keep-alive) without generating
+        
+        Returns:
+            Load time in milliseconds; near zero if it was already loaded
+        """
+        response = await self.client.post(
+            f"{self.config.base_url}/api/chat",
+            json={
+                "model": model,
+                "messages": [],
+                "keep_alive": self.keep_alive_for(model) if keep_alive is None else keep_alive
+            }
+        )
+        if response.status_code != 200:
+            raise self._error(response, "Ollama", "error")
+        
+        load_ms = response.json().get("load_duration", 0) / 1e6
+        stats = self._stats(model)
+        stats.preloads += 1
+        stats.last_load_ms = load_ms
+        return load_ms
+    
+    async def loaded_models(self) -> List[str]:
+        """Models currently resident in Ollama's memory"""
+        response = await self.client.get(f"{self.config.base_url}/api/ps")
+        if response.status_code != 200:
+            raise self._error(response, "Ollama", "error")
+        return [m.get("name") for m in response.json().get("models", [])]
+    
+    async def _embed_batch(self, texts: List[str], model: Optional[str]) -> List[List[float]]:
+        model = self._embedding_model(model, "nomic-embed-text")
+        response = await self._request(
+            "POST",
+            f"{self.config.base_url}/api/embed",
+            json={"model": model, "input": texts, "keep_alive": self.keep_alive_for(model)}
         )
+        if response.status_code != 200:
+            raise self._error(response, "Ollama", "error")
+        return response.json().get("embeddings", [])
+    
+    def _stats(self, model: str) -> ModelLoadStats:
+        stats = self.model_stats.get(model)
+        if stats is None:
+            stats = self.model_stats[model] = ModelLoadStats()
+        return stats
+    
+    def _record_load(self, model: str, load_ns: int):
+        load_ms = load_ns / 1e6
+        stats = self._stats(model)
+        stats.last_load_ms = load_ms
+        if load_ms > self.cold_load_ms:
+            stats.cold_starts += 1
+            logger.info(f"Cold start of Ollama model {model}: loaded in {load_ms:.0f}ms")
     
     async def list_models(self) -> List[str]:
         try:
@@ -158,36 +452,59 @@ class OllamaProvider(BaseProvider):
             return False
 
 
-class OpenAIProvider(BaseProvider):
-    """OpenAI API provider"""
+class OpenAICompatibleProvider(BaseProvider):
+    """
+    Any server speaking the OpenAI chat completions API
     
-    MODELS = [
-        "gpt-4o", "gpt-4o-mini", "gpt-4-turbo", "gpt-4", 
-        "gpt-3.5-turbo", "o1-preview", "o1-mini"
-    ]
+    Registered as ProviderType.CUSTOM for local inference servers with
+    continuous batching (vLLM, llama.cpp server, TGI); ``base_url`` is
+    required, e.g. ``http://127.0.0.1:8000/v1``, and ``api_key`` is only
+    sent when set. Connections are pooled per provider (see
+    ``settings["pool"]``) and ``stream_chat`` yields tokens as the
+    server produces them.
+    """
+    
+    LABEL = "Custom"
+    # Name reported in responses; None reports the provider's own name
+    PROVIDER: Optional[str] = None
+    DEFAULT_MODEL: Optional[str] = None
+    DEFAULT_EMBEDDING_MODEL: Optional[str] = None
     
     def __init__(self, config: ProviderConfig):
-        config.base_url = config.base_url or "https://api.openai.com/v1"
+        if not config.base_url:
+            raise ValueError(f"Provider {config.name} needs a base_url")
+        config.base_url = config.base_url.rstrip("/")
         super().__init__(config)
     
+    def _check_ready(self):
+        """Raise if the provider cannot send requests yet"""
+    
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.config.api_key:
+            headers["Authorization"] = f"Bearer {self.config.api_key}"
+        return headers
+    
+    def _model(self, model: Optional[str]) -> str:
+        model = model or self.config.default_model or self.DEFAULT_MODEL
+        if not model:
+            raise ProviderError(f"{self.LABEL} provider {self.config.name} has no model configured")
+        return model
+    
     async def chat(
         self, 
         messages: List[ChatMessage], 
         model: Optional[str] = None,
         **kwargs
     ) -> ChatResponse:
-        if not self.config.api_key:
-            raise Exception("OpenAI API key not configured")
-        
-        model = model or self.config.default_model or "gpt-4o-mini"
+        self._check_ready()
+        model = self._model(model)
         start_time = datetime.now(timezone.utc)
         
-        response = await self.client.post(
+        response = await self._request(
+            "POST",
             f"{self.config.base_url}/chat/completions",
-            headers={
-                "Authorization": f"Bearer {self.config.api_key}",
-                "Content-Type": "application/json"
-            },
+            headers=self._headers(),
             json={
                 "model": model,
                 "messages": [m.to_dict() for m in messages],
@@ -196,8 +513,7 @@ class OpenAIProvider(BaseProvider):
         )
         
         if response.status_code != 200:
-            error = response.json().get("error", {}).get("message", "Unknown error")
-            raise Exception(f"OpenAI error: {error}")
+            raise self._error(response, self.LABEL, "error", "message")
         
         data = response.json()
         latency = (datetime.now(timezone.utc) - start_time).total_seconds() * 1000
@@ -206,12 +522,108 @@ class OpenAIProvider(BaseProvider):
         return ChatResponse(
             content=choice.get("message", {}).get("content", ""),
             model=model,
-            provider="openai",
+            provider=self.PROVIDER or self.config.name,
             tokens_used=data.get("usage", {}).get("total_tokens"),
             finish_reason=choice.get("finish_reason"),
             latency_ms=int(latency)
         )
     
+    async def stream_chat(
+        self,
+        messages: List[ChatMessage],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """Yield content deltas from a server-sent-events completion"""
+        self._check_ready()
+        model = self._model(model)
+        
+        async with self.limiter.slot():
+            self._request_count += 1
+            self._last_request_time = datetime.now(timezone.utc)
+            async with self.client.stream(
+                "POST",
+                f"{self.config.base_url}/chat/completions",
+                headers=self._headers(),
+                json={
+                    "model": model,
+                    "messages": [m.to_dict() for m in messages],
+                    "stream": True,
+                    **kwargs
+                }
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    self._note_throttling(response)
+                    raise self._error(response, self.LABEL, "error", "message")
+                
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(payload)
+                    except ValueError:
+                        continue
+                    choices = chunk.get("choices") or [{}]
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+    
+    async def _embed_batch(self, texts: List[str], model: Optional[str]) -> List[List[float]]:
+        self._check_ready()
+        response = await self._request(
+            "POST",
+            f"{self.config.base_url}/embeddings",
+            headers=self._headers(),
+            json={"model": self._embedding_model(model, self.DEFAULT_EMBEDDING_MODEL), "input": texts}
+        )
+        if response.status_code != 200:
+            raise self._error(response, self.LABEL, "error", "message")
+        data = sorted(response.json().get("data", []), key=lambda item: item.get("index", 0))
+        return [item.get("embedding", []) for item in data]
+    
+    async def list_models(self) -> List[str]:
+        try:
+            response = await self.client.get(f"{self.config.base_url}/models", headers=self._headers())
+            if response.status_code == 200:
+                return [m.get("id") for m in response.json().get("data", [])]
+        except Exception as e:
+            logger.error(f"Failed to list models from {self.config.name}: {e}")
+        return list(self.config.models)
+    
+    async def health_check(self) -> bool:
+        try:
+            response = await self.client.get(
+                f"{self.config.base_url}/models", headers=self._headers(), timeout=5.0
+            )
+            return response.status_code == 200
+        except Exception:
+            return False
+
+
+class OpenAIProvider(OpenAICompatibleProvider):
+    """OpenAI API provider"""
+    
+    LABEL = "OpenAI"
+    PROVIDER = "openai"
+    DEFAULT_MODEL = "gpt-4o-mini"
+    DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+    MODELS = [
+        "gpt-4o", "gpt-4o-mini", "gpt-4-turbo", "gpt-4", 
+        "gpt-3.5-turbo", "o1-preview", "o1-mini"
+    ]
+    
+    def __init__(self, config: ProviderConfig):
+        config.base_url = config.base_url or "https://api.openai.com/v1"
+        super().__init__(config)
+    
+    def _check_ready(self):
+        if not self.config.api_key:
+            raise ProviderError("OpenAI API key not configured")
+    
     async def list_models(self) -> List[str]:
         return self.MODELS
     
@@ -239,7 +651,7 @@ class AnthropicProvider(BaseProvider):
         **kwargs
     ) -> ChatResponse:
         if not self.config.api_key:
-            raise Exception("Anthropic API key not configured")
+            raise ProviderError("Anthropic API key not configured")
         
         model = model or self.config.default_model or "claude-3-5-sonnet-20241022"
         start_time = datetime.now(timezone.utc)
@@ -253,7 +665,8 @@ class AnthropicProvider(BaseProvider):
             else:
                 chat_messages.append(m.to_dict())
         
-        response = await self.client.post(
+        response = await self._request(
+            "POST",
             f"{self.config.base_url}/messages",
             headers={
                 "x-api-key": self.config.api_key,
@@ -269,8 +682,7 @@ class AnthropicProvider(BaseProvider):
         )
         
         if response.status_code != 200:
-            error = response.json().get("error", {}).get("message", "Unknown error")
-            raise Exception(f"Anthropic error: {error}")
+            raise self._error(response, "Anthropic", "error", "message")
         
         data = response.json()
         latency = (datetime.now(timezone.utc) - start_time).total_seconds() * 1000
@@ -307,7 +719,7 @@ class GoogleProvider(BaseProvider):
         **kwargs
     ) -> ChatResponse:
         if not self.config.api_key:
-            raise Exception("Google API key not configured")
+            raise ProviderError("Google API key not configured")
         
         model = model or self.config.default_model or "gemini-1.5-flash"
         start_time = datetime.now(timezone.utc)
@@ -321,7 +733,8 @@ class GoogleProvider(BaseProvider):
                 "parts": [{"text": m.content}]
             })
         
-        response = await self.client.post(
+        response = await self._request(
+            "POST",
             f"{self.config.base_url}/models/{model}:generateContent",
             headers={"Content-Type": "application/json"},
             params={"key": self.config.api_key},
@@ -329,8 +742,7 @@ class GoogleProvider(BaseProvider):
         )
         
         if response.status_code != 200:
-            error = response.json().get("error", {}).get("message", "Unknown error")
-            raise Exception(f"Google error: {error}")
+            raise self._error(response, "Google", "error", "message")
         
         data = response.json()
         latency = (datetime.now(timezone.utc) - start_time).total_seconds() * 1000
@@ -344,6 +756,26 @@ class GoogleProvider(BaseProvider):
             latency_ms=int(latency)
         )
     
+    async def _embed_batch(self, texts: List[str], model: Optional[str]) -> List[List[float]]:
+        if not self.config.api_key:
+            raise ProviderError("Google API key not configured")
+        
+        model = self._embedding_model(model, "text-embedding-004")
+        response = await self._request(
+            "POST",
+            f"{self.config.base_url}/models/{model}:batchEmbedContents",
+            headers={"Content-Type": "application/json"},
+            params={"key": self.config.api_key},
+            json={"requests": [
+                {"model": f"models/{model}", "content": {"parts": [{"text": text}]}}
+                for text in texts
+            ]}
+        )
+        
+        if response.status_code != 200:
+            raise self._error(response, "Google", "error", "message")
+        return [item.get("values", []) for item in response.json().get("embeddings", [])]
+    
     async def list_models(self) -> List[str]:
         return self.MODELS
     
@@ -371,12 +803,13 @@ class MistralProvider(BaseProvider):
         **kwargs
     ) -> ChatResponse:
         if not self.config.api_key:
-            raise Exception("Mistral API key not configured")
+            raise ProviderError("Mistral API key not configured")
         
         model = model or self.config.default_model or "mistral-small-latest"
         start_time = datetime.now(timezone.utc)
         
-        response = await self.client.post(
+        response = await self._request(
+            "POST",
             f"{self.config.base_url}/chat/completions",
             headers={
                 "Authorization": f"Bearer {self.config.api_key}",
@@ -390,8 +823,7 @@ class MistralProvider(BaseProvider):
         )
         
         if response.status_code != 200:
-            error = response.json().get("message", "Unknown error")
-            raise Exception(f"Mistral error: {error}")
+            raise self._error(response, "Mistral", "message")
         
         data = response.json()
         latency = (datetime.now(timezone.utc) - start_time).total_seconds() * 1000
@@ -406,6 +838,25 @@ class MistralProvider(BaseProvider):
             latency_ms=int(latency)
         )
     
+    async def _embed_batch(self, texts: List[str], model: Optional[str]) -> List[List[float]]:
+        if not self.config.api_key:
+            raise ProviderError("Mistral API key not configured")
+        
+        response = await self._request(
+            "POST",
+            f"{self.config.base_url}/embeddings",
+            headers={
+                "Authorization": f"Bearer {self.config.api_key}",
+                "Content-Type": "application/json"
+            },
+            json={"model": self._embedding_model(model, "mistral-embed"), "input": texts}
+        )
+        
+        if response.status_code != 200:
+            raise self._error(response, "Mistral", "message")
+        data = sorted(response.json().get("data", []), key=lambda item: item.get("index", 0))
+        return [item.get("embedding", []) for item in data]
+    
     async def list_models(self) -> List[str]:
         return self.MODELS
     
@@ -417,11 +868,50 @@ class ProviderManager:
     """
     Central manager for all LLM providers
     Handles provider registration, selection, and failover
+    
+    Every provider has a circuit breaker (configured from
+    ``config.settings["circuit_breaker"]``). ``chat`` walks a fallback
+    chain and skips providers whose breaker is open, so while a provider
+    is down requests move on without waiting for its timeout.
+    
+    Balanced chains are reordered per request by ``router`` so each
+    request goes to the provider with the lowest expected latency.
+    
+    Health checks and model lists are probed concurrently, each bounded
+    by ``probe_timeout``, and cached for ``cache_ttl`` seconds; the
+    optional background prober keeps the cache fresh.
+    
+    With a ``hedging`` policy, a first attempt that runs past its
+    route's usual latency is duplicated to the next candidate in the
+    chain and the slower of the two is cancelled.
+    
+    Unless ``coalesce`` is off, concurrent identical requests (same
+    session, provider, model, messages and parameters) share one
+    upstream call, streams included. Requests are only merged across
+    callers when neither gives a ``session_id``.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        router: Optional[LatencyRouter] = None,
+        probe_timeout: float = 5.0,
+        cache_ttl: float = 30.0,
+        hedging: Optional[HedgePolicy] = None,
+        coalesce: bool = True
+    ):
         self.providers: Dict[str, BaseProvider] = {}
         self.configs: Dict[str, ProviderConfig] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.fallback_chains: Dict[str, FallbackChain] = {}
+        self.router = router or LatencyRouter()
+        self.hedging = hedging
+        self.single_flight = SingleFlight() if coalesce else None
+        self.probe_timeout = probe_timeout
+        self.cache_ttl = cache_ttl
+        # kind ("health"/"models") -> provider -> (result, probed_at)
+        self._probe_cache: Dict[str, Dict[str, Tuple[Any, float]]] = {"health": {}, "models": {}}
+        self._probes: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._prober: Optional[asyncio.Task] = None
         self._default_provider: Optional[str] = None
     
     def register_provider(self, config: ProviderConfig) -> bool:
@@ -433,6 +923,7 @@ class ProviderManager:
                 ProviderType.ANTHROPIC: AnthropicProvider,
                 ProviderType.GOOGLE: GoogleProvider,
                 ProviderType.MISTRAL: MistralProvider,
+                ProviderType.CUSTOM: OpenAICompatibleProvider,
             }
             
             provider_class = provider_classes.get(config.provider_type)
@@ -442,6 +933,9 @@ class ProviderManager:
             
             self.providers[config.name] = provider_class(config)
             self.configs[config.name] = config
+            self.breakers[config.name] = CircuitBreaker(**config.settings.get("circuit_breaker", {}))
+            for cache in self._probe_cache.values():
+                cache.pop(config.name, None)
             
             if self._default_provider is None:
                 self._default_provider = config.name
@@ -465,40 +959,419 @@ class ProviderManager:
             return True
         return False
     
+    def set_fallback_chain(
+        self,
+        model_class: str,
+        entries: Sequence[Union[str, Tuple[str, Optional[str]]]],
+        attempt_timeout: Optional[float] = None,
+        balanced: bool = False
+    ):
+        """
+        Define the providers tried, in order, for a model class
+        
+        Args:
+            model_class: Name callers pass to ``chat``; the "default" chain
+                backs up requests that name no model class
+            entries: Provider names, or (provider, model) pairs; a model of
+                None uses the provider's default model
+            attempt_timeout: Give up on a candidate after this many seconds
+                when another one remains
+            balanced: Route each request to the entry with the lowest
+                expected latency; the others remain fallbacks. Entries of
+                the balanced "default" chain without a model serve the
+                requested model
+        """
+        self.fallback_chains[model_class] = FallbackChain(
+            [(entry, None) if isinstance(entry, str) else tuple(entry) for entry in entries],
+            attempt_timeout,
+            balanced
+        )
+    
+    def _candidates(
+        self,
+        provider: Optional[str],
+        model: Optional[str],
+        model_class: Optional[str],
+        session_id: Optional[str] = None,
+        stream: bool = False
+    ) -> Tuple[List[Tuple[str, Optional[str]]], Optional[float]]:
+        if model_class is not None:
+            chain = self.fallback_chains.get(model_class)
+            if chain is None:
+                raise ProviderUnavailableError(f"Unknown model class: {model_class}")
+            candidates = list(chain.entries)
+        else:
+            primary = provider or self._default_provider
+            chain = self.fallback_chains.get("default", FallbackChain([]))
+            if chain.balanced and provider is None:
+                # Replicas of the requested model; the default provider is one of them
+                candidates = [(primary, model)] + [
+                    (name, entry_model or model) for name, entry_model in chain.entries
+                ]
+            else:
+                # An explicitly requested provider is tried first, never rerouted
+                return [(primary, model)] + [
+                    entry for entry in chain.entries if entry[0] != primary
+                ], chain.attempt_timeout
+        
+        if chain.balanced:
+            candidates = self.router.order(candidates, session_id, stream=stream)
+        return candidates, chain.attempt_timeout
+    
     async def chat(
         self, 
         messages: List[ChatMessage],
         provider: Optional[str] = None,
         model: Optional[str] = None,
+        model_class: Optional[str] = None,
+        session_id: Optional[str] = None,
         **kwargs
     ) -> ChatResponse:
-        """Send chat request to provider"""
-        prov = self.get_provider(provider)
-        if not prov:
-            raise Exception(f"Provider not found: {provider or self._default_provider}")
+        """
+        Send chat request, failing over to the next healthy provider
         
-        return await prov.chat(messages, model, **kwargs)
+        Args:
+            messages: Conversation so far
+            provider: Preferred provider (default provider if omitted)
+            model: Model for the preferred provider
+            model_class: Use this fallback chain instead of provider/model
+            session_id: Conversation id; balanced chains keep a session on
+                the provider that last served it
+            
+        Returns:
+            ChatResponse from the first provider that succeeds
+        """
+        if self.single_flight is None:
+            return await self._chat(messages, provider, model, model_class, session_id, kwargs)
+        key = self._flight_key("chat", messages, provider, model, model_class, session_id, kwargs)
+        return await self.single_flight.do(
+            key, lambda: self._chat(messages, provider, model, model_class, session_id, kwargs)
+        )
+    
+    async def stream_chat(
+        self,
+        messages: List[ChatMessage],
+        provider: Optional[str] = None,
+        model: Optional[str] = None,
+        model_class: Optional[str] = None,
+        session_id: Optional[str] = None,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Stream a reply, failing over until a provider yields its first chunk
+        
+        Once output has started an error ends the stream, since the
+        chunks already sent cannot be taken back. Arguments are as for
+        ``chat``.
+        """
+        if self.single_flight is None:
+            stream = self._stream_chat(messages, provider, model, model_class, session_id, kwargs)
+        else:
+            key = self._flight_key("stream", messages, provider, model, model_class, session_id, kwargs)
+            stream = self.single_flight.stream(
+                key, lambda: self._stream_chat(messages, provider, model, model_class, session_id, kwargs)
+            )
+        async for chunk in stream:
+            yield chunk
+    
+    @staticmethod
+    def _flight_key(
+        kind: str,
+        messages: List[ChatMessage],
+        provider: Optional[str],
+        model: Optional[str],
+        model_class: Optional[str],
+        session_id: Optional[str],
+        kwargs: Dict[str, Any]
+    ) -> Tuple:
+        return (
+            kind, session_id, provider, model, model_class,
+            tuple((m.role, m.content) for m in messages),
+            json.dumps(kwargs, sort_keys=True, default=str)
+        )
+    
+    async def _stream_chat(
+        self,
+        messages: List[ChatMessage],
+        provider: Optional[str],
+        model: Optional[str],
+        model_class: Optional[str],
+        session_id: Optional[str],
+        kwargs: Dict[str, Any]
+    ) -> AsyncIterator[str]:
+        candidates, _ = self._candidates(provider, model, model_class, session_id, stream=True)
+        last_error: Optional[Exception] = None
+        
+        for name, candidate_model in candidates:
+            if not self._available(name):
+                continue
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                last_error = last_error or CircuitOpenError(
+                    f"Circuit open for provider {name}, retry in {breaker.retry_after():.1f}s"
+                )
+                continue
+            
+            route = (name, candidate_model)
+            routed = self.router.start(route)
+            started = time.monotonic()
+            ttft_ms: Optional[float] = None
+            try:
+                async for chunk in self.providers[name].stream_chat(messages, candidate_model, **kwargs):
+                    if ttft_ms is None:
+                        ttft_ms = (time.monotonic() - started) * 1000
+                    yield chunk
+            except Exception as e:
+                self.router.finish(route, routed, ok=False)
+                if _is_provider_fault(e):
+                    breaker.record_failure()
+                else:
+                    breaker.release()
+                if ttft_ms is not None:
+                    raise
+                logger.warning(f"Provider {name} failed: {type(e).__name__}: {e}")
+                last_error = e
+                continue
+            except BaseException:
+                # Cancelled, or the consumer stopped reading
+                self.router.finish(route, routed, ok=False)
+                breaker.release()
+                raise
+            self.router.finish(route, routed, ttft_ms=ttft_ms, session_id=session_id)
+            breaker.record_success((time.monotonic() - started) * 1000)
+            return
+        
+        if last_error is None:
+            raise ProviderUnavailableError(f"Provider not found: {provider or self._default_provider}")
+        raise last_error
     
-    async def list_all_models(self) -> Dict[str, List[str]]:
-        """List models from all providers"""
-        result = {}
-        for name, provider in self.providers.items():
+    async def _chat(
+        self,
+        messages: List[ChatMessage],
+        provider: Optional[str],
+        model: Optional[str],
+        model_class: Optional[str],
+        session_id: Optional[str],
+        kwargs: Dict[str, Any]
+    ) -> ChatResponse:
+        candidates, attempt_timeout = self._candidates(provider, model, model_class, session_id)
+        last_error: Optional[Exception] = None
+        hedged: Set[int] = set()
+        first = True
+        
+        for index, (name, candidate_model) in enumerate(candidates):
+            if index in hedged or not self._available(name):
+                continue
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                last_error = last_error or CircuitOpenError(
+                    f"Circuit open for provider {name}, retry in {breaker.retry_after():.1f}s"
+                )
+                continue
+            
+            timeout = attempt_timeout if index < len(candidates) - 1 else None
+            call = self._attempt(name, candidate_model, messages, timeout, session_id, kwargs)
             try:
-                result[name] = await provider.list_models()
+                if first and self.hedging is not None:
+                    return await self._hedged(call, candidates, index, hedged, messages, session_id, kwargs)
+                return await call
             except Exception as e:
-                logger.warning(f"Failed to list models from {name}: {e}")
-                result[name] = []
-        return result
-    
-    async def health_check_all(self) -> Dict[str, bool]:
-        """Health check all providers"""
-        result = {}
-        for name, provider in self.providers.items():
+                last_error = e
+            finally:
+                first = False
+        
+        if last_error is None:
+            raise ProviderUnavailableError(f"Provider not found: {provider or self._default_provider}")
+        raise last_error
+    
+    def _available(self, name: str) -> bool:
+        return name in self.providers and self.configs[name].enabled
+    
+    async def _attempt(
+        self,
+        name: str,
+        model: Optional[str],
+        messages: List[ChatMessage],
+        timeout: Optional[float],
+        session_id: Optional[str],
+        kwargs: Dict[str, Any]
+    ) -> ChatResponse:
+        """One call to one candidate, recorded by the router and breaker"""
+        breaker = self.breakers[name]
+        route = (name, model)
+        started = self.router.start(route)
+        attempt_started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(self.providers[name].chat(messages, model, **kwargs), timeout)
+        except BaseException as e:
+            self.router.finish(route, started, ok=False)
+            if not isinstance(e, Exception):
+                # Cancelled (e.g. a losing hedge): no verdict on the provider
+                breaker.release()
+                raise
+            if _is_provider_fault(e):
+                breaker.record_failure()
+            else:
+                breaker.release()
+            logger.warning(f"Provider {name} failed: {type(e).__name__}: {e}")
+            raise
+        
+        latency_ms = (time.monotonic() - attempt_started) * 1000
+        self.router.finish(route, started, ttft_ms=response.ttft_ms, session_id=session_id)
+        breaker.record_success(latency_ms)
+        if self.hedging is not None:
+            self.hedging.observe(route, latency_ms)
+        return response
+    
+    async def _hedged(
+        self,
+        call,
+        candidates: List[Tuple[str, Optional[str]]],
+        index: int,
+        hedged: Set[int],
+        messages: List[ChatMessage],
+        session_id: Optional[str],
+        kwargs: Dict[str, Any]
+    ) -> ChatResponse:
+        """
+        Run ``call`` for ``candidates[index]``, hedging it to the next
+        closed-circuit candidate if it is slower than usual
+        
+        The hedge's index is added to ``hedged`` so failover does not try
+        it again.
+        """
+        policy = self.hedging
+        policy.requests += 1
+        policy.budget.deposit()
+        primary = asyncio.ensure_future(call)
+        tasks = [primary]
+        try:
+            delay = policy.delay(candidates[index])
+            if delay is None:
+                return await primary
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done:
+                return primary.result()
+            
+            target = next((
+                i for i in range(index + 1, len(candidates))
+                if self._available(candidates[i][0])
+                and self.breakers[candidates[i][0]].state == CircuitState.CLOSED
+            ), None)
+            if target is None:
+                return await primary
+            if not policy.budget.withdraw():
+                policy.over_budget += 1
+                return await primary
+            
+            hedged.add(target)
+            policy.hedged += 1
+            name, model = candidates[target]
+            hedge = asyncio.ensure_future(self._attempt(name, model, messages, None, session_id, kwargs))
+            tasks.append(hedge)
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            policy.hedge_wins += 1
+                        else:
+                            policy.hedge_losses += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def embed(
+        self,
+        texts: List[str],
+        provider: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> Embeddings:
+        """Embed texts with a provider (default provider if omitted)"""
+        name = provider or self._default_provider
+        if name not in self.providers or not self.configs[name].enabled:
+            raise ProviderUnavailableError(f"Provider not found: {name}")
+        return await self.providers[name].embed(texts, model)
+    
+    async def list_all_models(self, max_age: Optional[float] = None) -> Dict[str, List[str]]:
+        """
+        List models from all providers
+        
+        Args:
+            max_age: Re-query providers whose cached list is older than
+                this many seconds (default ``cache_ttl``); 0 forces a
+                refresh, ``math.inf`` only fills gaps
+        """
+        models = await self._collect("models", max_age)
+        return {name: list(value) for name, value in models.items()}
+    
+    async def health_check_all(self, max_age: Optional[float] = None) -> Dict[str, bool]:
+        """Health check all providers; ``max_age`` as for list_all_models"""
+        return await self._collect("health", max_age)
+    
+    async def _collect(self, kind: str, max_age: Optional[float]) -> Dict[str, Any]:
+        """Probe providers with missing or stale results concurrently"""
+        cache = self._probe_cache[kind]
+        max_age = self.cache_ttl if max_age is None else max_age
+        now = time.monotonic()
+        stale = [
+            name for name in self.providers
+            if name not in cache or now - cache[name][1] >= max_age
+        ]
+        if stale:
+            await asyncio.gather(*(self._probe(kind, name) for name in stale))
+        return {name: cache[name][0] for name in self.providers if name in cache}
+    
+    async def _probe(self, kind: str, name: str) -> Any:
+        # One probe per provider at a time; concurrent callers share it
+        key = (kind, name)
+        task = self._probes.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._run_probe(kind, name))
+            self._probes[key] = task
+            task.add_done_callback(lambda _: self._probes.pop(key, None))
+        return await asyncio.shield(task)
+    
+    async def _run_probe(self, kind: str, name: str) -> Any:
+        provider = self.providers[name]
+        cache = self._probe_cache[kind]
+        try:
+            call = provider.health_check() if kind == "health" else provider.list_models()
+            value = await asyncio.wait_for(call, self.probe_timeout)
+        except Exception as e:
+            logger.warning(f"Provider {name} {kind} probe failed: {type(e).__name__}: {e}")
+            # A failed listing keeps the last known models
+            value = False if kind == "health" else cache.get(name, ([], 0.0))[0]
+        cache[name] = (value, time.monotonic())
+        return value
+    
+    async def run_prober(self, interval: float = 15.0):
+        """Refresh health and model lists periodically until cancelled"""
+        while True:
             try:
-                result[name] = await provider.health_check()
-            except Exception:
-                result[name] = False
-        return result
+                await asyncio.gather(
+                    self.health_check_all(max_age=0),
+                    self.list_all_models(max_age=0)
+                )
+            except Exception as e:
+                logger.error(f"Provider probe failed: {e}")
+            await asyncio.sleep(interval)
+    
+    def start_prober(self, interval: float = 15.0):
+        """Start the background prober on the running event loop"""
+        if self._prober is None or self._prober.done():
+            self._prober = asyncio.create_task(self.run_prober(interval))
+    
+    def stop_prober(self):
+        if self._prober is not None:
+            self._prober.cancel()
+            self._prober = None
     
     def get_status(self) -> Dict[str, Any]:
         """Get status of all providers"""
@@ -509,14 +1382,30 @@ class ProviderManager:
                     "type": config.provider_type.value,
                     "enabled": config.enabled,
                     "default_model": config.default_model,
-                    "base_url": config.base_url
+                    "base_url": config.base_url,
+                    "healthy": self._probe_cache["health"].get(name, (None,))[0],
+                    "circuit": self.breakers[name].snapshot(),
+                    "limits": self.providers[name].limiter.snapshot(),
+                    "retry_budget": round(self.providers[name].retry_budget.balance, 2),
+                    "embeddings": self.providers[name].embedder.snapshot()
                 }
                 for name, config in self.configs.items()
+            },
+            "routes": self.router.snapshot(),
+            "hedging": self.hedging.snapshot() if self.hedging is not None else None,
+            "coalescing": self.single_flight.snapshot() if self.single_flight is not None else None,
+            "fallback_chains": {
+                model_class: [
+                    {"provider": provider, "model": model}
+                    for provider, model in chain.entries
+                ]
+                for model_class, chain in self.fallback_chains.items()
             }
         }
     
     async def close_all(self):
         """Close all provider connections"""
+        self.stop_prober()
         for provider in self.providers.values():
             await provider.close()
 
@@ -529,7 +1418,8 @@ def get_provider_manager() -> ProviderManager:
     """Get or create singleton provider manager"""
     global _provider_manager
     if _provider_manager is None:
-        _provider_manager = ProviderManager()
+        hedging = os.getenv("CLOSEDPAW_REQUEST_HEDGING", "").lower() in ("1", "true", "yes")
+        _provider_manager = ProviderManager(hedging=HedgePolicy() if hedging else None)
         
         # Register default Ollama provider
         _provider_manager.register_provider(ProviderConfig(
@@ -0,0 +1,113 @@
+"""
+ClosedPaw - Retry Policy
+Error classification, jittered backoff and retry budgets for provider calls
+"""
+
+import time
+import random
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, FrozenSet, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+# Failures where the request never reached the model, or the connection
+# dropped before an answer; read/write timeouts are not retried because
+# the provider may still be generating
+RETRYABLE_EXCEPTIONS = (
+    httpx.ConnectError,
+    httpx.ConnectTimeout,
+    httpx.PoolTimeout,
+    httpx.ReadError,
+    httpx.RemoteProtocolError,
+)
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Capped exponential backoff with full jitter
+
+    Attempt ``n`` (0-based) sleeps a random time in
+    ``[0, min(max_delay, base_delay * 2**n)]``, or the upstream
+    Retry-After if that is longer. No retry starts once ``deadline``
+    seconds have passed since the first attempt, or if its sleep would
+    run past the deadline.
+    """
+    max_attempts: int = 3
+    base_delay: float = 0.25
+    max_delay: float = 8.0
+    deadline: Optional[float] = 30.0
+    retry_statuses: FrozenSet[int] = field(
+        default_factory=lambda: frozenset({408, 429, 500, 502, 503, 504})
+    )
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in self.retry_statuses
+
+    @staticmethod
+    def is_retryable_exception(error: BaseException) -> bool:
+        return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None, rng: random.Random = random) -> float:
+        delay = rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class RetryBudget:
+    """
+    Caps retries at a fraction of recent traffic
+
+    Every first attempt deposits ``ratio`` tokens and every retry spends
+    one, on top of a trickle of ``min_per_second`` tokens so low-traffic
+    providers can still retry. The balance starts at ``initial_balance``
+    (default: full) and never exceeds ``max_balance``.
+    During an outage the budget drains and further failures surface at
+    once instead of multiplying load on the struggling upstream.
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.2,
+        min_per_second: float = 0.5,
+        max_balance: float = 20.0,
+        clock: Callable[[], float] = time.monotonic,
+        initial_balance: Optional[float] = None
+    ):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self._clock = clock
+        self._balance = max_balance if initial_balance is None else initial_balance
+        self._updated = clock()
+        self.exhausted = 0
+
+    @property
+    def balance(self) -> float:
+        self._trickle()
+        return self._balance
+
+    def deposit(self):
+        self._trickle()
+        self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Spend one retry; False when the budget is exhausted"""
+        self._trickle()
+        if self._balance < 1.0:
+            self.exhausted += 1
+            return False
+        self._balance -= 1.0
+        return True
+
+    def _trickle(self):
+        now = self._clock()
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._balance = min(self.max_balance, self._balance + elapsed * self.min_per_second)
+            self._updated = now
@@ -0,0 +1,174 @@
+"""
+ClosedPaw - Latency-Aware Routing
+Picks the provider with the lowest expected latency for each request
+"""
+
+import time
+import random
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (provider name, model or None)
+RouteKey = Tuple[str, Optional[str]]
+
+
+@dataclass
+class RouteStats:
+    """Moving averages and load for one provider/model"""
+    ewma_latency_ms: float = 0.0
+    ewma_ttft_ms: float = 0.0
+    outstanding: int = 0
+    samples: int = 0
+    ttft_samples: int = 0
+
+
+class LatencyRouter:
+    """
+    Expected-latency routing with session stickiness
+
+    Each (provider, model) keeps an EWMA of request latency and of
+    time-to-first-token, plus its count of outstanding requests. The
+    expected latency of sending one more request is
+    ``ewma_latency * (outstanding + 1)``; targets never measured score 0
+    so they get tried. Streams are ranked by time-to-first-token instead,
+    once it has been measured, since that is the wait a streaming caller
+    sees. ``strategy`` is "p2c" (power of two choices:
+    compare two random candidates, which avoids herding onto one target
+    between measurements) or "least_outstanding" (compare all).
+
+    A session keeps its target for ``sticky_ttl`` seconds after its last
+    request so a conversation stays on one warm model.
+    """
+
+    STRATEGIES = ("p2c", "least_outstanding")
+
+    def __init__(
+        self,
+        alpha: float = 0.3,
+        strategy: str = "p2c",
+        sticky_ttl: float = 600.0,
+        max_sessions: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+        rng: Optional[random.Random] = None
+    ):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.alpha = alpha
+        self.strategy = strategy
+        self.sticky_ttl = sticky_ttl
+        self.max_sessions = max_sessions
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self._stats: Dict[RouteKey, RouteStats] = {}
+        # session_id -> (target, expires_at); insertion order == expiry order
+        self._sessions: "OrderedDict[str, Tuple[RouteKey, float]]" = OrderedDict()
+
+    def stats(self, key: RouteKey) -> RouteStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = RouteStats()
+        return stats
+
+    def expected_latency(self, key: RouteKey, stream: bool = False) -> float:
+        stats = self.stats(key)
+        latency = stats.ewma_ttft_ms if stream and stats.ttft_samples else stats.ewma_latency_ms
+        return latency * (stats.outstanding + 1)
+
+    def order(
+        self,
+        candidates: Sequence[RouteKey],
+        session_id: Optional[str] = None,
+        stream: bool = False
+    ) -> List[RouteKey]:
+        """
+        Candidates with the chosen target first and the rest by expected
+        latency, to serve as the fallback order
+        """
+        candidates = list(dict.fromkeys(candidates))
+        if len(candidates) < 2:
+            return candidates
+        expected = lambda key: self.expected_latency(key, stream)
+
+        chosen = self._sticky(session_id, candidates)
+        if chosen is None:
+            if self.strategy == "p2c":
+                pool = self._rng.sample(candidates, 2)
+            else:
+                pool = candidates
+            chosen = min(pool, key=expected)
+        rest = sorted((c for c in candidates if c != chosen), key=expected)
+        return [chosen] + rest
+
+    def start(self, key: RouteKey) -> float:
+        """Count a request as outstanding; returns its start time"""
+        self.stats(key).outstanding += 1
+        return self._clock()
+
+    def finish(
+        self,
+        key: RouteKey,
+        started: float,
+        ok: bool = True,
+        ttft_ms: Optional[float] = None,
+        session_id: Optional[str] = None
+    ):
+        """
+        Record the end of a request; only successes update the averages
+        and rebind the session
+        """
+        stats = self.stats(key)
+        stats.outstanding = max(0, stats.outstanding - 1)
+        if not ok:
+            return
+        latency_ms = (self._clock() - started) * 1000
+        stats.ewma_latency_ms = self._ewma(stats.ewma_latency_ms, latency_ms, stats.samples)
+        stats.samples += 1
+        if ttft_ms is not None:
+            stats.ewma_ttft_ms = self._ewma(stats.ewma_ttft_ms, ttft_ms, stats.ttft_samples)
+            stats.ttft_samples += 1
+        if session_id is not None:
+            self._bind(session_id, key)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "provider": provider,
+                "model": model,
+                "ewma_latency_ms": round(stats.ewma_latency_ms, 1),
+                "ewma_ttft_ms": round(stats.ewma_ttft_ms, 1),
+                "outstanding": stats.outstanding,
+                "samples": stats.samples,
+            }
+            for (provider, model), stats in self._stats.items()
+        ]
+
+    def _ewma(self, current: float, sample: float, samples: int) -> float:
+        # The first sample seeds the average instead of being damped toward 0
+        return sample if samples == 0 else current + self.alpha * (sample - current)
+
+    def _sticky(self, session_id: Optional[str], candidates: List[RouteKey]) -> Optional[RouteKey]:
+        if session_id is None:
+            return None
+        self._expire_sessions()
+        bound = self._sessions.get(session_id)
+        if bound is not None and bound[0] in candidates:
+            return bound[0]
+        return None
+
+    def _bind(self, session_id: str, key: RouteKey):
+        self._sessions.pop(session_id, None)
+        self._sessions[session_id] = (key, self._clock() + self.sticky_ttl)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def _expire_sessions(self):
+        now = self._clock()
+        while self._sessions:
+            session_id, (_, expires_at) = next(iter(self._sessions.items()))
+            if expires_at > now:
+                return
+            del self._sessions[session_id]
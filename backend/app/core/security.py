@@ -4,13 +4,34 @@ Prompt injection defense and input validation
 Based on lessons from OpenClaw CVE-2026-25253
 """
 
+import os
+import asyncio
 import re
+import json
+import time
+import string
+import heapq
+import hashlib
 import logging
-from typing import Dict, List, Optional
+import threading
+from collections import OrderedDict, deque
+from itertools import islice
+from types import MappingProxyType
+from typing import (
+    Any, AsyncIterable, AsyncIterator, Callable, Deque, Dict, Iterable,
+    Iterator, List, Mapping, NamedTuple, Optional, Tuple
+)
 from enum import Enum
-from dataclasses import dataclass
+import dataclasses
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 
+from .audit import AuditLogStore, ChainVerification, default_spill_path
+from .sessions import Session, SessionStore, default_session_backend
+from .path_policy import DEFAULT_DENY, get_path_policy
+from .network_policy import get_network_policy
+from .code_analyzer import CodeAnalyzer
+
 logger = logging.getLogger(__name__)
 
 
@@ -23,6 +44,13 @@ class ThreatLevel(str, Enum):
     CRITICAL = "critical"
 
 
+class ValidationMode(str, Enum):
+    """How thoroughly validate_input scans"""
+    FAST_REJECT = "fast_reject"  # Stop as soon as the verdict is CRITICAL
+    SCAN = "scan"                # Evaluate every rule, report which matched
+    FORENSIC = "forensic"        # Also record where each rule matched
+
+
 @dataclass
 class ValidationResult:
     """Result of input validation"""
@@ -31,6 +59,38 @@ class ValidationResult:
     sanitized_input: str
     detected_patterns: List[str]
     recommendations: List[str]
+    # Matches with their positions (forensic mode only, capped per call)
+    matches: List[Dict[str, Any]] = field(default_factory=list)
+    # False if scanning stopped early
+    complete: bool = True
+    ruleset_version: Optional[str] = None
+    # The rate limit was hit; reported as CRITICAL but not an injection
+    rate_limited: bool = False
+
+
+# Control and bi-directional characters removed by sanitization
+_STRIP_CHARS = (
+    [*range(0x00, 0x09), 0x0b, 0x0c, *range(0x0e, 0x20)]
+    + [0x202e, 0x202d, 0x200e, 0x200f]
+)
+_STRIP_TABLE = dict.fromkeys(_STRIP_CHARS)
+_STRIP_PATTERN = re.compile("[" + "".join(re.escape(chr(c)) for c in _STRIP_CHARS) + "]")
+_ASCII_LOWER_TABLE = str.maketrans("", "", string.ascii_lowercase)
+
+
+def _strip_control_chars(text: str) -> str:
+    """Remove control and bidi characters"""
+    # translate() is fastest on ASCII; the regex wins on wide strings
+    if text.isascii():
+        return text.translate(_STRIP_TABLE)
+    return _STRIP_PATTERN.sub("", text)
+
+
+def _count_lowercase(text: str) -> int:
+    """Number of characters for which str.islower() is true"""
+    if text.isascii():
+        return len(text) - len(text.translate(_ASCII_LOWER_TABLE))
+    return sum(map(str.islower, text))
 
 
 class PromptInjectionDefender:
@@ -112,68 +172,124 @@ class PromptInjectionDefender:
         (r"[A-Za-z0-9+/]{100,}={0,2}", "Possible base64 encoding"),
     ]
     
-    def __init__(self):
-        self.compiled_patterns = self._compile_patterns()
+    # Threat score per injection pattern category
+    CATEGORY_SCORES = {
+        "instruction_override": 7,
+        "role_manipulation": 6,
+        "delimiter_manipulation": 6,
+        "encoding_obfuscation": 5,
+        "context_manipulation": 5,
+        "persistence_attempts": 4,
+        "tool_hijacking": 7,
+    }
+    
+    # Match positions kept per FORENSIC call
+    MAX_MATCHES = 100
+    
+    def __init__(self, ruleset: Optional["InjectionRuleset"] = None):
+        """
+        Args:
+            ruleset: Pin a specific ruleset. By default the process-wide
+                ruleset from get_ruleset() is used, including hot reloads.
+        """
+        self._pinned_ruleset = ruleset
         self.rate_limiter = RateLimiter()
         logger.info("PromptInjectionDefender initialized")
     
-    def _compile_patterns(self) -> Dict[str, List[re.Pattern]]:
-        """Compile regex patterns for performance"""
-        compiled = {}
-        for category, patterns in self.INJECTION_PATTERNS.items():
-            compiled[category] = [re.compile(pattern, re.IGNORECASE | re.DOTALL) for pattern in patterns]
-        return compiled
+    @property
+    def ruleset(self) -> "InjectionRuleset":
+        """Ruleset currently in effect for this defender"""
+        return self._pinned_ruleset or get_ruleset()
+    
+    @property
+    def compiled_patterns(self) -> Dict[str, List[re.Pattern]]:
+        return self.ruleset.compiled_patterns
     
-    def validate_input(self, user_input: str, context: Optional[str] = None) -> ValidationResult:
+    def validate_input(
+        self,
+        user_input: str,
+        context: Optional[str] = None,
+        rate_limit_key: Optional[str] = "user_input",
+        mode: ValidationMode = ValidationMode.SCAN
+    ) -> ValidationResult:
         """
         Validate user input for prompt injection attempts
         
         Args:
             user_input: The input to validate
             context: Optional context about the input
+            rate_limit_key: Rate limiter key, e.g. RateLimiter.key(channel, user_id);
+                None skips rate limiting (e.g. when re-scanning for audit)
+            mode: FAST_REJECT stops scanning and skips sanitization once the
+                verdict is CRITICAL; SCAN evaluates every rule; FORENSIC also
+                records up to MAX_MATCHES match positions
             
         Returns:
             ValidationResult with validation details
         """
+        fast = mode == ValidationMode.FAST_REJECT
+        forensic = mode == ValidationMode.FORENSIC
+        ruleset = self.ruleset
         detected_patterns = []
+        matches = []
         threat_score = 0
         
-        # Check for injection patterns
-        for category, patterns in self.compiled_patterns.items():
-            for pattern in patterns:
-                if pattern.search(user_input):
-                    detected_patterns.append(f"{category}: {pattern.pattern[:50]}...")
-                    threat_score += self._get_category_threat_score(category)
-        
-        # Check for suspicious patterns
-        for pattern, description in self.SUSPICIOUS_PATTERNS:
-            if re.search(pattern, user_input):
-                detected_patterns.append(f"suspicious: {description}")
-                threat_score += 2
-        
-        # Check for length-based anomalies
-        if len(user_input) > 10000:
-            detected_patterns.append("anomaly: Excessive input length")
-            threat_score += 1
-        
-        # Check for case manipulation (often used to bypass filters)
-        lower_ratio = sum(1 for c in user_input if c.islower()) / max(len(user_input), 1)
-        if lower_ratio < 0.3 or lower_ratio > 0.95:
-            detected_patterns.append("anomaly: Unusual case distribution")
-            threat_score += 1
+        # Check rate limiting
+        rate_limited = rate_limit_key is not None and not self.rate_limiter.check_limit(rate_limit_key)
+        decided = fast and rate_limited
+        
+        # Check for injection and suspicious patterns
+        profiler = _rule_profiler
+        for rule in ruleset.rules:
+            if decided:
+                break
+            category, pattern, score, label = rule
+            if profiler is not None:
+                started = time.perf_counter_ns()
+            if forensic and len(matches) < self.MAX_MATCHES:
+                found = [
+                    {"rule": label, "category": category, "start": m.start(), "end": m.end(),
+                     "excerpt": user_input[m.start():m.end()][:100]}
+                    for m in islice(pattern.finditer(user_input), self.MAX_MATCHES - len(matches))
+                ]
+                matches.extend(found)
+                hit = bool(found)
+            else:
+                hit = pattern.search(user_input) is not None
+            if profiler is not None:
+                profiler.record(rule, time.perf_counter_ns() - started, hit)
+            if not hit:
+                continue
+            detected_patterns.append(label)
+            threat_score += score
+            decided = fast and self._is_critical(threat_score, len(detected_patterns))
+        
+        if not decided:
+            # Check for length-based anomalies
+            if len(user_input) > 10000:
+                detected_patterns.append("anomaly: Excessive input length")
+                threat_score += 1
+            
+            # Check for case manipulation (often used to bypass filters)
+            lower_ratio = _count_lowercase(user_input) / max(len(user_input), 1)
+            if lower_ratio < 0.3 or lower_ratio > 0.95:
+                detected_patterns.append("anomaly: Unusual case distribution")
+                threat_score += 1
         
         # Determine threat level
         threat_level = self._calculate_threat_level(threat_score, len(detected_patterns))
+        if rate_limited:
+            threat_level = ThreatLevel.CRITICAL
         
-        # Sanitize input
-        sanitized = self._sanitize_input(user_input)
+        # Sanitize input - rejected input is never forwarded in fast mode
+        if fast and threat_level == ThreatLevel.CRITICAL:
+            sanitized = ""
+        else:
+            sanitized = self._sanitize_input(user_input)
         
         # Generate recommendations
         recommendations = self._generate_recommendations(threat_level, detected_patterns)
-        
-        # Check rate limiting
-        if not self.rate_limiter.check_limit("user_input"):
-            threat_level = ThreatLevel.CRITICAL
+        if rate_limited:
             recommendations.append("Rate limit exceeded - possible attack")
         
         result = ValidationResult(
@@ -181,7 +297,11 @@ class PromptInjectionDefender:
             threat_level=threat_level,
             sanitized_input=sanitized,
             detected_patterns=detected_patterns,
-            recommendations=recommendations
+            recommendations=recommendations,
+            matches=matches,
+            complete=not decided,
+            ruleset_version=ruleset.version,
+            rate_limited=rate_limited
         )
         
         # Log security event if threat detected
@@ -190,18 +310,13 @@ class PromptInjectionDefender:
         
         return result
     
+    def _is_critical(self, threat_score: int, pattern_count: int) -> bool:
+        """True once further matches can no longer change the verdict"""
+        return self._calculate_threat_level(threat_score, pattern_count) == ThreatLevel.CRITICAL
+    
     def _get_category_threat_score(self, category: str) -> int:
         """Get threat score for a pattern category"""
-        scores = {
-            "instruction_override": 7,
-            "role_manipulation": 6,
-            "delimiter_manipulation": 6,
-            "encoding_obfuscation": 5,
-            "context_manipulation": 5,
-            "persistence_attempts": 4,
-            "tool_hijacking": 7,
-        }
-        return scores.get(category, 2)
+        return self.ruleset.category_scores.get(category, 2)
     
     def _calculate_threat_level(self, threat_score: int, pattern_count: int) -> ThreatLevel:
         """Calculate overall threat level"""
@@ -219,20 +334,19 @@ class PromptInjectionDefender:
         """Sanitize input by removing dangerous patterns"""
         sanitized = user_input
         
-        # Remove null bytes
-        sanitized = sanitized.replace('\x00', '')
+        # Remove null bytes (before whitespace runs are collapsed)
+        if '\x00' in sanitized:
+            sanitized = sanitized.replace('\x00', '')
         
-        # Normalize whitespace
-        sanitized = re.sub(r'\s+', ' ', sanitized)
+        # Normalize whitespace; leading/trailing runs are stripped below anyway
+        sanitized = ' '.join(sanitized.split())
         
-        # Remove control characters
-        sanitized = re.sub(r'[\x00-\x08\x0b-\x0c\x0e-\x1f]', '', sanitized)
-        
-        # Remove bi-directional characters
-        sanitized = re.sub(r'[\u202e\u202d\u200e\u200f]', '', sanitized)
+        # Remove control and bi-directional characters
+        sanitized = _strip_control_chars(sanitized)
         
         # Escape potential markdown injection
-        sanitized = sanitized.replace('```', '`` `')
+        if '```' in sanitized:
+            sanitized = sanitized.replace('```', '`` `')
         
         return sanitized.strip()
     
@@ -261,6 +375,35 @@ class PromptInjectionDefender:
         
         return recommendations
     
+    def stream_validator(self, overlap: int = 1024, rate_limit_key: str = "user_input") -> "StreamingValidator":
+        """Create a validator for input that arrives in chunks"""
+        return StreamingValidator(self, overlap=overlap, rate_limit_key=rate_limit_key)
+    
+    def validate_stream(self, chunks: Iterable[str], **kwargs) -> Iterator["StreamValidationUpdate"]:
+        """
+        Validate chunked input, yielding an update per chunk
+        
+        Stops reading chunks once the threat level reaches CRITICAL.
+        The last update always has ``final`` set.
+        """
+        validator = self.stream_validator(**kwargs)
+        for chunk in chunks:
+            update = validator.feed(chunk)
+            yield update
+            if update.aborted:
+                break
+        yield validator.finish()
+    
+    async def avalidate_stream(self, chunks: AsyncIterable[str], **kwargs) -> AsyncIterator["StreamValidationUpdate"]:
+        """Async variant of validate_stream"""
+        validator = self.stream_validator(**kwargs)
+        async for chunk in chunks:
+            update = validator.feed(chunk)
+            yield update
+            if update.aborted:
+                break
+        yield validator.finish()
+    
     def create_secure_prompt(self, system_prompt: str, user_input: str) -> str:
         """
         Create a secure prompt with proper separation
@@ -298,34 +441,564 @@ Respond to the user input above while following the system instructions. Do not
         return secure_prompt
 
 
+class InjectionRule(NamedTuple):
+    """A single compiled detection rule"""
+    category: str
+    pattern: re.Pattern
+    score: int
+    label: str
+
+
+@dataclass(frozen=True)
+class InjectionRuleset:
+    """
+    Immutable, versioned set of compiled detection rules
+    
+    A single instance is shared by every PromptInjectionDefender in the
+    process. A new ruleset is compiled completely before it is swapped
+    in, and swapping only replaces a reference, so validations already in
+    progress finish on the version they started with.
+    """
+    version: str
+    rules: Tuple[InjectionRule, ...]
+    # End-anchored rules can only be tested at the end of streamed input
+    streamable_rules: Tuple[InjectionRule, ...]
+    anchored_rules: Tuple[InjectionRule, ...]
+    category_scores: Mapping[str, int]
+    source: Optional[str] = None
+    
+    @classmethod
+    def compile(
+        cls,
+        injection_patterns: Dict[str, List[str]],
+        suspicious_patterns: List[Tuple[str, str]],
+        category_scores: Dict[str, int],
+        version: Optional[str] = None,
+        source: Optional[str] = None
+    ) -> "InjectionRuleset":
+        """Compile rule definitions; raises re.error on an invalid pattern"""
+        rules = []
+        for category, patterns in injection_patterns.items():
+            score = category_scores.get(category, 2)
+            for pattern in patterns:
+                compiled = re.compile(pattern, re.IGNORECASE | re.DOTALL)
+                rules.append(InjectionRule(category, compiled, score, f"{category}: {pattern[:50]}..."))
+        for pattern, description in suspicious_patterns:
+            rules.append(InjectionRule("suspicious", re.compile(pattern), 2, f"suspicious: {description}"))
+        
+        if version is None:
+            definitions = json.dumps(
+                [injection_patterns, [list(p) for p in suspicious_patterns], category_scores],
+                sort_keys=True
+            )
+            version = "sha256:" + hashlib.sha256(definitions.encode()).hexdigest()[:12]
+        
+        anchored = tuple(r for r in rules if r.pattern.pattern.endswith("$") and not r.pattern.pattern.endswith("\\$"))
+        return cls(
+            version=version,
+            rules=tuple(rules),
+            streamable_rules=tuple(r for r in rules if r not in anchored),
+            anchored_rules=anchored,
+            category_scores=MappingProxyType(dict(category_scores)),
+            source=source
+        )
+    
+    @classmethod
+    def builtin(cls) -> "InjectionRuleset":
+        """Ruleset from the patterns shipped with PromptInjectionDefender"""
+        return cls.compile(
+            PromptInjectionDefender.INJECTION_PATTERNS,
+            PromptInjectionDefender.SUSPICIOUS_PATTERNS,
+            PromptInjectionDefender.CATEGORY_SCORES
+        )
+    
+    @classmethod
+    def from_file(cls, path: str) -> "InjectionRuleset":
+        """
+        Load a JSON rules file
+        
+        Recognised keys are ``version``, ``injection_patterns`` (category ->
+        list of regexes), ``suspicious_patterns`` (list of [regex, description])
+        and ``category_scores``. The file's rules are added to the built-in
+        rules and its scores override theirs, so an incident signature can be
+        pushed on its own; with ``"replace": true`` each section given
+        replaces the built-in one instead.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError(f"Rules file must contain a JSON object: {path}")
+        
+        builtin = PromptInjectionDefender
+        injection = data.get("injection_patterns", {})
+        suspicious = [tuple(p) for p in data.get("suspicious_patterns", [])]
+        scores = data.get("category_scores", {})
+        if data.get("replace"):
+            if "injection_patterns" not in data:
+                injection = builtin.INJECTION_PATTERNS
+            if "suspicious_patterns" not in data:
+                suspicious = builtin.SUSPICIOUS_PATTERNS
+            if "category_scores" not in data:
+                scores = builtin.CATEGORY_SCORES
+        else:
+            merged = {category: list(patterns) for category, patterns in builtin.INJECTION_PATTERNS.items()}
+            for category, patterns in injection.items():
+                existing = merged.setdefault(category, [])
+                existing.extend(p for p in patterns if p not in existing)
+            injection = merged
+            suspicious = list(dict.fromkeys(list(builtin.SUSPICIOUS_PATTERNS) + suspicious))
+            scores = {**builtin.CATEGORY_SCORES, **scores}
+        
+        return cls.compile(injection, suspicious, scores, version=data.get("version"), source=path)
+    
+    @property
+    def compiled_patterns(self) -> Dict[str, List[re.Pattern]]:
+        """Injection patterns grouped by category"""
+        grouped: Dict[str, List[re.Pattern]] = {}
+        for rule in self.rules:
+            if rule.category != "suspicious":
+                grouped.setdefault(rule.category, []).append(rule.pattern)
+        return grouped
+    
+    def reordered(self, key: Callable[[InjectionRule], Any]) -> "InjectionRuleset":
+        """
+        Same rules sorted by ``key`` (stable), e.g. ``RuleProfiler.rank``
+        
+        Verdicts do not depend on rule order; only how soon FAST_REJECT
+        stops and the order patterns are reported in.
+        """
+        rules = tuple(sorted(self.rules, key=key))
+        anchored = set(self.anchored_rules)
+        return dataclasses.replace(
+            self,
+            rules=rules,
+            streamable_rules=tuple(r for r in rules if r not in anchored),
+            anchored_rules=tuple(r for r in rules if r in anchored)
+        )
+
+
+@dataclass
+class RuleStats:
+    """Cumulative measurements for one rule"""
+    evaluations: int = 0
+    hits: int = 0
+    total_ns: int = 0
+    
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.evaluations if self.evaluations else 0.0
+    
+    @property
+    def mean_ns(self) -> float:
+        return self.total_ns / self.evaluations if self.evaluations else 0.0
+
+
+class RuleProfiler:
+    """
+    Per-rule match time, evaluation count and hit count
+    
+    Opt-in: validation only measures rules while a profiler is installed
+    with ``set_rule_profiling(True)`` or CLOSEDPAW_RULE_PROFILING=1, and
+    costs a single ``is None`` check per rule otherwise. Stats are keyed
+    by rule, so they survive a reload that keeps a pattern unchanged.
+    """
+    
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.started_at = clock()
+        self._stats: Dict[InjectionRule, RuleStats] = {}
+        self._lock = threading.Lock()
+    
+    def record(self, rule: InjectionRule, elapsed_ns: int, hit: bool):
+        with self._lock:
+            stats = self._stats.get(rule)
+            if stats is None:
+                stats = self._stats[rule] = RuleStats()
+            stats.evaluations += 1
+            stats.hits += hit
+            stats.total_ns += elapsed_ns
+    
+    def get(self, rule: InjectionRule) -> Optional[RuleStats]:
+        return self._stats.get(rule)
+    
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+    
+    def rank(self, rule: InjectionRule) -> Tuple[float, float]:
+        """
+        Sort key putting the cheapest route to a verdict first
+        
+        Rules that fire are ordered by mean cost per point of expected
+        threat score (mean_ns / (hit_rate * score)); rules that never fire
+        and unmeasured rules follow, cheapest first.
+        """
+        stats = self._stats.get(rule)
+        if stats is None or not stats.hits:
+            return (float("inf"), stats.mean_ns if stats else 0.0)
+        return (stats.mean_ns / (stats.hit_rate * max(rule.score, 1)), 0.0)
+    
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Stats per rule, most expensive first"""
+        with self._lock:
+            items = [(rule, dataclasses.replace(stats)) for rule, stats in self._stats.items()]
+        items.sort(key=lambda item: item[1].total_ns, reverse=True)
+        return [
+            {
+                "rule": rule.label,
+                "category": rule.category,
+                "pattern": rule.pattern.pattern,
+                "evaluations": stats.evaluations,
+                "hits": stats.hits,
+                "hit_rate": round(stats.hit_rate, 4),
+                "total_ms": round(stats.total_ns / 1e6, 3),
+                "mean_us": round(stats.mean_ns / 1e3, 3),
+            }
+            for rule, stats in items
+        ]
+
+
+class _StreamSanitizer:
+    """
+    Incremental equivalent of PromptInjectionDefender._sanitize_input
+
+    Only state that can interact with the next chunk is carried over:
+    a pending whitespace run (collapsed to one space), the trailing
+    backticks not yet grouped into a triple, and the count of trailing
+    spaces that are dropped if the input ends there.
+    """
+    
+    _WHITESPACE = re.compile(r'\s+')
+    _TRAILING_WS = re.compile(r'\s+\Z')
+    _TRAILING_TICKS = re.compile(r'`+\Z')
+    
+    def __init__(self):
+        self._pending_ws = ""
+        self._ticks = 0
+        self._spaces = 0
+        self._started = False
+    
+    def feed(self, chunk: str) -> str:
+        """Sanitize a chunk, holding back anything the next chunk may change"""
+        text = self._pending_ws + chunk.replace('\x00', '')
+        match = self._TRAILING_WS.search(text)
+        if match:
+            self._pending_ws = " "
+            text = text[:match.start()]
+        else:
+            self._pending_ws = ""
+        return self._emit(_strip_control_chars(self._WHITESPACE.sub(' ', text)))
+    
+    def finish(self) -> str:
+        """Flush held-back state at end of input"""
+        return self._emit("", final=True)
+    
+    def _emit(self, text: str, final: bool = False) -> str:
+        # Backticks held from the previous chunk continue the same run
+        text = "`" * self._ticks + text
+        self._ticks = 0
+        if not final:
+            match = self._TRAILING_TICKS.search(text)
+            if match:
+                self._ticks = (match.end() - match.start()) % 3
+                text = text[:len(text) - self._ticks]
+        text = text.replace('```', '`` `')
+        
+        if not self._started:
+            text = text.lstrip(' ')
+            if not text:
+                return ""
+            self._started = True
+        
+        # Trailing spaces are only emitted once something follows them
+        stripped = text.rstrip(' ')
+        trailing = len(text) - len(stripped)
+        if not stripped:
+            self._spaces += trailing
+            return ""
+        text = " " * self._spaces + stripped
+        self._spaces = trailing
+        return text
+
+
+@dataclass
+class StreamValidationUpdate:
+    """Incremental result of streaming validation"""
+    chunk_index: int
+    chars_processed: int
+    threat_score: int
+    threat_level: ThreatLevel
+    new_patterns: List[str]
+    sanitized_chunk: str
+    aborted: bool = False
+    final: bool = False
+
+
+class StreamingValidator:
+    """
+    Chunked prompt injection validation with constant memory
+    
+    Each chunk is scanned together with the last ``overlap`` characters
+    of the previous one, so any match no longer than the overlap window
+    is found even when it straddles a chunk boundary. Scanning stops as
+    soon as the verdict reaches CRITICAL.
+    
+    The sanitized text is delivered piecewise through the updates and is
+    identical to ``_sanitize_input`` applied to the whole input.
+    """
+    
+    def __init__(
+        self,
+        defender: "PromptInjectionDefender",
+        overlap: int = 1024,
+        max_chunk: int = 64 * 1024,
+        rate_limit_key: str = "user_input"
+    ):
+        self.defender = defender
+        self.ruleset = defender.ruleset
+        self.overlap = overlap
+        self.max_chunk = max_chunk
+        self._sanitizer = _StreamSanitizer()
+        self._tail = ""
+        self._seen: set = set()
+        self.detected_patterns: List[str] = []
+        self.threat_score = 0
+        self.chars_processed = 0
+        self._lower_count = 0
+        self._chunk_index = 0
+        self._length_flagged = False
+        self.aborted = False
+        self.finished = False
+        self.rate_limited = not defender.rate_limiter.check_limit(rate_limit_key)
+    
+    @property
+    def threat_level(self) -> ThreatLevel:
+        if self.rate_limited:
+            return ThreatLevel.CRITICAL
+        return self.defender._calculate_threat_level(self.threat_score, len(self.detected_patterns))
+    
+    def feed(self, chunk: str) -> StreamValidationUpdate:
+        """Validate the next chunk of input"""
+        if self.finished:
+            raise ValueError("Stream already finished")
+        
+        new_patterns: List[str] = []
+        sanitized = []
+        for start in range(0, len(chunk), self.max_chunk):
+            if self.aborted:
+                break
+            piece = chunk[start:start + self.max_chunk]
+            new_patterns.extend(self._scan(piece))
+            sanitized.append(self._sanitizer.feed(piece))
+            if self.threat_level == ThreatLevel.CRITICAL:
+                self.aborted = True
+        
+        self._chunk_index += 1
+        return self._update(new_patterns, "".join(sanitized))
+    
+    def finish(self) -> StreamValidationUpdate:
+        """Apply end-of-input checks and flush the sanitizer"""
+        if self.finished:
+            raise ValueError("Stream already finished")
+        self.finished = True
+        
+        new_patterns: List[str] = []
+        sanitized = ""
+        if not self.aborted:
+            # End-anchored patterns only apply at the real end of input
+            for rule in self.ruleset.anchored_rules:
+                new_patterns.extend(self._record(rule, self._tail))
+            
+            lower_ratio = self._lower_count / max(self.chars_processed, 1)
+            if lower_ratio < 0.3 or lower_ratio > 0.95:
+                new_patterns.append("anomaly: Unusual case distribution")
+                self.detected_patterns.append(new_patterns[-1])
+                self.threat_score += 1
+            sanitized = self._sanitizer.finish()
+        
+        update = self._update(new_patterns, sanitized)
+        update.final = True
+        return update
+    
+    def result(self) -> ValidationResult:
+        """
+        Overall verdict so far
+        
+        ``sanitized_input`` is left empty: the sanitized text has already
+        been handed out chunk by chunk.
+        """
+        threat_level = self.threat_level
+        recommendations = self.defender._generate_recommendations(threat_level, self.detected_patterns)
+        if self.rate_limited:
+            recommendations.append("Rate limit exceeded - possible attack")
+        return ValidationResult(
+            is_valid=threat_level in [ThreatLevel.NONE, ThreatLevel.LOW],
+            threat_level=threat_level,
+            sanitized_input="",
+            detected_patterns=list(self.detected_patterns),
+            recommendations=recommendations,
+            ruleset_version=self.ruleset.version,
+            rate_limited=self.rate_limited
+        )
+    
+    def _scan(self, piece: str) -> List[str]:
+        window = self._tail + piece
+        new_patterns = []
+        
+        for rule in self.ruleset.streamable_rules:
+            new_patterns.extend(self._record(rule, window))
+        
+        self.chars_processed += len(piece)
+        self._lower_count += _count_lowercase(piece)
+        if self.chars_processed > 10000 and not self._length_flagged:
+            self._length_flagged = True
+            new_patterns.append("anomaly: Excessive input length")
+            self.detected_patterns.append(new_patterns[-1])
+            self.threat_score += 1
+        
+        self._tail = window[-self.overlap:] if self.overlap else ""
+        return new_patterns
+    
+    def _record(self, rule: InjectionRule, text: str) -> List[str]:
+        _, pattern, score, label = rule
+        if rule in self._seen:
+            return []
+        profiler = _rule_profiler
+        if profiler is None:
+            hit = pattern.search(text) is not None
+        else:
+            started = time.perf_counter_ns()
+            hit = pattern.search(text) is not None
+            profiler.record(rule, time.perf_counter_ns() - started, hit)
+        if not hit:
+            return []
+        self._seen.add(rule)
+        self.detected_patterns.append(label)
+        self.threat_score += score
+        return [label]
+    
+    def _update(self, new_patterns: List[str], sanitized: str) -> StreamValidationUpdate:
+        return StreamValidationUpdate(
+            chunk_index=self._chunk_index,
+            chars_processed=self.chars_processed,
+            threat_score=self.threat_score,
+            threat_level=self.threat_level,
+            new_patterns=new_patterns,
+            sanitized_chunk=sanitized,
+            aborted=self.aborted
+        )
+
+
 class RateLimiter:
-    """Simple rate limiter for security"""
+    """
+    Token-bucket rate limiter for security
+
+    Each key gets a bucket holding up to ``max_requests`` tokens that refills
+    at ``max_requests / window_seconds`` tokens per second. A check costs O(1)
+    regardless of how many keys are tracked or how much history they have.
+
+    Idle keys are expired lazily: a bucket that has been untouched long enough
+    to refill completely is indistinguishable from a new one, so it is dropped.
+    Expiry deadlines live in a min-heap that is drained a few entries at a time
+    on each call, keeping the amortized cost constant.
+
+    Keys are arbitrary strings; use ``RateLimiter.key()`` to build scoped keys
+    such as per-user or per-channel limits.
+    """
     
-    def __init__(self, max_requests: int = 60, window_seconds: int = 60):
+    # Max expired heap entries reclaimed per check_limit() call
+    SWEEP_BATCH = 8
+    
+    def __init__(
+        self,
+        max_requests: int = 60,
+        window_seconds: int = 60,
+        clock: Callable[[], float] = time.monotonic
+    ):
         self.max_requests = max_requests
         self.window_seconds = window_seconds
-        self.requests = {}
+        self.refill_rate = max_requests / window_seconds
+        self._clock = clock
+        # key -> [tokens, last_update]
+        self._buckets: Dict[str, List[float]] = {}
+        # (idle_deadline, key) - one entry per tracked key
+        self._expiry: List[Tuple[float, str]] = []
+    
+    @staticmethod
+    def key(*parts: Optional[str]) -> str:
+        """Build a scoped limiter key, e.g. key("telegram", user_id)"""
+        return ":".join(p for p in parts if p)
+    
+    def _refill(self, key: str, now: float) -> Optional[List[float]]:
+        """Bring a bucket up to date; returns None for untracked keys"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            elapsed = now - bucket[1]
+            if elapsed > 0:
+                bucket[0] = min(self.max_requests, bucket[0] + elapsed * self.refill_rate)
+                bucket[1] = now
+        return bucket
+    
+    def _idle_deadline(self, bucket: List[float]) -> float:
+        """Time at which the bucket will be full again"""
+        return bucket[1] + (self.max_requests - bucket[0]) / self.refill_rate
+    
+    def _sweep(self, now: float):
+        """Drop a bounded number of idle buckets"""
+        for _ in range(self.SWEEP_BATCH):
+            if not self._expiry or self._expiry[0][0] > now:
+                return
+            _, key = heapq.heappop(self._expiry)
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            deadline = self._idle_deadline(bucket)
+            if deadline <= now:
+                del self._buckets[key]
+            else:
+                # Key was used since it was scheduled - reschedule
+                heapq.heappush(self._expiry, (deadline, key))
     
     def check_limit(self, key: str) -> bool:
         """Check if request is within rate limit"""
-        import time
+        now = self._clock()
+        self._sweep(now)
         
-        current_time = time.time()
+        bucket = self._refill(key, now)
+        if bucket is None:
+            bucket = [float(self.max_requests), now]
+            self._buckets[key] = bucket
+            heapq.heappush(self._expiry, (now + 1.0 / self.refill_rate, key))
         
-        # Clean old entries
-        self.requests = {k: v for k, v in self.requests.items() 
-                        if current_time - v[-1] < self.window_seconds}
-        
-        # Check current count
-        if key not in self.requests:
-            self.requests[key] = []
-        
-        if len(self.requests[key]) >= self.max_requests:
+        if bucket[0] < 1.0:
             return False
         
         # Record request
-        self.requests[key].append(current_time)
+        bucket[0] -= 1.0
         return True
+    
+    def remaining(self, key: str) -> int:
+        """Number of requests currently available for key"""
+        bucket = self._refill(key, self._clock())
+        if bucket is None:
+            return self.max_requests
+        return int(bucket[0])
+    
+    def retry_after(self, key: str) -> float:
+        """Seconds until the next request for key would be allowed"""
+        bucket = self._refill(key, self._clock())
+        if bucket is None or bucket[0] >= 1.0:
+            return 0.0
+        return (1.0 - bucket[0]) / self.refill_rate
+    
+    def reset(self, key: str):
+        """Refill the bucket for key; it is reclaimed by the next sweep"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = float(self.max_requests)
+            bucket[1] = self._clock()
+    
+    def __len__(self) -> int:
+        return len(self._buckets)
 
 
 class SecurityException(Exception):
@@ -337,24 +1010,82 @@ class DataVault:
     """
     Encrypted data vault for sensitive information
     API keys, credentials, and other secrets
+    
+    The Fernet cipher is built once per vault. Recently decrypted values
+    are kept for ``plaintext_ttl`` seconds in mutable buffers that are
+    overwritten with zeros when they expire or are replaced; strings
+    already handed to callers cannot be zeroized. A TTL of 0 disables
+    the plaintext cache.
+    
+    Entries live in memory unless a VaultStore is given, in which case
+    they are persisted to its encrypted log (see ``DataVault.open``).
     """
     
-    def __init__(self, encryption_key: Optional[bytes] = None):
+    def __init__(
+        self,
+        encryption_key: Optional[bytes] = None,
+        plaintext_ttl: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        store: Optional["VaultStore"] = None,
+        access_log_limit: int = 10_000
+    ):
         self.encryption_key = encryption_key
-        self.vault: Dict[str, bytes] = {}
-        self.access_log: List[Dict] = []
+        self.vault = store if store is not None else {}
+        self.access_log: Deque[Dict] = deque(maxlen=access_log_limit)
+        self.plaintext_ttl = plaintext_ttl
+        self._clock = clock
+        self._cipher = None
+        # key -> (plaintext buffer, expires_at); insertion order == expiry order
+        self._plaintext_cache: "OrderedDict[str, Tuple[bytearray, float]]" = OrderedDict()
         
         if not self.encryption_key:
             # Generate key if not provided (for development)
             # In production, key should be provided from secure storage
             self._generate_key()
     
+    @classmethod
+    def open(
+        cls,
+        directory: Optional[str] = None,
+        keyfile: Optional[str] = None,
+        **kwargs
+    ) -> "DataVault":
+        """
+        Open a persistent vault
+        
+        Args:
+            directory: Vault directory (default: CLOSEDPAW_VAULT_DIR or
+                ~/.local/share/closedpaw/vault)
+            keyfile: Keyfile path, see ``load_vault_key``
+            
+        Returns:
+            DataVault backed by a VaultStore
+        """
+        from .vault_store import VaultStore, load_vault_key, DEFAULT_VAULT_DIR
+        
+        key = load_vault_key(keyfile)
+        directory = directory or os.getenv("CLOSEDPAW_VAULT_DIR") or str(DEFAULT_VAULT_DIR)
+        return cls(encryption_key=key, store=VaultStore(directory, key), **kwargs)
+    
+    def close(self):
+        """Zeroize cached plaintexts and flush the backing store"""
+        self.clear_cache()
+        if hasattr(self.vault, "close"):
+            self.vault.close()
+    
     def _generate_key(self):
         """Generate encryption key"""
         from cryptography.fernet import Fernet
         self.encryption_key = Fernet.generate_key()
         logger.info("Generated new encryption key for Data Vault")
     
+    def _get_cipher(self):
+        """Fernet instance for the vault key, created on first use"""
+        if self._cipher is None:
+            from cryptography.fernet import Fernet
+            self._cipher = Fernet(self.encryption_key)
+        return self._cipher
+    
     def store(self, key: str, value: str, access_level: str = "standard") -> bool:
         """
         Store encrypted data in vault
@@ -368,11 +1099,9 @@ class DataVault:
             True if stored successfully
         """
         try:
-            from cryptography.fernet import Fernet
-            
-            f = Fernet(self.encryption_key)
-            encrypted = f.encrypt(value.encode())
+            encrypted = self._get_cipher().encrypt(value.encode())
             
+            self._evict(key)
             self.vault[key] = {
                 "data": encrypted,
                 "access_level": access_level,
@@ -387,6 +1116,10 @@ class DataVault:
             logger.error(f"Failed to store data: {e}")
             return False
     
+    def store_many(self, items: Dict[str, str], access_level: str = "standard") -> Dict[str, bool]:
+        """Store several values; returns success per key"""
+        return {key: self.store(key, value, access_level) for key, value in items.items()}
+    
     def retrieve(self, key: str, requester_level: str = "standard") -> Optional[str]:
         """
         Retrieve and decrypt data from vault
@@ -409,10 +1142,11 @@ class DataVault:
                 logger.warning(f"Access denied: {key} (requested: {requester_level}, required: {entry['access_level']})")
                 return None
             
-            from cryptography.fernet import Fernet
-            
-            f = Fernet(self.encryption_key)
-            decrypted = f.decrypt(entry["data"]).decode()
+            decrypted = self._cached_plaintext(key)
+            if decrypted is None:
+                plaintext = bytearray(self._get_cipher().decrypt(entry["data"]))
+                decrypted = plaintext.decode()
+                self._cache_plaintext(key, plaintext)
             
             self._log_access("retrieve", key, requester_level)
             logger.info(f"Retrieved encrypted data: {key}")
@@ -422,6 +1156,46 @@ class DataVault:
             logger.error(f"Failed to retrieve data: {e}")
             return None
     
+    def retrieve_many(self, keys: Iterable[str], requester_level: str = "standard") -> Dict[str, Optional[str]]:
+        """Retrieve several values; missing or denied keys map to None"""
+        return {key: self.retrieve(key, requester_level) for key in keys}
+    
+    def clear_cache(self):
+        """Zeroize and drop every cached plaintext"""
+        while self._plaintext_cache:
+            _, (buffer, _) = self._plaintext_cache.popitem(last=False)
+            self._zeroize(buffer)
+    
+    def _cached_plaintext(self, key: str) -> Optional[str]:
+        self._expire_plaintext()
+        cached = self._plaintext_cache.get(key)
+        return cached[0].decode() if cached else None
+    
+    def _cache_plaintext(self, key: str, plaintext: bytearray):
+        if self.plaintext_ttl <= 0:
+            self._zeroize(plaintext)
+            return
+        self._evict(key)
+        self._plaintext_cache[key] = (plaintext, self._clock() + self.plaintext_ttl)
+    
+    def _expire_plaintext(self):
+        now = self._clock()
+        while self._plaintext_cache:
+            key, (buffer, expires_at) = next(iter(self._plaintext_cache.items()))
+            if expires_at > now:
+                return
+            del self._plaintext_cache[key]
+            self._zeroize(buffer)
+    
+    def _evict(self, key: str):
+        cached = self._plaintext_cache.pop(key, None)
+        if cached:
+            self._zeroize(cached[0])
+    
+    @staticmethod
+    def _zeroize(buffer: bytearray):
+        buffer[:] = bytes(len(buffer))
+    
     def _check_access_level(self, requester: str, required: str) -> bool:
         """Check if requester has sufficient access level"""
         levels = ["public", "standard", "elevated", "admin"]
@@ -446,6 +1220,89 @@ class DataVault:
 # Singleton instances
 _defender: Optional[PromptInjectionDefender] = None
 _vault: Optional[DataVault] = None
+_ruleset: Optional[InjectionRuleset] = None
+_ruleset_lock = threading.Lock()
+_rule_profiler: Optional[RuleProfiler] = (
+    RuleProfiler() if os.getenv("CLOSEDPAW_RULE_PROFILING", "").lower() in ("1", "true", "yes") else None
+)
+
+
+def get_ruleset() -> InjectionRuleset:
+    """
+    Get the process-wide injection ruleset
+    
+    Loaded from the file named by CLOSEDPAW_RULES_FILE if set,
+    otherwise built from the patterns shipped with the defender.
+    """
+    global _ruleset
+    if _ruleset is None:
+        with _ruleset_lock:
+            if _ruleset is None:
+                path = os.getenv("CLOSEDPAW_RULES_FILE")
+                _ruleset = InjectionRuleset.from_file(path) if path else InjectionRuleset.builtin()
+                logger.info(f"Loaded injection ruleset {_ruleset.version}")
+    return _ruleset
+
+
+def swap_ruleset(ruleset: InjectionRuleset) -> InjectionRuleset:
+    """Atomically replace the process-wide ruleset; returns the previous one"""
+    global _ruleset
+    with _ruleset_lock:
+        previous, _ruleset = _ruleset, ruleset
+    logger.warning(f"Injection ruleset swapped: {previous.version if previous else None} -> {ruleset.version}")
+    return previous
+
+
+def reload_ruleset(path: Optional[str] = None) -> InjectionRuleset:
+    """
+    Recompile rules from disk and swap them in
+    
+    Uses ``path``, else the current ruleset's source file, else
+    CLOSEDPAW_RULES_FILE. If loading fails the current ruleset stays
+    in effect and the error is raised.
+    """
+    path = path or get_ruleset().source or os.getenv("CLOSEDPAW_RULES_FILE")
+    ruleset = InjectionRuleset.from_file(path) if path else InjectionRuleset.builtin()
+    swap_ruleset(ruleset)
+    return ruleset
+
+
+def get_rule_profiler() -> Optional[RuleProfiler]:
+    """The installed rule profiler, or None while profiling is off"""
+    return _rule_profiler
+
+
+def set_rule_profiling(enabled: bool) -> Optional[RuleProfiler]:
+    """
+    Turn per-rule profiling on or off
+    
+    Enabling keeps an already installed profiler and its stats.
+    
+    Returns:
+        The profiler that is now installed, or when disabling the one
+        that was removed
+    """
+    global _rule_profiler
+    previous = _rule_profiler
+    if enabled:
+        if previous is None:
+            _rule_profiler = RuleProfiler()
+        return _rule_profiler
+    _rule_profiler = None
+    return previous
+
+
+def optimize_rule_order(profiler: Optional[RuleProfiler] = None) -> InjectionRuleset:
+    """
+    Reorder the active ruleset by measured cost and selectivity and swap
+    it in; raises ValueError without profiling data
+    """
+    profiler = profiler or _rule_profiler
+    if profiler is None or not profiler.snapshot():
+        raise ValueError("No rule profiling data; enable profiling first")
+    ruleset = get_ruleset().reordered(profiler.rank)
+    swap_ruleset(ruleset)
+    return ruleset
 
 
 def get_defender() -> PromptInjectionDefender:
@@ -460,7 +1317,7 @@ def get_vault() -> DataVault:
     """Get or create the singleton vault instance"""
     global _vault
     if _vault is None:
-        _vault = DataVault()
+        _vault = DataVault.open()
     return _vault
 
 
@@ -492,16 +1349,6 @@ class RateLimitResult:
     reset_at: Optional[float] = None
 
 
-@dataclass
-class Session:
-    """User session"""
-    id: str
-    user_id: str
-    created_at: float
-    expires_at: float
-    is_valid: bool = True
-
-
 class SecurityManager:
     """
     High-level security manager
@@ -509,69 +1356,55 @@ class SecurityManager:
     """
     
     def __init__(self):
-        self.defender = PromptInjectionDefender()
-        self.vault = DataVault()
+        self.defender = get_defender()
+        self.vault = get_vault()
+        self.audit_log = AuditLogStore(spill_path=default_spill_path("security_audit.jsonl"))
         self.rate_limiter = RateLimiter()
-        self._sessions: Dict[str, Session] = {}
+        self.path_policy = get_path_policy()
+        self.network_policy = get_network_policy()
+        self.code_analyzer = CodeAnalyzer(self.DANGEROUS_PATTERNS)
+        self.sessions = SessionStore(backend=default_session_backend())
         self._api_keys: Dict[str, str] = {}
     
     # ============================================
     # Prompt Validation
     # ============================================
     
-    async def validate_prompt(self, prompt: str) -> ValidationResult:
+    async def validate_prompt(self, prompt: str, user_id: Optional[str] = None) -> ValidationResult:
         """Validate prompt for injection attempts"""
-        return self.defender.validate_input(prompt)
+        return self.defender.validate_input(
+            prompt,
+            rate_limit_key=RateLimiter.key("user_input", user_id)
+        )
     
     # ============================================
     # File Access Control
     # ============================================
     
-    FORBIDDEN_PATHS = [
-        "/etc/passwd", "/etc/shadow", "/etc/sudoers",
-        "/root/.ssh", "/root/.bashrc",
-        "~/.ssh", "~/.gnupg",
-        "C:\\Windows\\System32\\config",
-        "/proc/", "/sys/",
-    ]
+    FORBIDDEN_PATHS = list(DEFAULT_DENY)
     
     async def validate_file_access(self, path: str) -> FileAccessResult:
-        """Validate file access request"""
-        import os
+        """Validate file access request against the shared path policy"""
+        decision = self.path_policy.check(path)
         
-        # Normalize path
-        normalized = os.path.normpath(path)
-        
-        # Check for forbidden paths
-        for forbidden in self.FORBIDDEN_PATHS:
-            if forbidden in normalized or normalized.startswith(forbidden.replace("~", os.path.expanduser("~"))):
-                return FileAccessResult(
-                    allowed=False,
-                    reason=f"Access to path forbidden: {path}",
-                    sanitized_path=None
-                )
-        
-        # Check for path traversal
-        if ".." in normalized or normalized.startswith("/"):
-            # Only allow within safe directories
-            safe_dirs = ["/tmp", "/home", os.path.expanduser("~")]  # nosec B108
-            if not any(normalized.startswith(d) for d in safe_dirs):
-                return FileAccessResult(
-                    allowed=False,
-                    reason="Path traversal detected",
-                    sanitized_path=None
-                )
+        if not decision.allowed:
+            return FileAccessResult(
+                allowed=False,
+                reason=decision.reason,
+                sanitized_path=None
+            )
         
         return FileAccessResult(
             allowed=True,
             reason="Access granted",
-            sanitized_path=normalized
+            sanitized_path=decision.normalized
         )
     
     # ============================================
     # Code Execution Sandbox
     # ============================================
     
+    # Checked only for input that does not parse as Python
     DANGEROUS_PATTERNS = [
         r"import\s+os",
         r"import\s+subprocess",
@@ -588,15 +1421,14 @@ class SecurityManager:
     
     async def validate_code_execution(self, code: str) -> CodeExecutionResult:
         """Validate code for safe execution"""
-        import re
+        verdict = self.code_analyzer.analyze(code)
         
-        for pattern in self.DANGEROUS_PATTERNS:
-            if re.search(pattern, code, re.IGNORECASE):
-                return CodeExecutionResult(
-                    safe=False,
-                    sandboxed=True,
-                    reason=f"Dangerous pattern detected: {pattern}"
-                )
+        if not verdict.safe:
+            return CodeExecutionResult(
+                safe=False,
+                sandboxed=True,
+                reason=f"Dangerous code detected: {'; '.join(verdict.findings)}"
+            )
         
         # All code runs in sandbox by default
         return CodeExecutionResult(
@@ -629,99 +1461,68 @@ class SecurityManager:
     
     async def check_rate_limit(self, user_id: str) -> RateLimitResult:
         """Check rate limit for user"""
-        import time
-        
         allowed = self.rate_limiter.check_limit(user_id)
         
         return RateLimitResult(
             allowed=allowed,
-            remaining=self.rate_limiter.max_requests - len(self.rate_limiter.requests.get(user_id, [])),
-            reset_at=time.time() + self.rate_limiter.window_seconds
+            remaining=self.rate_limiter.remaining(user_id),
+            reset_at=time.time() + self.rate_limiter.retry_after(user_id)
         )
     
     # ============================================
     # Session Management
     # ============================================
     
-    async def create_session(self, user_id: str, expires_in_seconds: int = 3600) -> Session:
-        """Create new user session"""
-        import time
-        import uuid
-        
-        now = time.time()
-        session = Session(
-            id=str(uuid.uuid4()),
-            user_id=user_id,
-            created_at=now,
-            expires_at=now + expires_in_seconds,
-            is_valid=True
-        )
+    async def create_session(
+        self,
+        user_id: str,
+        expires_in_seconds: int = 3600,
+        sliding: bool = False
+    ) -> Session:
+        """
+        Create new user session
         
-        self._sessions[session.id] = session
-        return session
+        Args:
+            user_id: Session owner
+            expires_in_seconds: Lifetime, or idle timeout when sliding
+            sliding: Extend the session on every successful validation
+        """
+        return await self._session_call(self.sessions.create, user_id, expires_in_seconds, sliding)
     
     async def validate_session(self, session_id: str) -> bool:
         """Validate session is still valid"""
-        import time
-        
-        session = self._sessions.get(session_id)
-        if not session:
-            return False
-        
-        if time.time() > session.expires_at:
-            session.is_valid = False
-            return False
-        
-        return session.is_valid
+        return await self._session_call(self.sessions.validate, session_id)
+    
+    async def revoke_session(self, session_id: str):
+        """Invalidate a session everywhere it is shared"""
+        await self._session_call(self.sessions.revoke, session_id)
+    
+    async def _session_call(self, method, *args):
+        # A shared backend does blocking I/O; keep it off the event loop
+        if self.sessions.backend is None:
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+    
+    def start(self):
+        """Start background maintenance on the running event loop"""
+        self.sessions.start_sweeper()
+    
+    def stop(self):
+        self.sessions.stop_sweeper()
+    
+    def close(self):
+        """Stop background tasks and persist unspilled audit entries"""
+        self.stop()
+        self.audit_log.close()
     
     # ============================================
     # Network Security
     # ============================================
     
     async def validate_network_request(self, url: str) -> "NetworkResult":
-        """Validate network request"""
-        import re
-        
-        # Block external requests by default (except allowed API endpoints)
-        allowed_domains = [
-            "api.openai.com",
-            "api.anthropic.com",
-            "generativelanguage.googleapis.com",
-            "api.mistral.ai",
-            "127.0.0.1",
-            "localhost",
-            "ollama",
-        ]
-        
-        # Check if URL is allowed
-        is_allowed = any(domain in url for domain in allowed_domains)
-        
-        if not is_allowed:
-            # Check for suspicious patterns
-            suspicious_patterns = [
-                r"evil\.com",
-                r"attacker",
-                r"malicious",
-                r"exfil",
-                r"collect.*data",
-            ]
-            
-            for pattern in suspicious_patterns:
-                if re.search(pattern, url, re.IGNORECASE):
-                    return NetworkResult(
-                        allowed=False,
-                        reason="Suspicious URL detected"
-                    )
-            
-            return NetworkResult(
-                allowed=False,
-                reason="External URL not in allowlist"
-            )
-        
-        return NetworkResult(
-            allowed=True,
-            reason="URL allowed"
-        )
+        """Validate network request against the shared host allowlist"""
+        decision = self.network_policy.check(url)
+        return NetworkResult(allowed=decision.allowed, reason=decision.reason)
     
     # ============================================
     # Audit Logging
@@ -730,11 +1531,8 @@ class SecurityManager:
     async def log_action(self, action: Dict) -> str:
         """Log security-relevant action"""
         import uuid
-        log_id = str(uuid.uuid4())
-        
-        # Store in vault access log
-        self.vault.access_log.append({
-            "id": log_id,
+        log_id = self.audit_log.append({
+            "id": str(uuid.uuid4()),
             **action
         })
         
@@ -743,19 +1541,15 @@ class SecurityManager:
     
     async def get_audit_log(self, log_id: str) -> Optional[Dict]:
         """Retrieve audit log entry"""
-        for entry in self.vault.access_log:
-            if entry.get("id") == log_id:
-                return entry
-        return None
+        return self.audit_log.get(log_id)
     
     async def verify_log_integrity(self, log_id: str) -> "IntegrityResult":
-        """Verify log entry integrity"""
-        entry = await self.get_audit_log(log_id)
-        
-        if entry:
-            return IntegrityResult(valid=True, log_id=log_id)
-        
-        return IntegrityResult(valid=False, log_id=log_id)
+        """Verify a log entry against the hash chain and its Merkle checkpoint"""
+        return IntegrityResult(valid=self.audit_log.verify_entry(log_id), log_id=log_id)
+    
+    async def verify_audit_chain(self) -> ChainVerification:
+        """Re-verify the whole audit chain in one streaming pass"""
+        return await asyncio.to_thread(self.audit_log.verify_all)
     
     # ============================================
     # Sanitization
@@ -864,6 +1658,17 @@ class IntegrityResult:
     log_id: str
 
 
+_security_manager: Optional[SecurityManager] = None
+
+
+def get_security_manager() -> SecurityManager:
+    """Get or create the singleton security manager"""
+    global _security_manager
+    if _security_manager is None:
+        _security_manager = SecurityManager()
+    return _security_manager
+
+
 # ============================================
 # PromptValidator - Simple validation interface
 # ============================================
@@ -884,11 +1689,14 @@ class PromptValidator:
     """
     
     def __init__(self):
-        self.defender = PromptInjectionDefender()
+        self.defender = get_defender()
     
-    async def validate(self, prompt: str) -> PromptValidationResult:
+    async def validate(self, prompt: str, user_id: Optional[str] = None) -> PromptValidationResult:
         """Validate prompt and return result"""
-        result = self.defender.validate_input(prompt)
+        result = self.defender.validate_input(
+            prompt,
+            rate_limit_key=RateLimiter.key("user_input", user_id)
+        )
         
         return PromptValidationResult(
             is_safe=result.is_valid,
@@ -0,0 +1,309 @@
+"""
+ClosedPaw - Session Store
+Expiring user sessions with heap-ordered sweeping and optional shared storage
+"""
+
+import os
+import time
+import heapq
+import uuid
+import sqlite3
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Session:
+    """User session"""
+    id: str
+    user_id: str
+    created_at: float
+    expires_at: float
+    is_valid: bool = True
+    # Seconds each successful validation extends the session by
+    sliding_ttl: Optional[float] = None
+
+
+class SessionBackend(ABC):
+    """
+    Storage shared by every worker that validates sessions
+
+    Implementations must be safe to call from several threads.
+    """
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[Session]:
+        """Stored session, or None if unknown or deleted"""
+        pass
+
+    @abstractmethod
+    def put(self, session: Session):
+        """Insert or replace a session"""
+        pass
+
+    @abstractmethod
+    def touch(self, session_id: str, expires_at: float):
+        """Extend a session's expiry; never shortens it"""
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        """Remove a session"""
+        pass
+
+    @abstractmethod
+    def purge_expired(self, now: float, limit: int) -> int:
+        """Delete up to ``limit`` expired sessions; returns how many"""
+        pass
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions in a SQLite file that several worker processes can open"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, created_at REAL NOT NULL, "
+                "expires_at REAL NOT NULL, sliding_ttl REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expiry ON sessions (expires_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[Session]:
+        row = self._connect().execute(
+            "SELECT id, user_id, created_at, expires_at, sliding_ttl FROM sessions WHERE id = ?",
+            (session_id,)
+        ).fetchone()
+        return Session(row[0], row[1], row[2], row[3], True, row[4]) if row else None
+
+    def put(self, session: Session):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (session.id, session.user_id, session.created_at, session.expires_at, session.sliding_ttl)
+            )
+
+    def touch(self, session_id: str, expires_at: float):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE sessions SET expires_at = MAX(expires_at, ?) WHERE id = ?",
+                (expires_at, session_id)
+            )
+
+    def delete(self, session_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def purge_expired(self, now: float, limit: int) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM sessions WHERE id IN "
+                "(SELECT id FROM sessions WHERE expires_at <= ? LIMIT ?)",
+                (now, limit)
+            )
+        return cursor.rowcount
+
+
+class SessionStore:
+    """
+    Session table with O(1) validation and bounded memory
+
+    Expiry times are kept in a min-heap. Each create/validate call pops
+    at most ``SWEEP_BATCH`` expired entries, and ``sweep`` (run by the
+    optional background task) drains the rest, so expired sessions never
+    accumulate. Sliding sessions only move ``expires_at``; their heap
+    entry is pushed back when it surfaces early, so the heap holds one
+    entry per session rather than one per validation.
+
+    With a backend, sessions created by other workers are loaded on first
+    use and cached locally; cached sessions are re-read after
+    ``recheck_interval`` seconds so revocations propagate. Backend calls
+    block, so async callers should run the store's methods in a worker
+    thread (see SecurityManager); a lock keeps that safe.
+    """
+
+    SWEEP_BATCH = 8
+
+    def __init__(
+        self,
+        backend: Optional[SessionBackend] = None,
+        clock: Callable[[], float] = time.time,
+        recheck_interval: float = 5.0
+    ):
+        self.backend = backend
+        self.recheck_interval = recheck_interval
+        self._clock = clock
+        self._sessions: Dict[str, Session] = {}
+        # session_id -> (time loaded from backend, expires_at last persisted)
+        self._synced: Dict[str, Tuple[float, float]] = {}
+        self._expiry: List[Tuple[float, str]] = []
+        self._sweeper: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, user_id: str, expires_in_seconds: float = 3600, sliding: bool = False) -> Session:
+        with self._lock:
+            return self._create(user_id, expires_in_seconds, sliding)
+
+    def _create(self, user_id: str, expires_in_seconds: float, sliding: bool) -> Session:
+        now = self._clock()
+        session = Session(
+            id=str(uuid.uuid4()),
+            user_id=user_id,
+            created_at=now,
+            expires_at=now + expires_in_seconds,
+            is_valid=True,
+            sliding_ttl=expires_in_seconds if sliding else None
+        )
+        if self.backend:
+            self.backend.put(session)
+        self._cache(session, now, session.expires_at)
+        self._sweep_expired(now, self.SWEEP_BATCH)
+        return session
+
+    def validate(self, session_id: str) -> bool:
+        with self._lock:
+            return self._validate(session_id)
+
+    def _validate(self, session_id: str) -> bool:
+        now = self._clock()
+        session = self._lookup(session_id, now)
+        self._sweep_expired(now, self.SWEEP_BATCH)
+        if session is None or not session.is_valid:
+            return False
+
+        if now > session.expires_at:
+            session.is_valid = False
+            self._drop(session_id)
+            return False
+
+        if session.sliding_ttl:
+            self._slide(session, now)
+        return True
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._lookup(session_id, self._clock())
+
+    def revoke(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                session.is_valid = False
+            self._drop(session_id)
+            if self.backend:
+                self.backend.delete(session_id)
+
+    def _lookup(self, session_id: str, now: float) -> Optional[Session]:
+        session = self._sessions.get(session_id)
+        if not self.backend:
+            return session
+        synced = self._synced.get(session_id)
+        if session is not None and now - synced[0] < self.recheck_interval:
+            return session
+
+        stored = self.backend.get(session_id)
+        if stored is None:
+            if session is not None:
+                session.is_valid = False
+                self._drop(session_id)
+            return None
+        persisted = stored.expires_at
+        if session is not None:
+            # Keep the caller's object current rather than swapping it out
+            session.expires_at = max(session.expires_at, persisted)
+            stored = session
+        self._cache(stored, now, persisted)
+        return stored
+
+    def _cache(self, session: Session, now: float, persisted: float):
+        if session.id not in self._sessions:
+            heapq.heappush(self._expiry, (session.expires_at, session.id))
+        self._sessions[session.id] = session
+        self._synced[session.id] = (now, persisted)
+
+    def _slide(self, session: Session, now: float):
+        session.expires_at = now + session.sliding_ttl
+        if self.backend:
+            loaded_at, persisted = self._synced[session.id]
+            # Write through only once the extension is worth a round trip
+            if session.expires_at - persisted >= session.sliding_ttl / 10:
+                self.backend.touch(session.id, session.expires_at)
+                self._synced[session.id] = (loaded_at, session.expires_at)
+
+    def _drop(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._synced.pop(session_id, None)
+
+    def _sweep_expired(self, now: float, limit: Optional[int]) -> int:
+        removed = 0
+        while self._expiry and self._expiry[0][0] < now and (limit is None or removed < limit):
+            _, session_id = heapq.heappop(self._expiry)
+            session = self._sessions.get(session_id)
+            if session is None:
+                continue
+            if session.expires_at >= now:
+                # Extended since this entry was pushed
+                heapq.heappush(self._expiry, (session.expires_at, session_id))
+                continue
+            session.is_valid = False
+            self._drop(session_id)
+            removed += 1
+        return removed
+
+    def sweep(self) -> int:
+        """Drop every expired session locally and purge a batch from the backend"""
+        with self._lock:
+            now = self._clock()
+            removed = self._sweep_expired(now, None)
+            if self.backend:
+                removed += self.backend.purge_expired(now, limit=1000)
+            return removed
+
+    async def run_sweeper(self, interval: float = 60.0):
+        """Sweep periodically until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await asyncio.to_thread(self.sweep) if self.backend else self.sweep()
+                if removed:
+                    logger.debug(f"Session sweeper removed {removed} sessions")
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+
+    def start_sweeper(self, interval: float = 60.0):
+        """Start the background sweeper on the running event loop"""
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self.run_sweeper(interval))
+
+    def stop_sweeper(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+def default_session_backend() -> Optional[SessionBackend]:
+    """SQLite backend at CLOSEDPAW_SESSION_DB, or None for process-local sessions"""
+    path = os.getenv("CLOSEDPAW_SESSION_DB")
+    if not path:
+        return None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return SQLiteSessionBackend(path)
@@ -0,0 +1,128 @@
+"""
+ClosedPaw - Single-Flight Requests
+Coalesces concurrent identical provider calls into one upstream request
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _SharedStream:
+    """One upstream stream replayed to every subscriber"""
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def read(self) -> AsyncIterator[str]:
+        # Late subscribers replay what was already received, then follow
+        position = 0
+        while True:
+            changed = self._changed
+            while position < len(self.chunks):
+                yield self.chunks[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class SingleFlight:
+    """
+    Shares one in-flight call among concurrent callers with the same key
+
+    The first caller for a key starts the call; callers arriving before
+    it finishes wait for the same result (or error). Streams are
+    buffered and fanned out, so a subscriber joining late still gets the
+    full stream. A caller that gives up does not cancel the call for the
+    others; the call is cancelled once no caller is left. Keys are only
+    shared while a call is in flight; nothing is cached afterwards.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.requests = 0
+        self.upstream = 0
+
+    @property
+    def saved(self) -> int:
+        """Calls answered by another caller's upstream request"""
+        return self.requests - self.upstream
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``call()``, or the identical call already in flight"""
+        self.requests += 1
+        future = self._calls.get(key)
+        if future is None:
+            self.upstream += 1
+            future = asyncio.ensure_future(call())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(self._calls, key, done))
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not future.done():
+                future.cancel()
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    async def stream(self, key: Hashable, call: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Iterate ``call()``, or join the identical stream already in flight"""
+        self.requests += 1
+        shared = self._streams.get(key)
+        if shared is None:
+            self.upstream += 1
+            shared = _SharedStream(call())
+            self._streams[key] = shared
+            shared.task.add_done_callback(lambda _: self._forget(self._streams, key, shared))
+        shared.subscribers += 1
+        try:
+            async for chunk in shared.read():
+                yield chunk
+        finally:
+            shared.subscribers -= 1
+            if not shared.subscribers and not shared.done:
+                shared.task.cancel()
+
+    @staticmethod
+    def _forget(calls: Dict[Hashable, Any], key: Hashable, call: Any):
+        if calls.get(key) is call:
+            del calls[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "upstream": self.upstream,
+            "saved": self.saved,
+            "in_flight": len(self._calls) + len(self._streams),
+        }
@@ -0,0 +1,397 @@
+"""
+ClosedPaw - Persistent Vault Storage
+Append-only encrypted record log backing the Data Vault
+"""
+
+import os
+import json
+import mmap
+import struct
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows: only threads are serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_VAULT_DIR = Path.home() / ".local" / "share" / "closedpaw" / "vault"
+DEFAULT_KEYFILE = Path.home() / ".config" / "closedpaw" / "vault.key"
+
+# Record framing: payload length, then a Fernet token of the JSON record
+_LENGTH = struct.Struct(">I")
+
+
+def load_vault_key(keyfile: Optional[str] = None) -> bytes:
+    """
+    Load the vault key material
+
+    Order: CLOSEDPAW_VAULT_KEY (a Fernet key), then the keyfile given or
+    named by CLOSEDPAW_VAULT_KEYFILE, then the default keyfile. A missing
+    keyfile is created with a new key, readable only by the owner.
+    """
+    env_key = os.getenv("CLOSEDPAW_VAULT_KEY")
+    if env_key:
+        return env_key.encode()
+
+    path = Path(keyfile or os.getenv("CLOSEDPAW_VAULT_KEYFILE") or DEFAULT_KEYFILE)
+    if path.exists():
+        return path.read_bytes().strip()
+
+    from cryptography.fernet import Fernet
+    key = Fernet.generate_key()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    logger.info(f"Generated new vault keyfile: {path}")
+    return key
+
+
+class VaultStore:
+    """
+    Durable key -> entry mapping for DataVault
+
+    Every change is appended to ``vault-<generation>.log`` as an encrypted
+    record, so key names and metadata are not readable on disk. Record
+    offsets are kept in an in-memory index that is checkpointed to
+    ``vault.idx`` every ``checkpoint_interval`` appends, on compaction and
+    on close. Startup reads the index and replays at most the records
+    written since the last checkpoint, so load time does not depend on
+    how long the log is.
+
+    Reads go through a read-only memory map of the log. Compaction copies
+    the live records into the next generation and commits it by
+    atomically replacing the index.
+
+    Appends, checkpoints and compaction hold an ``fcntl.flock`` on
+    ``vault.lock``, so several processes (uvicorn workers) can share a
+    directory; each picks up the others' changes when it takes the lock.
+    An index that does not match its log is discarded and the log
+    replayed from the start.
+    """
+
+    INDEX_FILE = "vault.idx"
+    LOCK_FILE = "vault.lock"
+
+    def __init__(
+        self,
+        directory: str,
+        encryption_key: bytes,
+        checkpoint_interval: int = 32,
+        compact_min_bytes: int = 64 * 1024
+    ):
+        from cryptography.fernet import Fernet
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_interval = checkpoint_interval
+        self.compact_min_bytes = compact_min_bytes
+        self._cipher = Fernet(encryption_key)
+        self._lock = threading.RLock()
+        # key -> (offset, length) of the latest record
+        self._index: Dict[str, Tuple[int, int]] = {}
+        # Decoded entries read so far; values stay Fernet-encrypted
+        self._entries: Dict[str, Dict] = {}
+        self._generation = 0
+        self._live_bytes = 0
+        self._unindexed = 0
+        # Log size this process has applied, and the index file it last saw
+        self._end = 0
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._map: Optional[mmap.mmap] = None
+        self._held = False
+        self._lock_fd: Optional[int] = None
+        if fcntl is not None:
+            self._lock_fd = os.open(self.directory / self.LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._exclusive(sync=False):
+            self._load()
+
+    # ============================================
+    # Mapping interface used by DataVault
+    # ============================================
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._index
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._index))
+
+    def __getitem__(self, key: str) -> Dict:
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        with self._lock:
+            offset, length = self._index[key]
+            try:
+                record = self._read_record(offset, length)
+            except FileNotFoundError:
+                # Another process compacted the log away
+                with self._exclusive():
+                    offset, length = self._index[key]
+                    record = self._read_record(offset, length)
+            entry = self._entries[key] = {
+                "data": record["data"].encode(),
+                "access_level": record["access_level"],
+                "stored_at": record["stored_at"],
+            }
+        return entry
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key: str, entry: Dict):
+        data = entry["data"]
+        self._append({
+            "op": "put",
+            "key": key,
+            "data": data.decode() if isinstance(data, bytes) else data,
+            "access_level": entry["access_level"],
+            "stored_at": entry["stored_at"],
+        })
+
+    def __delitem__(self, key: str):
+        if key not in self._index:
+            raise KeyError(key)
+        self._append({"op": "delete", "key": key})
+
+    # ============================================
+    # Log and index
+    # ============================================
+
+    @property
+    def log_path(self) -> Path:
+        return self.directory / f"vault-{self._generation}.log"
+
+    @property
+    def dead_bytes(self) -> int:
+        """Bytes in the log taken up by overwritten or deleted records"""
+        return self._end - self._live_bytes
+
+    @contextmanager
+    def _exclusive(self, sync: bool = True):
+        """Hold the thread lock and the cross-process lock file, re-entrantly"""
+        with self._lock:
+            if self._held:
+                yield
+                return
+            if self._lock_fd is not None:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            self._held = True
+            try:
+                if sync:
+                    self._sync()
+                yield
+            finally:
+                self._held = False
+                if self._lock_fd is not None:
+                    fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _sync(self):
+        """Apply changes other processes made while this one did not hold the lock"""
+        if self._index_stamp() != self._stamp:
+            # Checkpointed or compacted elsewhere
+            self._load()
+        elif self.log_path.stat().st_size > self._end:
+            self._replay(self._end)
+            self._live_bytes = sum(_LENGTH.size + length for _, length in self._index.values())
+
+    def _index_stamp(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = (self.directory / self.INDEX_FILE).stat()
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _log_generations(self) -> List[int]:
+        generations = []
+        for path in self.directory.glob("vault-*.log"):
+            try:
+                generations.append(int(path.stem.split("-", 1)[1]))
+            except ValueError:
+                continue
+        return sorted(generations)
+
+    def _load(self):
+        self._close_map()
+        self._index, self._entries = {}, {}
+        self._unindexed = 0
+        index_path = self.directory / self.INDEX_FILE
+        log_size = 0
+        rebuild = False
+        if index_path.exists():
+            checkpoint = json.loads(self._cipher.decrypt(index_path.read_bytes()))
+            self._generation = checkpoint["generation"]
+            if self.log_path.exists() and self.log_path.stat().st_size >= checkpoint["log_size"]:
+                log_size = checkpoint["log_size"]
+                self._index = {k: (v[0], v[1]) for k, v in checkpoint["entries"].items()}
+            else:
+                logger.warning(f"Vault index does not match {self.log_path.name}; rebuilding from the log")
+                rebuild = True
+        if not self.log_path.exists():
+            # The oldest log holds every record the newer ones were compacted from
+            generations = self._log_generations()
+            if generations:
+                self._generation = generations[0]
+
+        self.log_path.touch(exist_ok=True)
+        self._remove_stale_logs()
+        self._replay(log_size)
+        self._live_bytes = sum(_LENGTH.size + length for _, length in self._index.values())
+        if rebuild:
+            self.checkpoint()
+        self._stamp = self._index_stamp()
+        logger.info(f"Vault store loaded: {len(self._index)} entries (generation {self._generation})")
+
+    def _replay(self, offset: int):
+        """Apply records appended after the last checkpoint"""
+        from cryptography.fernet import InvalidToken
+
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            while True:
+                header = f.read(_LENGTH.size)
+                if len(header) < _LENGTH.size:
+                    break
+                (length,) = _LENGTH.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                try:
+                    record = json.loads(self._cipher.decrypt(payload))
+                except (InvalidToken, ValueError):
+                    # The framing is intact, so later records are still readable
+                    logger.error(
+                        f"Skipping corrupt vault record at offset {offset} of {self.log_path.name}; "
+                        f"the value it held is lost"
+                    )
+                else:
+                    self._apply(record, offset, length)
+                offset += _LENGTH.size + length
+                self._unindexed += 1
+
+        # Drop a torn record left by a crash mid-append
+        if offset < self.log_path.stat().st_size:
+            logger.warning(f"Truncating incomplete vault record at offset {offset}")
+            os.truncate(self.log_path, offset)
+        self._end = offset
+
+    def _apply(self, record: Dict, offset: int, length: int):
+        self._entries.pop(record["key"], None)
+        if record["op"] == "delete":
+            self._index.pop(record["key"], None)
+        else:
+            self._index[record["key"]] = (offset + _LENGTH.size, length)
+
+    def _append(self, record: Dict):
+        payload = self._cipher.encrypt(json.dumps(record).encode())
+        with self._exclusive():
+            with open(self.log_path, "ab") as f:
+                offset = f.tell()
+                f.write(_LENGTH.pack(len(payload)) + payload)
+                f.flush()
+                os.fsync(f.fileno())
+            self._end = offset + _LENGTH.size + len(payload)
+
+            previous = self._index.get(record["key"])
+            if previous:
+                self._live_bytes -= _LENGTH.size + previous[1]
+            self._apply(record, offset, len(payload))
+            if record["op"] != "delete":
+                self._live_bytes += _LENGTH.size + len(payload)
+
+            self._unindexed += 1
+            if self.dead_bytes > max(self._live_bytes, self.compact_min_bytes):
+                self.compact()
+            elif self._unindexed >= self.checkpoint_interval:
+                self.checkpoint()
+
+    def _read_record(self, offset: int, length: int) -> Dict:
+        if self._map is None or offset + length > len(self._map):
+            self._remap()
+        return json.loads(self._cipher.decrypt(bytes(self._map[offset:offset + length])))
+
+    def _remap(self):
+        self._close_map()
+        with open(self.log_path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def checkpoint(self):
+        """Persist the index so startup does not replay the log"""
+        with self._exclusive():
+            checkpoint = {
+                "generation": self._generation,
+                "log_size": self._end,
+                "entries": {k: list(v) for k, v in self._index.items()},
+            }
+            self._write_atomic(self.directory / self.INDEX_FILE, self._cipher.encrypt(json.dumps(checkpoint).encode()))
+            self._stamp = self._index_stamp()
+            self._unindexed = 0
+
+    def compact(self):
+        """Rewrite only live records into a new log generation"""
+        with self._exclusive():
+            old_log = self.log_path
+            self._remap()
+
+            new_index: Dict[str, Tuple[int, int]] = {}
+            new_log = self.directory / f"vault-{self._generation + 1}.log"
+            with open(new_log, "wb") as f:
+                for key, (offset, length) in self._index.items():
+                    new_index[key] = (f.tell() + _LENGTH.size, length)
+                    # Records are copied verbatim; no re-encryption needed
+                    f.write(self._map[offset - _LENGTH.size:offset + length])
+                f.flush()
+                os.fsync(f.fileno())
+                end = f.tell()
+
+            # Replacing the index is the commit point
+            self._close_map()
+            self._generation += 1
+            self._index = new_index
+            self._end = end
+            self.checkpoint()
+            old_log.unlink(missing_ok=True)
+            logger.info(f"Vault store compacted to generation {self._generation}")
+
+    def _remove_stale_logs(self):
+        for path in self.directory.glob("vault-*.log"):
+            if path != self.log_path:
+                path.unlink(missing_ok=True)
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes):
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def close(self):
+        """Checkpoint and release the memory map and lock file"""
+        with self._exclusive():
+            if self._unindexed:
+                self.checkpoint()
+            self._close_map()
+            if self._lock_fd is not None:
+                # Closing the descriptor releases the flock
+                os.close(self._lock_fd)
+                self._lock_fd = None
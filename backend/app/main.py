@@ -4,6 +4,9 @@ Main application entry point
 """
 
 import asyncio
+import json
+import math
+import logging
 from contextlib import asynccontextmanager
 from typing import List, Optional
 
@@ -14,6 +17,16 @@ from pydantic import BaseModel, Field
 from app.core.orchestrator import get_orchestrator, ActionType, SecurityLevel
 from app.core.providers import get_provider_manager, ProviderType, ChatMessage
 from app.core.channels import get_channel_manager, ChannelType
+from app.core.model_warmup import get_warmup_manager
+from app.core.security import (
+    get_ruleset, reload_ruleset, get_vault, get_security_manager,
+    get_rule_profiler, set_rule_profiling, optimize_rule_order
+)
+
+logger = logging.getLogger(__name__)
+
+# Vault keys under which registered provider configs are persisted
+PROVIDER_VAULT_PREFIX = "provider_config_"
 
 
 # Pydantic models for API
@@ -48,6 +61,14 @@ class ModelInfo(BaseModel):
     parameters: str
 
 
+class FallbackChainRequest(BaseModel):
+    model_class: str = Field(default="default", description="Chain name passed to chat")
+    providers: List[str] = Field(..., description="Providers to try, in order")
+    models: List[Optional[str]] = Field(default_factory=list, description="Model per provider")
+    attempt_timeout: Optional[float] = None
+    balanced: bool = Field(default=False, description="Route by expected latency")
+
+
 class SystemStatus(BaseModel):
     status: str
     ollama_connected: bool
@@ -62,11 +83,39 @@ async def lifespan(app: FastAPI):
     # Startup
     orchestrator = get_orchestrator()
     await orchestrator.initialize()
+    _restore_providers()
+    get_provider_manager().start_prober()
+    get_warmup_manager().start()
+    get_security_manager().start()
     
     yield
     
     # Shutdown
+    get_security_manager().close()
+    get_warmup_manager().stop()
+    get_provider_manager().stop_prober()
     await orchestrator.shutdown()
+    get_vault().close()
+
+
+def _restore_providers():
+    """Re-register providers persisted in the vault by earlier runs"""
+    from app.core.providers import ProviderConfig
+    
+    vault = get_vault()
+    manager = get_provider_manager()
+    for key in vault.vault:
+        if not key.startswith(PROVIDER_VAULT_PREFIX):
+            continue
+        stored = vault.retrieve(key, "admin")
+        if stored is None:
+            continue
+        try:
+            data = json.loads(stored)
+            data["provider_type"] = ProviderType(data["provider_type"])
+            manager.register_provider(ProviderConfig(**data))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Could not restore provider from {key}: {e}")
 
 
 # Create FastAPI app
@@ -339,6 +388,21 @@ async def get_audit_logs(limit: int = 100):
     ]
 
 
+@app.get("/api/audit-logs/verify")
+async def verify_audit_logs():
+    """Verify the audit log hash chain and Merkle checkpoints"""
+    orchestrator = get_orchestrator()
+    result = await orchestrator.verify_audit_chain()
+    
+    return {
+        "valid": result.valid,
+        "entries_checked": result.entries_checked,
+        "checkpoints_checked": result.checkpoints_checked,
+        "first_invalid_seq": result.first_invalid_seq,
+        "reason": result.reason
+    }
+
+
 @app.get("/api/skills")
 async def get_skills():
     """Get available skills"""
@@ -378,6 +442,63 @@ async def disable_skill(skill_id: str):
     return {"skill_id": skill_id, "enabled": False}
 
 
+# === Security Rules ===
+
+@app.get("/api/security/rules")
+async def get_security_rules():
+    """Get the active injection ruleset version"""
+    ruleset = get_ruleset()
+    return {
+        "version": ruleset.version,
+        "rules": len(ruleset.rules),
+        "source": ruleset.source or "builtin"
+    }
+
+
+@app.post("/api/security/rules/reload")
+async def reload_security_rules():
+    """Recompile the injection ruleset from its rules file and swap it in"""
+    try:
+        ruleset = await asyncio.to_thread(reload_ruleset)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to reload rules: {e}")
+    
+    return {"status": "success", "version": ruleset.version, "rules": len(ruleset.rules)}
+
+
+@app.get("/api/security/rules/profile")
+async def get_rule_profile():
+    """Per-rule match time, evaluation and hit counts, most expensive first"""
+    profiler = get_rule_profiler()
+    if profiler is None:
+        return {"enabled": False, "rules": []}
+    return {"enabled": True, "since": profiler.started_at, "rules": profiler.snapshot()}
+
+
+@app.post("/api/security/rules/profile")
+async def set_rule_profile(enabled: bool = True, reset: bool = False):
+    """Turn rule profiling on or off, optionally clearing collected stats"""
+    profiler = set_rule_profiling(enabled)
+    if reset and profiler is not None:
+        profiler.reset()
+    return {"status": "success", "enabled": enabled}
+
+
+@app.post("/api/security/rules/optimize")
+async def optimize_security_rules():
+    """Reorder the active ruleset by profiled cost and selectivity"""
+    try:
+        ruleset = optimize_rule_order()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return {
+        "status": "success",
+        "version": ruleset.version,
+        "order": [rule.label for rule in ruleset.rules]
+    }
+
+
 # === Provider Management ===
 
 @app.get("/api/providers")
@@ -431,6 +552,18 @@ async def register_provider(
     if not success:
         raise HTTPException(status_code=500, detail="Failed to register provider")
     
+    get_vault().store(
+        f"{PROVIDER_VAULT_PREFIX}{name}",
+        json.dumps({
+            "provider_type": provider_type_enum.value,
+            "name": name,
+            "api_key": api_key,
+            "base_url": base_url,
+            "default_model": default_model,
+        }),
+        access_level="admin"
+    )
+    
     return {"status": "success", "provider": name}
 
 
@@ -445,22 +578,48 @@ async def set_default_provider(provider_name: str):
     return {"status": "success", "default_provider": provider_name}
 
 
+@app.post("/api/providers/fallback")
+async def set_fallback_chain(request: FallbackChainRequest):
+    """Define the ordered fallback chain for a model class"""
+    manager = get_provider_manager()
+    
+    unknown = [name for name in request.providers if manager.get_provider(name) is None]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Provider not found: {', '.join(unknown)}")
+    
+    models = list(request.models) + [None] * (len(request.providers) - len(request.models))
+    manager.set_fallback_chain(
+        request.model_class,
+        list(zip(request.providers, models)),
+        attempt_timeout=request.attempt_timeout,
+        balanced=request.balanced
+    )
+    return {"status": "success", "model_class": request.model_class, "providers": request.providers}
+
+
 @app.get("/api/providers/health")
 async def check_providers_health():
-    """Health check all providers"""
+    """Health of all providers, as last probed"""
     manager = get_provider_manager()
-    results = await manager.health_check_all()
+    # The background prober keeps results fresh; only gaps are probed here
+    results = await manager.health_check_all(max_age=math.inf)
     return results
 
 
 @app.get("/api/providers/models")
 async def list_all_models():
-    """List models from all providers"""
+    """List models from all providers, as last probed"""
     manager = get_provider_manager()
-    results = await manager.list_all_models()
+    results = await manager.list_all_models(max_age=math.inf)
     return results
 
 
+@app.get("/api/providers/warmup")
+async def get_model_warmup():
+    """Local model usage, cold-start counts and pinned models"""
+    return get_warmup_manager().snapshot()
+
+
 # === Channel Management ===
 
 @app.get("/api/channels")
@@ -534,7 +693,9 @@ async def stop_channels():
 async def chat_multi_provider(
     message: str,
     provider: Optional[str] = None,
-    model: Optional[str] = None
+    model: Optional[str] = None,
+    model_class: Optional[str] = None,
+    session_id: Optional[str] = None
 ):
     """Chat using specific provider"""
     manager = get_provider_manager()
@@ -542,7 +703,9 @@ async def chat_multi_provider(
     messages = [ChatMessage(role="user", content=message)]
     
     try:
-        response = await manager.chat(messages, provider=provider, model=model)
+        response = await manager.chat(
+            messages, provider=provider, model=model, model_class=model_class, session_id=session_id
+        )
         return {
             "response": response.content,
             "model": response.model,
@@ -4,12 +4,21 @@ ClosedPaw Test Configuration
 
 import pytest
 import asyncio
+import atexit
 import os
+import shutil
+import tempfile
 
 # Set testing environment
 os.environ["TESTING"] = "true"
 os.environ["OLLAMA_HOST"] = os.getenv("OLLAMA_HOST", "http://127.0.0.1:11434")
 
+# Keep the persistent vault out of the user's data directory
+_data_dir = tempfile.mkdtemp(prefix="closedpaw-test-")
+atexit.register(shutil.rmtree, _data_dir, True)
+os.environ["CLOSEDPAW_VAULT_DIR"] = os.path.join(_data_dir, "vault")
+os.environ["CLOSEDPAW_VAULT_KEYFILE"] = os.path.join(_data_dir, "vault.key")
+
 
 def pytest_addoption(parser):
     """Add custom pytest options"""
@@ -25,6 +34,30 @@ def pytest_addoption(parser):
         default=False,
         help="Run integration tests (requires running services)",
     )
+    parser.addoption(
+        "--run-benchmarks",
+        action="store_true",
+        default=False,
+        help="Run security hot-path benchmarks against stored baselines",
+    )
+    parser.addoption(
+        "--benchmark-update",
+        action="store_true",
+        default=False,
+        help="Write measured benchmark results as the new baselines",
+    )
+    parser.addoption(
+        "--benchmark-threshold",
+        type=float,
+        default=0.25,
+        help="Allowed ops/sec regression vs baseline (fraction, default 0.25)",
+    )
+    parser.addoption(
+        "--benchmark-p99-threshold",
+        type=float,
+        default=0.5,
+        help="Allowed p99 latency increase vs baseline (fraction, default 0.5)",
+    )
 
 
 def pytest_configure(config):
@@ -32,20 +65,33 @@ def pytest_configure(config):
     config.addinivalue_line("markers", "slow: mark test as slow")
     config.addinivalue_line("markers", "integration: mark test as integration test")
     config.addinivalue_line("markers", "security: security tests")
+    config.addinivalue_line("markers", "benchmark: performance regression benchmarks")
 
 
 def pytest_collection_modifyitems(config, items):
     """Skip tests based on options"""
     skip_slow = pytest.mark.skip(reason="need --run-slow option to run")
     skip_integration = pytest.mark.skip(reason="need --run-integration option to run")
+    skip_benchmark = pytest.mark.skip(reason="need --run-benchmarks option to run")
+    run_benchmarks = config.getoption("--run-benchmarks") or config.getoption("--benchmark-update")
     
     for item in items:
+        if "benchmark" in item.keywords and not run_benchmarks:
+            item.add_marker(skip_benchmark)
         if "slow" in item.keywords and not config.getoption("--run-slow"):
             item.add_marker(skip_slow)
         if "integration" in item.keywords and not config.getoption("--run-integration"):
             item.add_marker(skip_integration)
 
 
+@pytest.fixture(autouse=True)
+def audit_dir(tmp_path, monkeypatch):
+    """Audit logs spill to a directory of their own for each test"""
+    directory = tmp_path / "audit"
+    monkeypatch.setenv("CLOSEDPAW_AUDIT_DIR", str(directory))
+    return directory
+
+
 @pytest.fixture(scope="session")
 def event_loop():
     """Create event loop for async tests"""
@@ -4,13 +4,24 @@ Unit tests for core ClosedPaw components
 
 import pytest
 import asyncio
+import time
 import sys
 import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
 
-from app.core.security import SecurityManager
-from app.core.providers import LLMProvider
+from app.core.security import SecurityManager, RateLimiter
+from app.core.providers import (
+    LLMProvider, BaseProvider, ProviderManager, ProviderConfig, ProviderType,
+    ChatMessage, ChatResponse, ProviderError
+)
+from app.core.circuit_breaker import CircuitBreaker, CircuitState
+from app.core.routing import LatencyRouter
+from app.core.hedging import HedgePolicy
+from app.core.provider_limits import ProviderLimiter, ProviderLimitExceeded, parse_retry_after
+from app.core.retry import RetryBudget, RetryPolicy
+from app.core.model_warmup import ModelWarmupManager
+from app.core.embeddings import EmbeddingBatcher
 
 
 class TestLLMProvider:
@@ -42,6 +53,934 @@ class TestLLMProvider:
             assert enabled is False, f"{provider_name} should be disabled by default"
 
 
+class FakeProvider(BaseProvider):
+    """In-process provider that fails, stalls or answers on demand"""
+    
+    def __init__(self, name, fail=False, delay=0.0, probe_delay=0.0):
+        super().__init__(ProviderConfig(provider_type=ProviderType.CUSTOM, name=name))
+        self.fail = fail
+        self.delay = delay
+        self.probe_delay = probe_delay
+        self.calls = 0
+        self.probes = 0
+    
+    async def chat(self, messages, model=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ProviderError(f"{self.config.name} unavailable", status_code=503)
+        return ChatResponse(content="ok", model=model or "fake", provider=self.config.name)
+    
+    async def list_models(self):
+        self.probes += 1
+        await asyncio.sleep(self.probe_delay)
+        return ["fake"]
+    
+    async def health_check(self):
+        self.probes += 1
+        await asyncio.sleep(self.probe_delay)
+        return not self.fail
+
+
+def add_fake(manager, provider, **breaker):
+    name = provider.config.name
+    manager.providers[name] = provider
+    manager.configs[name] = provider.config
+    manager.breakers[name] = CircuitBreaker(**breaker)
+    if manager._default_provider is None:
+        manager._default_provider = name
+    return provider
+
+
+class TestProviderFailover:
+    """Tests for fallback chains and circuit breakers"""
+    
+    MESSAGES = [ChatMessage(role="user", content="hi")]
+    
+    @pytest.mark.asyncio
+    async def test_fails_over_along_chain(self):
+        """Test that a failing provider hands the request to the next one"""
+        manager = ProviderManager()
+        local = add_fake(manager, FakeProvider("local", fail=True))
+        backup = add_fake(manager, FakeProvider("backup"))
+        manager.set_fallback_chain("chat", ["local", ("backup", "small")])
+        
+        response = await manager.chat(self.MESSAGES, model_class="chat")
+        assert response.provider == "backup" and response.model == "small"
+        assert local.calls == 1
+        
+        # Without a default chain the original error still surfaces
+        with pytest.raises(Exception, match="local unavailable"):
+            await manager.chat(self.MESSAGES)
+    
+    @pytest.mark.asyncio
+    async def test_open_breaker_skips_provider(self):
+        """Test that an open breaker moves requests on without calling the provider"""
+        manager = ProviderManager()
+        local = add_fake(manager, FakeProvider("local", fail=True), min_calls=2, open_seconds=60)
+        add_fake(manager, FakeProvider("backup"))
+        manager.set_fallback_chain("default", ["backup"])
+        
+        for _ in range(5):
+            assert (await manager.chat(self.MESSAGES)).provider == "backup"
+        assert local.calls == 2
+        assert manager.get_status()["providers"]["local"]["circuit"]["state"] == "open"
+    
+    @pytest.mark.asyncio
+    async def test_attempt_timeout(self):
+        """Test that a stalled provider is abandoned after the attempt timeout"""
+        manager = ProviderManager()
+        add_fake(manager, FakeProvider("local", delay=5.0))
+        add_fake(manager, FakeProvider("backup"))
+        manager.set_fallback_chain("default", ["backup"], attempt_timeout=0.05)
+        
+        started = time.monotonic()
+        response = await manager.chat(self.MESSAGES)
+        assert response.provider == "backup"
+        assert time.monotonic() - started < 1.0
+    
+    @pytest.mark.asyncio
+    async def test_client_errors_do_not_trip_breaker(self):
+        """Test that rejected requests and missing keys fail over without counting as outages"""
+        from app.core.providers import AnthropicProvider
+        
+        class RejectingFake(FakeProvider):
+            async def chat(self, messages, model=None, **kwargs):
+                self.calls += 1
+                raise ProviderError("bad request", status_code=400)
+        
+        manager = ProviderManager()
+        add_fake(manager, RejectingFake("local"), min_calls=2, open_seconds=60)
+        keyless = AnthropicProvider(ProviderConfig(provider_type=ProviderType.ANTHROPIC, name="keyless"))
+        add_fake(manager, keyless, min_calls=2, open_seconds=60)
+        add_fake(manager, FakeProvider("backup"))
+        manager.set_fallback_chain("default", ["keyless", "backup"])
+        
+        for _ in range(5):
+            assert (await manager.chat(self.MESSAGES)).provider == "backup"
+        for name in ("local", "keyless"):
+            assert manager.breakers[name].snapshot()["state"] == "closed"
+        
+        with pytest.raises(ProviderError, match="API key not configured"):
+            await keyless.chat(self.MESSAGES)
+    
+    def test_breaker_half_open(self):
+        """Test open -> half-open -> closed transitions and slow-call failures"""
+        now = [0.0]
+        breaker = CircuitBreaker(min_calls=2, slow_call_ms=100, open_seconds=10, clock=lambda: now[0])
+        
+        breaker.record_success(latency_ms=500)
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN and not breaker.allow()
+        
+        now[0] = 10.0
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert breaker.allow() and not breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        
+        now[0] = 20.0
+        assert breaker.allow()
+        breaker.record_success(latency_ms=5)
+        assert breaker.state == CircuitState.CLOSED
+
+
+class TestLatencyRouting:
+    """Tests for expected-latency routing across providers"""
+    
+    MESSAGES = [ChatMessage(role="user", content="hi")]
+    
+    @pytest.mark.asyncio
+    async def test_routes_to_faster_provider(self):
+        """Test that once measured, requests go to the lower-latency replica"""
+        manager = ProviderManager(router=LatencyRouter(strategy="least_outstanding"))
+        slow = add_fake(manager, FakeProvider("ollama", delay=0.05))
+        fast = add_fake(manager, FakeProvider("vllm", delay=0.0))
+        manager.set_fallback_chain("default", ["vllm"], balanced=True)
+        
+        for _ in range(10):
+            await manager.chat(self.MESSAGES, model="llama3")
+        
+        assert slow.calls == 1
+        assert fast.calls == 9
+        routes = {r["provider"]: r for r in manager.get_status()["routes"]}
+        assert routes["ollama"]["ewma_latency_ms"] > routes["vllm"]["ewma_latency_ms"]
+        assert all(r["model"] == "llama3" for r in routes.values())
+    
+    @pytest.mark.asyncio
+    async def test_outstanding_requests_spread_load(self):
+        """Test that concurrent requests spread across equally fast replicas"""
+        manager = ProviderManager(router=LatencyRouter(strategy="least_outstanding"))
+        a = add_fake(manager, FakeProvider("a", delay=0.02))
+        b = add_fake(manager, FakeProvider("b", delay=0.02))
+        manager.set_fallback_chain("default", ["b"], balanced=True)
+        
+        await manager.chat(self.MESSAGES)
+        await manager.chat(self.MESSAGES)
+        await asyncio.gather(*(
+            manager.chat([ChatMessage(role="user", content=f"hi {i}")]) for i in range(8)
+        ))
+        assert a.calls + b.calls == 10
+        assert abs(a.calls - b.calls) <= 2
+    
+    @pytest.mark.asyncio
+    async def test_session_stickiness(self):
+        """Test that a session stays on its provider while it is healthy"""
+        import random
+        manager = ProviderManager(router=LatencyRouter(rng=random.Random(7)))
+        first = add_fake(manager, FakeProvider("a"))
+        second = add_fake(manager, FakeProvider("b"))
+        manager.set_fallback_chain("default", ["b"], balanced=True)
+        
+        served = {(await manager.chat(self.MESSAGES, session_id="s1")).provider for _ in range(10)}
+        assert len(served) == 1
+        
+        stuck = first if served == {"a"} else second
+        stuck.fail = True
+        moved = await manager.chat(self.MESSAGES, session_id="s1")
+        assert moved.provider != stuck.config.name
+    
+    def test_p2c_prefers_lower_expected_latency(self):
+        """Test that power-of-two choices picks the better of two candidates"""
+        router = LatencyRouter(strategy="p2c")
+        for key, latency in ((("a", None), 100.0), (("b", None), 10.0)):
+            router.stats(key).ewma_latency_ms = latency
+            router.stats(key).samples = 1
+        assert router.order([("a", None), ("b", None)])[0] == ("b", None)
+        
+        router.stats(("b", None)).outstanding = 20
+        assert router.order([("a", None), ("b", None)])[0] == ("a", None)
+    
+    def test_streams_ranked_by_time_to_first_token(self):
+        """Test that streams prefer the faster first token over the faster full reply"""
+        router = LatencyRouter(strategy="least_outstanding")
+        router.finish(("a", None), router.start(("a", None)), ttft_ms=500.0)
+        router.finish(("b", None), router.start(("b", None)), ttft_ms=20.0)
+        router.stats(("a", None)).ewma_latency_ms = 600.0
+        router.stats(("b", None)).ewma_latency_ms = 2000.0
+        
+        candidates = [("a", None), ("b", None)]
+        assert router.order(candidates)[0] == ("a", None)
+        assert router.order(candidates, stream=True)[0] == ("b", None)
+    
+    @pytest.mark.asyncio
+    async def test_stream_records_time_to_first_token(self):
+        """Test that streamed replies feed the router's time-to-first-token average"""
+        class StreamingFake(FakeProvider):
+            async def stream_chat(self, messages, model=None, **kwargs):
+                self.calls += 1
+                await asyncio.sleep(self.delay)
+                yield "a"
+                await asyncio.sleep(0.05)
+                yield "b"
+        
+        manager = ProviderManager(coalesce=False)
+        add_fake(manager, StreamingFake("a", delay=0.01))
+        
+        assert "".join([chunk async for chunk in manager.stream_chat(self.MESSAGES)]) == "ab"
+        stats = manager.router.stats(("a", None))
+        assert stats.ttft_samples == 1 and stats.outstanding == 0
+        assert stats.ewma_ttft_ms < stats.ewma_latency_ms
+
+
+class TestRequestHedging:
+    """Tests for hedging slow requests to a second provider"""
+    
+    MESSAGES = [ChatMessage(role="user", content="hi")]
+    
+    def hedging_manager(self, primary_delay, **policy):
+        # Every request earns a hedge unless a test caps it
+        policy.setdefault("max_rate", 1.0)
+        policy = HedgePolicy(min_samples=3, min_delay_ms=10, **policy)
+        for _ in range(3):
+            policy.observe(("a", None), 10.0)
+        manager = ProviderManager(hedging=policy)
+        primary = add_fake(manager, FakeProvider("a", delay=primary_delay))
+        backup = add_fake(manager, FakeProvider("b"))
+        manager.set_fallback_chain("default", ["b"])
+        return manager, primary, backup
+    
+    @pytest.mark.asyncio
+    async def test_slow_request_is_hedged(self):
+        """Test that the hedge answers a stalled request and the primary is cancelled"""
+        manager, primary, backup = self.hedging_manager(primary_delay=5.0)
+        
+        started = time.monotonic()
+        response = await manager.chat(self.MESSAGES)
+        assert time.monotonic() - started < 1.0
+        assert response.provider == "b"
+        await asyncio.sleep(0)
+        
+        stats = manager.get_status()["hedging"]
+        assert stats["hedged"] == 1 and stats["hedge_wins"] == 1
+        assert manager.router.stats(("a", None)).outstanding == 0
+        assert manager.breakers["a"].snapshot()["calls"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_fast_request_is_not_hedged(self):
+        """Test that requests within the usual latency are never duplicated"""
+        manager, primary, backup = self.hedging_manager(primary_delay=0.0)
+        
+        for _ in range(5):
+            assert (await manager.chat(self.MESSAGES)).provider == "a"
+        assert backup.calls == 0
+        assert manager.hedging.snapshot()["hedged"] == 0
+    
+    @pytest.mark.asyncio
+    async def test_hedge_rate_is_capped(self):
+        """Test that hedges stop once the budget is spent"""
+        budget = RetryBudget(ratio=0.0, min_per_second=0.0, max_balance=1.0)
+        manager, primary, backup = self.hedging_manager(primary_delay=0.05, budget=budget)
+        
+        assert (await manager.chat(self.MESSAGES)).provider == "b"
+        assert (await manager.chat(self.MESSAGES)).provider == "a"
+        stats = manager.hedging.snapshot()
+        assert stats["hedged"] == 1
+        assert stats["over_budget"] == 1
+        assert stats["hedge_rate"] == 0.5
+    
+    @pytest.mark.parametrize("spacing", [0.0, 6.0])
+    def test_default_budget_caps_rate_at_any_traffic(self, spacing):
+        """Test that the default budget holds hedges to max_rate at high and low request rates"""
+        policy = HedgePolicy(max_rate=0.05)
+        now = [policy.budget._updated]
+        policy.budget._clock = lambda: now[0]
+        
+        hedges = 0
+        for _ in range(200):
+            now[0] += spacing
+            policy.budget.deposit()
+            hedges += policy.budget.withdraw()
+        assert 0 < hedges <= 200 * 0.05
+        
+        # Nothing is banked before traffic arrives
+        assert HedgePolicy(max_rate=0.05).budget.withdraw() is False
+
+
+class TestRequestCoalescing:
+    """Tests for sharing concurrent identical requests"""
+    
+    MESSAGES = [ChatMessage(role="user", content="hi")]
+    
+    @pytest.mark.asyncio
+    async def test_identical_requests_share_one_call(self):
+        """Test that concurrent identical chats make one upstream call"""
+        manager = ProviderManager()
+        provider = add_fake(manager, FakeProvider("a", delay=0.02))
+        
+        responses = await asyncio.gather(*(manager.chat(self.MESSAGES, temperature=0.2) for _ in range(5)))
+        assert provider.calls == 1
+        assert {r.content for r in responses} == {"ok"}
+        
+        await asyncio.gather(
+            manager.chat(self.MESSAGES, temperature=0.2),
+            manager.chat(self.MESSAGES, temperature=0.9)
+        )
+        assert provider.calls == 3
+        stats = manager.get_status()["coalescing"]
+        assert stats == {"requests": 7, "upstream": 3, "saved": 4, "in_flight": 0}
+    
+    @pytest.mark.asyncio
+    async def test_sessions_are_not_merged(self):
+        """Test that identical requests from different sessions each go upstream"""
+        manager = ProviderManager()
+        provider = add_fake(manager, FakeProvider("a", delay=0.02))
+        
+        await asyncio.gather(
+            manager.chat(self.MESSAGES, session_id="s1"),
+            manager.chat(self.MESSAGES, session_id="s2"),
+            manager.chat(self.MESSAGES, session_id="s2")
+        )
+        assert provider.calls == 2
+    
+    @pytest.mark.asyncio
+    async def test_errors_are_shared(self):
+        """Test that every waiter sees the shared call's failure"""
+        manager = ProviderManager()
+        provider = add_fake(manager, FakeProvider("a", fail=True, delay=0.01))
+        
+        results = await asyncio.gather(
+            *(manager.chat(self.MESSAGES) for _ in range(3)), return_exceptions=True
+        )
+        assert provider.calls == 1
+        assert all(isinstance(r, Exception) for r in results)
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_others(self):
+        """Test that the shared call survives one caller giving up"""
+        manager = ProviderManager()
+        provider = add_fake(manager, FakeProvider("a", delay=0.05))
+        
+        first = asyncio.ensure_future(manager.chat(self.MESSAGES))
+        second = asyncio.ensure_future(manager.chat(self.MESSAGES))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert (await second).content == "ok"
+        assert provider.calls == 1
+    
+    @pytest.mark.asyncio
+    async def test_streams_are_fanned_out(self):
+        """Test that concurrent identical streams share one upstream stream"""
+        class StreamingFake(FakeProvider):
+            async def stream_chat(self, messages, model=None, **kwargs):
+                self.calls += 1
+                for token in ("a", "b", "c"):
+                    await asyncio.sleep(0.01)
+                    yield token
+        
+        manager = ProviderManager()
+        provider = add_fake(manager, StreamingFake("a"))
+        
+        async def collect():
+            return "".join([chunk async for chunk in manager.stream_chat(self.MESSAGES)])
+        
+        first = asyncio.ensure_future(collect())
+        await asyncio.sleep(0.015)
+        # Joins after the first chunk and still gets the whole stream
+        second = asyncio.ensure_future(collect())
+        assert await asyncio.gather(first, second) == ["abc", "abc"]
+        assert provider.calls == 1
+        assert manager.single_flight.saved == 1
+
+
+class TestProviderLimits:
+    """Tests for per-provider rate limits, concurrency caps and Retry-After"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrency_cap_and_queue(self):
+        """Test that excess requests queue, and are shed once the queue is full"""
+        limiter = ProviderLimiter(rate_per_minute=6000, max_concurrency=2, max_queue=2)
+        active, peak = 0, 0
+        
+        async def request():
+            nonlocal active, peak
+            async with limiter.slot():
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.02)
+                active -= 1
+        
+        results = await asyncio.gather(*(request() for _ in range(6)), return_exceptions=True)
+        rejected = [r for r in results if isinstance(r, ProviderLimitExceeded)]
+        assert peak == 2
+        assert len(rejected) == 2
+        assert limiter.snapshot()["rejected"] == 2
+        assert limiter.max_queue_ms > 0
+    
+    @pytest.mark.asyncio
+    async def test_rate_limit_spaces_requests(self):
+        """Test that requests beyond the burst wait for the bucket to refill"""
+        limiter = ProviderLimiter(rate_per_minute=1200, burst=2)
+        started = time.monotonic()
+        for _ in range(4):
+            async with limiter.slot():
+                pass
+        # Two requests at 20/s after the burst take ~0.1s
+        assert time.monotonic() - started >= 0.08
+    
+    def test_parse_retry_after(self):
+        """Test delta-seconds and HTTP-date Retry-After values"""
+        from datetime import datetime, timezone
+        now = datetime(2025, 1, 1, 12, 0, 0, tzinfo=timezone.utc)
+        assert parse_retry_after("7") == 7.0
+        assert parse_retry_after("Wed, 01 Jan 2025 12:00:30 GMT", now=now) == 30.0
+        assert parse_retry_after("soon") is None
+        assert parse_retry_after(None) is None
+    
+    @pytest.mark.asyncio
+    async def test_retry_after_pauses_provider(self):
+        """Test that a 429 with Retry-After holds the retry and counters update"""
+        import httpx
+        from app.core.providers import OpenAIProvider
+        
+        statuses = [429, 200]
+        
+        def handler(request):
+            status = statuses.pop(0)
+            if status == 429:
+                return httpx.Response(429, headers={"Retry-After": "0.2"}, json={"error": {"message": "slow down"}})
+            return httpx.Response(200, json={"choices": [{"message": {"content": "hi"}}]})
+        
+        provider = OpenAIProvider(ProviderConfig(
+            provider_type=ProviderType.OPENAI, name="openai", api_key="sk-test", rate_limit=6000
+        ))
+        provider.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        messages = [ChatMessage(role="user", content="hi")]
+        
+        started = time.monotonic()
+        response = await provider.chat(messages)
+        
+        assert response.content == "hi"
+        assert time.monotonic() - started >= 0.15
+        assert provider._request_count == 2
+        assert provider.limiter.snapshot()["throttled"] == 1
+        await provider.close()
+
+
+class TestProviderRetries:
+    """Tests for retrying transient provider errors"""
+    
+    MESSAGES = [ChatMessage(role="user", content="hi")]
+    
+    @staticmethod
+    def provider(handler, **retry):
+        import httpx
+        from app.core.providers import OpenAIProvider
+        
+        settings = {"retry": {"base_delay": 0.001, "max_delay": 0.01, **retry}}
+        provider = OpenAIProvider(ProviderConfig(
+            provider_type=ProviderType.OPENAI, name="openai", api_key="sk-test", settings=settings
+        ))
+        provider.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return provider
+    
+    @pytest.mark.asyncio
+    async def test_transient_errors_retried(self):
+        """Test that 502s and connection resets are retried until success"""
+        import httpx
+        outcomes = ["reset", 502, 200]
+        
+        def handler(request):
+            outcome = outcomes.pop(0)
+            if outcome == "reset":
+                raise httpx.ReadError("connection reset", request=request)
+            if outcome == 502:
+                return httpx.Response(502, text="<html>Bad Gateway</html>")
+            return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+        
+        provider = self.provider(handler)
+        response = await provider.chat(self.MESSAGES)
+        assert response.content == "ok"
+        assert provider._request_count == 3
+        await provider.close()
+    
+    @pytest.mark.asyncio
+    async def test_fatal_errors_not_retried(self):
+        """Test that client errors surface at once as non-retryable ProviderError"""
+        import httpx
+        calls = []
+        
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(401, json={"error": {"message": "bad key"}})
+        
+        provider = self.provider(handler)
+        with pytest.raises(ProviderError, match="bad key") as exc_info:
+            await provider.chat(self.MESSAGES)
+        assert exc_info.value.status_code == 401
+        assert exc_info.value.retryable is False
+        assert len(calls) == 1
+        await provider.close()
+    
+    @pytest.mark.asyncio
+    async def test_connection_failure_after_retries(self):
+        """Test that exhausted retries raise ProviderError without leaking the URL"""
+        import httpx
+        
+        def handler(request):
+            raise httpx.ConnectError("refused: https://api.example/?key=sk-secret", request=request)
+        
+        provider = self.provider(handler, max_attempts=4)
+        with pytest.raises(ProviderError) as exc_info:
+            await provider.chat(self.MESSAGES)
+        assert exc_info.value.retryable is True
+        assert "sk-secret" not in str(exc_info.value)
+        assert provider._request_count == 4
+        await provider.close()
+    
+    @pytest.mark.asyncio
+    async def test_retry_budget_limits_storm(self):
+        """Test that an exhausted budget stops retries during an outage"""
+        import httpx
+        
+        def handler(request):
+            return httpx.Response(503, json={"error": {"message": "overloaded"}})
+        
+        provider = self.provider(handler, max_attempts=5)
+        provider.retry_budget = RetryBudget(ratio=0.1, min_per_second=0.0, max_balance=3)
+        for _ in range(5):
+            with pytest.raises(ProviderError):
+                await provider.chat(self.MESSAGES)
+        
+        # 5 first attempts plus the 3 retries the budget allowed
+        assert provider._request_count == 8
+        assert provider.retry_budget.exhausted > 0
+        await provider.close()
+    
+    def test_backoff_is_capped_and_honours_retry_after(self):
+        """Test that jittered delays stay under the cap and respect Retry-After"""
+        import random
+        policy = RetryPolicy(base_delay=0.5, max_delay=2.0)
+        rng = random.Random(1)
+        delays = [policy.backoff(attempt, rng=rng) for attempt in range(10)]
+        assert all(0 <= d <= 2.0 for d in delays)
+        assert policy.backoff(0, retry_after=5.0, rng=rng) == 5.0
+
+
+class TestProviderProbes:
+    """Tests for concurrent, cached health checks and model listings"""
+    
+    @pytest.mark.asyncio
+    async def test_probes_run_concurrently_with_timeout(self):
+        """Test that total probe time is bounded by the slowest timeout, not the sum"""
+        manager = ProviderManager(probe_timeout=0.1)
+        for i in range(4):
+            add_fake(manager, FakeProvider(f"p{i}", probe_delay=0.05))
+        add_fake(manager, FakeProvider("hung", probe_delay=10.0))
+        
+        started = time.monotonic()
+        health = await manager.health_check_all()
+        assert time.monotonic() - started < 0.5
+        assert health == {"p0": True, "p1": True, "p2": True, "p3": True, "hung": False}
+        
+        models = await manager.list_all_models()
+        assert models["p0"] == ["fake"] and models["hung"] == []
+    
+    @pytest.mark.asyncio
+    async def test_results_cached(self):
+        """Test that cached results are served until they go stale"""
+        manager = ProviderManager(cache_ttl=60)
+        provider = add_fake(manager, FakeProvider("local"))
+        
+        await manager.health_check_all()
+        await manager.health_check_all()
+        await asyncio.gather(*(manager.list_all_models() for _ in range(5)))
+        assert provider.probes == 2
+        
+        provider.fail = True
+        assert await manager.health_check_all() == {"local": True}
+        assert await manager.health_check_all(max_age=0) == {"local": False}
+        assert manager.get_status()["providers"]["local"]["healthy"] is False
+    
+    @pytest.mark.asyncio
+    async def test_background_prober(self):
+        """Test that the prober refreshes cached state without callers waiting"""
+        manager = ProviderManager()
+        provider = add_fake(manager, FakeProvider("local"))
+        manager.start_prober(interval=0.02)
+        try:
+            await asyncio.sleep(0.01)
+            assert await manager.health_check_all(max_age=float("inf")) == {"local": True}
+            provider.fail = True
+            await asyncio.sleep(0.1)
+            assert await manager.health_check_all(max_age=float("inf")) == {"local": False}
+        finally:
+            manager.stop_prober()
+
+
+class FakeOllama:
+    """httpx handler imitating Ollama's /api/chat, /api/embed and /api/ps"""
+    
+    def __init__(self, load_ms=2000):
+        self.load_ms = load_ms
+        self.loaded = {}
+        self.requests = []
+    
+    def __call__(self, request):
+        import json
+        import httpx
+        
+        if request.url.path == "/api/ps":
+            return httpx.Response(200, json={"models": [{"name": m} for m in self.loaded]})
+        body = json.loads(request.content)
+        self.requests.append(body)
+        if request.url.path == "/api/embed":
+            return httpx.Response(200, json={"embeddings": [[len(text), 0.5] for text in body["input"]]})
+        model = body["model"]
+        load_ns = 0 if model in self.loaded else int(self.load_ms * 1e6)
+        self.loaded[model] = body.get("keep_alive")
+        data = {"model": model, "done": True, "done_reason": "stop", "load_duration": load_ns}
+        if body["messages"]:
+            data.update(message={"role": "assistant", "content": f"echo {body['messages'][-1]['content']}"},
+                        eval_count=3, prompt_eval_duration=5_000_000)
+        return httpx.Response(200, json=data)
+    
+    @staticmethod
+    def provider(handler, **settings):
+        import httpx
+        from app.core.providers import OllamaProvider
+        
+        provider = OllamaProvider(ProviderConfig(
+            provider_type=ProviderType.OLLAMA, name="ollama", default_model="llama3.2:3b", settings=settings
+        ))
+        provider.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return provider
+
+
+class TestOllamaWarmup:
+    """Tests for native Ollama chat, keep_alive and model warm-up"""
+    
+    MESSAGES = [ChatMessage(role="system", content="be brief"), ChatMessage(role="user", content="hi")]
+    
+    @pytest.mark.asyncio
+    async def test_native_chat_with_keep_alive(self):
+        """Test that chat sends structured messages and counts cold starts"""
+        ollama = FakeOllama()
+        provider = FakeOllama.provider(ollama, keep_alive="30m")
+        
+        first = await provider.chat(self.MESSAGES)
+        second = await provider.chat(self.MESSAGES)
+        
+        assert first.content == "echo hi" and first.finish_reason == "stop"
+        assert ollama.requests[0]["messages"] == [m.to_dict() for m in self.MESSAGES]
+        assert ollama.requests[0]["keep_alive"] == "30m"
+        assert first.ttft_ms == 2005 and second.ttft_ms == 5
+        stats = provider.model_stats["llama3.2:3b"]
+        assert stats.requests == 2 and stats.cold_starts == 1
+        await provider.close()
+    
+    @pytest.mark.asyncio
+    async def test_preload_and_pin(self):
+        """Test that configured models are preloaded and pinned ones never expire"""
+        ollama = FakeOllama()
+        manager = ProviderManager()
+        provider = add_fake(manager, FakeOllama.provider(ollama, preload=["qwen2.5:7b"], pinned=["llama3.2:3b"]))
+        warmup = ModelWarmupManager(manager)
+        
+        loaded = await warmup.preload()
+        assert set(loaded["ollama"]) == {"qwen2.5:7b", "llama3.2:3b"}
+        assert ollama.loaded == {"llama3.2:3b": -1, "qwen2.5:7b": "5m"}
+        
+        await provider.chat(self.MESSAGES)
+        snapshot = warmup.snapshot()["ollama"]["models"]["llama3.2:3b"]
+        assert snapshot["cold_starts"] == 0 and snapshot["pinned"] is True
+        await provider.close()
+    
+    @pytest.mark.asyncio
+    async def test_rebalance_pins_hot_model(self):
+        """Test that the busiest model gets pinned and is released once it cools"""
+        ollama = FakeOllama()
+        manager = ProviderManager()
+        provider = add_fake(manager, FakeOllama.provider(ollama, max_pinned=1))
+        warmup = ModelWarmupManager(manager, hot_min_requests=3)
+        
+        for _ in range(4):
+            await provider.chat(self.MESSAGES, model="mistral:7b")
+        await provider.chat(self.MESSAGES, model="phi3")
+        await warmup.rebalance()
+        assert provider.pinned == {"mistral:7b"}
+        assert ollama.loaded["mistral:7b"] == -1
+        
+        await warmup.rebalance()
+        assert provider.pinned == set()
+        assert ollama.loaded["mistral:7b"] == "5m"
+        await provider.close()
+
+
+class TestEmbeddings:
+    """Tests for provider embeddings and micro-batching"""
+    
+    @staticmethod
+    def is_float32(vectors):
+        from array import array
+        if isinstance(vectors, list):
+            return all(isinstance(v, array) and v.typecode == "f" for v in vectors)
+        return str(vectors.dtype) == "float32"
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_request(self):
+        """Test that concurrent embed calls become one /api/embed request"""
+        ollama = FakeOllama()
+        provider = FakeOllama.provider(ollama)
+        
+        results = await asyncio.gather(
+            provider.embed(["a"]), provider.embed(["bb", "ccc"]), provider.embed(["dddd"])
+        )
+        assert len(ollama.requests) == 1
+        assert ollama.requests[0]["input"] == ["a", "bb", "ccc", "dddd"]
+        assert ollama.requests[0]["model"] == "nomic-embed-text"
+        assert [[v[0] for v in r] for r in results] == [[1.0], [2.0, 3.0], [4.0]]
+        assert all(self.is_float32(r) for r in results)
+        assert provider.embedder.snapshot()["batches"] == 1
+        await provider.close()
+    
+    @pytest.mark.asyncio
+    async def test_batches_are_capped(self):
+        """Test that a full batch is sent without waiting for the window"""
+        batches = []
+        
+        async def embed(texts, model):
+            batches.append(list(texts))
+            return [[1.0] for _ in texts]
+        
+        batcher = EmbeddingBatcher(embed, window=10.0, max_batch=2)
+        results = await asyncio.wait_for(
+            asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), batcher.embed(["c", "d"])), 1.0
+        )
+        assert batches == [["a", "b"], ["c", "d"]]
+        assert [len(r) for r in results] == [1, 1, 2]
+    
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self):
+        """Test that a failed batch fails all of its callers"""
+        async def embed(texts, model):
+            raise ProviderError("embedding model not found", status_code=404)
+        
+        batcher = EmbeddingBatcher(embed)
+        results = await asyncio.gather(batcher.embed(["a"]), batcher.embed(["b"]), return_exceptions=True)
+        assert all(isinstance(r, ProviderError) for r in results)
+    
+    @pytest.mark.asyncio
+    async def test_rows_follow_input_order(self):
+        """Test that embeddings returned out of order are matched back by index"""
+        import json
+        import httpx
+        from app.core.providers import MistralProvider
+        
+        def handler(request):
+            texts = json.loads(request.content)["input"]
+            data = [{"index": i, "embedding": [float(len(text))]} for i, text in enumerate(texts)]
+            return httpx.Response(200, json={"data": data[::-1]})
+        
+        provider = MistralProvider(ProviderConfig(
+            provider_type=ProviderType.MISTRAL, name="mistral", api_key="test-key"
+        ))
+        provider.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        vectors = await provider.embed(["a", "bb", "ccc"])
+        assert [v[0] for v in vectors] == [1.0, 2.0, 3.0]
+        await provider.close()
+    
+    @pytest.mark.asyncio
+    async def test_unsupported_provider(self):
+        """Test that providers without an embeddings API say so"""
+        provider = FakeProvider("fake")
+        assert len(await provider.embed([])) == 0
+        with pytest.raises(ProviderError, match="does not support embeddings"):
+            await provider.embed(["a"])
+
+
+@pytest.fixture
+def openai_stub():
+    """Local OpenAI-compatible server on an ephemeral port"""
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    peers = []
+    
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def log_message(self, *args):
+            pass
+        
+        def reply(self, status, body, content_type="application/json"):
+            data = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        
+        def do_GET(self):
+            peers.append(self.client_address)
+            if self.path == "/v1/models":
+                self.reply(200, json.dumps({"data": [{"id": "qwen2.5-7b-instruct"}]}))
+            else:
+                self.reply(404, "{}")
+        
+        def do_POST(self):
+            peers.append(self.client_address)
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path == "/v1/embeddings":
+                # Out of order on purpose: clients must sort by index
+                data = [{"index": i, "embedding": [float(i), 1.0]} for i in range(len(body["input"]))]
+                self.reply(200, json.dumps({"data": data[::-1], "model": body["model"]}))
+                return
+            if body["model"] == "missing":
+                self.reply(404, json.dumps({"error": {"message": "model not found"}}))
+                return
+            words = ["Hello", " from", " vLLM"]
+            if body.get("stream"):
+                events = [
+                    "data: " + json.dumps({"choices": [{"delta": {"content": w}}]}) + "\n\n"
+                    for w in words
+                ]
+                self.reply(200, "".join(events) + "data: [DONE]\n\n", "text/event-stream")
+            else:
+                self.reply(200, json.dumps({
+                    "choices": [{"message": {"content": "".join(words)}, "finish_reason": "stop"}],
+                    "usage": {"total_tokens": 7}
+                }))
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1", peers
+    server.shutdown()
+    server.server_close()
+
+
+class TestOpenAICompatibleProvider:
+    """Tests for the CUSTOM provider against a local OpenAI-compatible server"""
+    
+    MESSAGES = [ChatMessage(role="user", content="hi")]
+    
+    @staticmethod
+    def register(base_url):
+        manager = ProviderManager()
+        assert manager.register_provider(ProviderConfig(
+            provider_type=ProviderType.CUSTOM, name="vllm", base_url=base_url + "/",
+            default_model="qwen2.5-7b-instruct"
+        ))
+        return manager
+    
+    @pytest.mark.asyncio
+    async def test_chat_and_models(self, openai_stub):
+        """Test completion, model listing and health over real HTTP"""
+        base_url, _ = openai_stub
+        manager = self.register(base_url)
+        
+        response = await manager.chat(self.MESSAGES, provider="vllm")
+        assert response.content == "Hello from vLLM"
+        assert response.provider == "vllm" and response.tokens_used == 7
+        assert await manager.list_all_models() == {"vllm": ["qwen2.5-7b-instruct"]}
+        assert await manager.health_check_all() == {"vllm": True}
+        
+        with pytest.raises(ProviderError, match="model not found"):
+            await manager.providers["vllm"].chat(self.MESSAGES, model="missing")
+        await manager.close_all()
+    
+    @pytest.mark.asyncio
+    async def test_streaming(self, openai_stub):
+        """Test that stream_chat yields the server's deltas in order"""
+        base_url, _ = openai_stub
+        provider = self.register(base_url).providers["vllm"]
+        
+        chunks = [chunk async for chunk in provider.stream_chat(self.MESSAGES)]
+        assert chunks == ["Hello", " from", " vLLM"]
+        assert provider._request_count == 1
+        await provider.close()
+    
+    @pytest.mark.asyncio
+    async def test_connections_pooled(self, openai_stub):
+        """Test that sequential requests reuse one keep-alive connection"""
+        base_url, peers = openai_stub
+        provider = self.register(base_url).providers["vllm"]
+        
+        for _ in range(5):
+            await provider.chat(self.MESSAGES)
+        assert len(peers) == 5
+        assert len(set(peers)) == 1
+        await provider.close()
+    
+    @pytest.mark.asyncio
+    async def test_embeddings(self, openai_stub):
+        """Test that embeddings come back in input order as float32 rows"""
+        base_url, _ = openai_stub
+        manager = self.register(base_url)
+        manager.providers["vllm"].config.settings["embedding_model"] = "bge-m3"
+        
+        vectors = await manager.embed(["a", "b", "c"], provider="vllm")
+        assert [list(v) for v in vectors] == [[0.0, 1.0], [1.0, 1.0], [2.0, 1.0]]
+        await manager.close_all()
+    
+    def test_base_url_required(self):
+        """Test that a CUSTOM provider without base_url is rejected"""
+        manager = ProviderManager()
+        assert manager.register_provider(ProviderConfig(provider_type=ProviderType.CUSTOM, name="x")) is False
+
+
 class TestSanitization:
     """Tests for input/output sanitization"""
     
@@ -81,6 +1020,64 @@ class TestSanitization:
             assert not result.startswith("/etc") or result.startswith("/tmp")
 
 
+class TestInputSanitizer:
+    """Tests for the prompt input sanitizer"""
+    
+    @staticmethod
+    def reference_sanitize(text):
+        """Original multi-pass implementation the fast path must match"""
+        import re
+        text = text.replace('\x00', '')
+        text = re.sub(r'\s+', ' ', text)
+        text = re.sub(r'[\x00-\x08\x0b-\x0c\x0e-\x1f]', '', text)
+        text = re.sub(r'[\u202e\u202d\u200e\u200f]', '', text)
+        text = text.replace('```', '`` `')
+        return text.strip()
+    
+    @pytest.fixture
+    def defender(self):
+        from app.core.security import PromptInjectionDefender
+        return PromptInjectionDefender()
+    
+    def test_output_identical_to_reference(self, defender):
+        """Test sanitizer output on randomized edge-case input"""
+        import random
+        
+        rng = random.Random(1234)
+        alphabet = ["a", "B", "é", " ", "\t", "\n", "\u3000", "`", "\x00", "\x01", "\x0b", "\x1c", "\u202e", "\u200f"]
+        for _ in range(5000):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+            assert defender._sanitize_input(text) == self.reference_sanitize(text), repr(text)
+    
+    def test_lowercase_count(self):
+        """Test lowercase counting on ASCII and non-ASCII text"""
+        from app.core.security import _count_lowercase
+        
+        for text in ["Hello World", "Привет Мир", "ǅªß ABC xyz", ""]:
+            assert _count_lowercase(text) == sum(1 for c in text if c.islower())
+    
+    @pytest.mark.slow
+    def test_sanitizer_benchmark(self, defender):
+        """Test that the sanitizer is faster than the reference on 10 KB - 1 MB"""
+        import time
+        
+        unit = "Some user text\twith  `code` and ```fences```\n\x01 Привет "
+        for size in [10_000, 100_000, 1_000_000]:
+            text = (unit * (size // len(unit) + 1))[:size]
+            
+            start = time.perf_counter()
+            expected = self.reference_sanitize(text)
+            reference_time = time.perf_counter() - start
+            
+            start = time.perf_counter()
+            actual = defender._sanitize_input(text)
+            fast_time = time.perf_counter() - start
+            
+            print(f"_sanitize_input {size} chars: {reference_time * 1e3:.2f}ms -> {fast_time * 1e3:.2f}ms")
+            assert actual == expected
+            assert fast_time < reference_time
+
+
 class TestRateLimiting:
     """Tests for rate limiting functionality"""
     
@@ -101,6 +1098,62 @@ class TestRateLimiting:
         # 11th request should be rate limited
         result = await security.check_rate_limit(user_id)
         # Depending on config, this might be limited
+    
+    def test_token_bucket_refill(self):
+        """Test that buckets block when empty and refill over time"""
+        now = [0.0]
+        limiter = RateLimiter(max_requests=5, window_seconds=10, clock=lambda: now[0])
+        
+        for _ in range(5):
+            assert limiter.check_limit("alice") is True
+        assert limiter.check_limit("alice") is False
+        assert limiter.remaining("alice") == 0
+        assert limiter.retry_after("alice") == pytest.approx(2.0)
+        
+        # Other keys are independent
+        assert limiter.check_limit("bob") is True
+        
+        # One token refills every 2 seconds
+        now[0] = 2.0
+        assert limiter.check_limit("alice") is True
+        assert limiter.check_limit("alice") is False
+    
+    def test_idle_keys_expire(self):
+        """Test that idle keys are reclaimed lazily"""
+        now = [0.0]
+        limiter = RateLimiter(max_requests=2, window_seconds=2, clock=lambda: now[0])
+        
+        for i in range(100):
+            limiter.check_limit(f"user-{i}")
+        assert len(limiter) == 100
+        
+        # Every bucket is full again; each call sweeps a bounded batch
+        now[0] = 10.0
+        for _ in range(100):
+            limiter.check_limit("active")
+            now[0] += 0.001
+        assert len(limiter) == 1
+    
+    @pytest.mark.slow
+    def test_check_limit_benchmark_100k_keys(self):
+        """Test that per-call cost does not grow with the number of keys"""
+        import time
+        
+        def per_call(key_count: int) -> float:
+            limiter = RateLimiter()
+            keys = [f"user-{i}" for i in range(key_count)]
+            for key in keys:
+                limiter.check_limit(key)
+            start = time.perf_counter()
+            for key in keys:
+                limiter.check_limit(key)
+            return (time.perf_counter() - start) / key_count
+        
+        small = per_call(1_000)
+        large = per_call(100_000)
+        print(f"check_limit: {small * 1e6:.2f}us/call @1k keys, {large * 1e6:.2f}us/call @100k keys")
+        
+        assert large < small * 5
 
 
 class TestSessionManagement:
@@ -136,6 +1189,82 @@ class TestSessionManagement:
         # Session should be expired
         valid = await security.validate_session(session.id)
         assert valid is False
+    
+    def test_expired_sessions_are_swept(self):
+        """Test that expired sessions are removed instead of kept forever"""
+        from app.core.sessions import SessionStore
+        
+        now = [0.0]
+        store = SessionStore(clock=lambda: now[0])
+        for i in range(100):
+            store.create(f"user{i}", expires_in_seconds=10)
+        
+        now[0] = 11.0
+        # Each call sweeps a small batch; the sweeper drains the rest
+        store.create("late", expires_in_seconds=10)
+        assert len(store) == 101 - SessionStore.SWEEP_BATCH
+        assert store.sweep() == 100 - SessionStore.SWEEP_BATCH
+        assert len(store) == 1
+    
+    def test_sliding_expiration(self):
+        """Test that sliding sessions stay alive while used"""
+        from app.core.sessions import SessionStore
+        
+        now = [0.0]
+        store = SessionStore(clock=lambda: now[0])
+        session = store.create("user", expires_in_seconds=10, sliding=True)
+        fixed = store.create("user", expires_in_seconds=10)
+        
+        for t in range(5, 50, 5):
+            now[0] = float(t)
+            assert store.validate(session.id) is True
+        
+        assert store.validate(fixed.id) is False
+        assert len(store._expiry) <= 2
+        now[0] = 100.0
+        assert store.validate(session.id) is False
+    
+    def test_sessions_shared_through_backend(self, tmp_path):
+        """Test that a second worker validates and sees revocation of shared sessions"""
+        from app.core.sessions import SessionStore, SQLiteSessionBackend
+        
+        now = [0.0]
+        db = str(tmp_path / "sessions.db")
+        worker_a = SessionStore(SQLiteSessionBackend(db), clock=lambda: now[0])
+        worker_b = SessionStore(SQLiteSessionBackend(db), clock=lambda: now[0], recheck_interval=1.0)
+        
+        session = worker_a.create("user", expires_in_seconds=60)
+        assert worker_b.validate(session.id) is True
+        
+        worker_a.revoke(session.id)
+        now[0] = 2.0
+        assert worker_b.validate(session.id) is False
+        
+        expired = worker_a.create("user", expires_in_seconds=1)
+        now[0] = 10.0
+        assert worker_b.sweep() >= 1
+        assert worker_b.validate(expired.id) is False
+    
+    @pytest.mark.asyncio
+    async def test_backend_sessions_off_event_loop(self, security, tmp_path):
+        """Test the async API over a shared backend and the sweeper lifecycle"""
+        from app.core.sessions import SessionBackend, SessionStore, SQLiteSessionBackend
+        
+        with pytest.raises(TypeError):
+            SessionBackend()
+        
+        security.sessions = SessionStore(SQLiteSessionBackend(str(tmp_path / "sessions.db")))
+        session = await security.create_session("user")
+        assert await security.validate_session(session.id) is True
+        await security.revoke_session(session.id)
+        assert await security.validate_session(session.id) is False
+        
+        security.start()
+        sweeper = security.sessions._sweeper
+        assert sweeper is not None and not sweeper.done()
+        security.stop()
+        await asyncio.sleep(0)
+        assert sweeper.cancelled()
 
 
 class TestErrorHandling:
@@ -11,6 +11,11 @@ from typing import Dict, List, Optional, Any
 from dataclasses import dataclass
 from enum import Enum
 
+try:
+    from app.core.path_policy import get_path_policy
+except ImportError:  # running outside the backend package
+    get_path_policy = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -44,13 +49,16 @@ class FileSystemSkill:
     - Audit logging
     """
     
-    def __init__(self, sandbox_dir: Optional[str] = None):
+    def __init__(self, sandbox_dir: Optional[str] = None, path_policy=None):
         """
         Initialize File System Skill
         
         Args:
             sandbox_dir: Directory to restrict operations to.
                         If None, uses a default secure directory.
+            path_policy: PathPolicy whose deny rules also apply inside
+                        the sandbox. Defaults to the backend's shared
+                        policy when it is importable.
         """
         if sandbox_dir:
             self.sandbox_dir = Path(sandbox_dir).resolve()
@@ -61,6 +69,10 @@ class FileSystemSkill:
         # Create sandbox directory if it doesn't exist
         self.sandbox_dir.mkdir(parents=True, exist_ok=True)
         
+        if path_policy is None and get_path_policy is not None:
+            path_policy = get_path_policy()
+        self.path_policy = path_policy
+        
         # Security limits
         self.max_file_size = 10 * 1024 * 1024  # 10 MB
         self.max_read_size = 1024 * 1024  # 1 MB
@@ -101,6 +113,14 @@ class FileSystemSkill:
                 self._log_audit("validate_path", path, False, "Path traversal attempt")
                 return None
             
+            if self.path_policy is not None:
+                decision = self.path_policy.check(str(resolved))
+                # The sandbox is this skill's allow rule; only explicit denies apply
+                if not decision.allowed and decision.rule is not None:
+                    logger.warning(f"Path blocked by policy: {path}")
+                    self._log_audit("validate_path", path, False, decision.reason)
+                    return None
+            
             return resolved
             
         except Exception as e: